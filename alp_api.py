@@ -1,11 +1,23 @@
 import os
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from instrumentation import get_logger
+
+logger = get_logger(__name__)
 
 load_dotenv()
 
 ALP_API_URL = os.getenv("ALP_API_URL")
 ALP_API_KEY = os.getenv("ALP_API_KEY")
+ALP_API_TIMEOUT = float(os.getenv("ALP_API_TIMEOUT", "10"))
+ALP_API_POOL_SIZE = int(os.getenv("ALP_API_POOL_SIZE", "8"))
+
+# Reused across calls so lookups and submissions share a pool of keep-alive connections
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=ALP_API_POOL_SIZE, pool_maxsize=ALP_API_POOL_SIZE)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
 
 def get_auth_headers():
     """Returns the authorization headers for ALP API requests."""
@@ -13,16 +25,20 @@ def get_auth_headers():
         raise ValueError("ALP_API_KEY is not set in the .env file.")
     return {"Authorization": f"Bearer {ALP_API_KEY}"}
 
+def _get(path):
+    """GETs a path from the ALP API and returns the decoded JSON body."""
+    response = _session.get(f"{ALP_API_URL.rstrip('/')}{path}", headers=get_auth_headers(), timeout=ALP_API_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
 def get_matters():
     """
     Fetches all matters from the ALP API.
-    (Placeholder implementation)
+    Falls back to mock data when ALP_API_URL is not configured.
     """
-    # In a real scenario, you would make a request like:
-    # response = requests.get(f"{ALP_API_URL}/matters", headers=get_auth_headers())
-    # response.raise_for_status()
-    # return response.json()
-    print("Fetching matters from ALP API...")
+    logger.debug("Fetching matters from ALP API...")
+    if ALP_API_URL:
+        return _get("/matters")
     # Returning mock data for now
     return [
         {"id": 1, "name": "Matter 001 - Corporate Restructuring"},
@@ -32,9 +48,11 @@ def get_matters():
 def get_matter_outcomes(matter_id: int):
     """
     Fetches all outcomes for a specific matter from the ALP API.
-    (Placeholder implementation)
+    Falls back to mock data when ALP_API_URL is not configured.
     """
-    print(f"Fetching outcomes for matter_id {matter_id}...")
+    logger.debug("Fetching outcomes for matter_id %s...", matter_id)
+    if ALP_API_URL:
+        return _get(f"/matters/{matter_id}/outcomes")
     return [
         {"id": 101, "name": "Phase 1: Discovery"},
         {"id": 102, "name": "Phase 2: Negotiation"},
@@ -43,21 +61,38 @@ def get_matter_outcomes(matter_id: int):
 def get_outcome_components(outcome_id: int):
     """
     Fetches all components for a specific outcome from the ALP API.
-    (Placeholder implementation)
+    Falls back to mock data when ALP_API_URL is not configured.
     """
-    print(f"Fetching components for outcome_id {outcome_id}...")
+    logger.debug("Fetching components for outcome_id %s...", outcome_id)
+    if ALP_API_URL:
+        return _get(f"/outcomes/{outcome_id}/components")
     return [
         {"id": 1001, "name": "Initial client meeting"},
         {"id": 1002, "name": "Drafting discovery documents"},
     ]
 
-def post_time_entry(entry_data: dict):
+def post_time_entry(entry_data: dict, idempotency_key: str = None):
     """
     Posts a new time entry to the ALP API.
-    (Placeholder implementation)
+    The Idempotency-Key header lets ALP de-duplicate retried submissions.
+    Falls back to a mock response when ALP_API_URL is not configured.
     """
-    print(f"Posting time entry to ALP API: {entry_data}")
-    # response = requests.post(f"{ALP_API_URL}/time_entries", json=entry_data, headers=get_auth_headers())
-    # response.raise_for_status()
-    # return response.json()
-    return {"status": "success", "message": "Time entry posted successfully (mock)"} 
\ No newline at end of file
+    if ALP_API_URL:
+        headers = get_auth_headers()
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        response = _session.post(
+            f"{ALP_API_URL.rstrip('/')}/time_entries",
+            json=entry_data,
+            headers=headers,
+            timeout=ALP_API_TIMEOUT,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    logger.debug("Posting time entry to ALP API: %s", entry_data)
+    return {
+        "status": "success",
+        "message": "Time entry posted successfully (mock)",
+        "id": f"mock-{idempotency_key[:12]}" if idempotency_key else None,
+    }
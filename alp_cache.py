@@ -0,0 +1,225 @@
+"""
+Caching layer in front of the ALP matter -> outcome -> component lookups.
+
+Entries are fresh for ALP_CACHE_TTL_SECONDS. For a further ALP_CACHE_STALE_SECONDS they
+are still served immediately while a background refresh fetches a new copy
+(stale-while-revalidate); after that a request waits for ALP again, falling back to the
+expired copy if ALP is unreachable. Concurrent misses for the same key share one upstream
+call. Entries can optionally be persisted to the SQLite database so a restart starts warm.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import alp_api
+import database
+from instrumentation import get_logger
+
+logger = get_logger(__name__)
+
+ALP_CACHE_TTL_SECONDS = float(os.getenv("ALP_CACHE_TTL_SECONDS", "300"))
+ALP_CACHE_STALE_SECONDS = float(os.getenv("ALP_CACHE_STALE_SECONDS", "3600"))
+ALP_CACHE_PERSIST = os.getenv("ALP_CACHE_PERSIST", "true").lower() in ("1", "true", "yes")
+ALP_CACHE_PREFETCH_WORKERS = int(os.getenv("ALP_CACHE_PREFETCH_WORKERS", "8"))
+
+class SqliteCacheStore:
+    """Persists cache entries in the alp_cache table."""
+
+    def load(self, key):
+        return database.load_alp_cache_entry(key)
+
+    def save(self, key, value, fetched_at):
+        database.save_alp_cache_entry(key, json.dumps(value), fetched_at)
+
+    def delete(self, keys=None):
+        database.delete_alp_cache_entries(keys)
+
+class TTLCache:
+    """In-memory TTL cache with stale-while-revalidate and an optional backing store."""
+
+    def __init__(self, ttl, stale_ttl, store=None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.store = store
+        self._entries = {}        # key -> (value, fetched_at)
+        self._key_locks = {}      # key -> lock serialising upstream loads for that key
+        self._refreshing = set()  # keys with a background refresh in flight
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refresh_errors": 0}
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and self.store is not None:
+            try:
+                stored = self.store.load(key)
+            except Exception as e:
+                logger.warning("ALP cache: could not read persisted entry %s: %s", key, e)
+                stored = None
+            if stored is not None:
+                entry = (json.loads(stored[0]), stored[1])
+                with self._lock:
+                    self._entries.setdefault(key, entry)
+        return entry
+
+    def get(self, key, loader):
+        """Returns the cached value for key, calling loader() when it is missing or expired."""
+        entry = self._lookup(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                self.stats["hits"] += 1
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self.stats["stale_hits"] += 1
+                self._refresh_in_background(key, loader)
+                return value
+        self.stats["misses"] += 1
+        try:
+            return self._load(key, loader, min_fetched_at=entry[1] if entry else None)
+        except Exception as e:
+            if entry is None:
+                raise
+            # ALP is unreachable: an out-of-date answer beats an error in a dropdown
+            self.stats["refresh_errors"] += 1
+            logger.warning("ALP cache: reload of %s failed, serving expired copy: %s", key, e)
+            return entry[0]
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _load(self, key, loader, min_fetched_at=None):
+        with self._key_lock(key):
+            # Another caller may have loaded the key while this one waited
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None and (min_fetched_at is None or entry[1] > min_fetched_at):
+                return entry[0]
+            value = loader()
+            self.set(key, value)
+            return value
+
+    def _refresh_in_background(self, key, loader):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                with self._key_lock(key):
+                    self.set(key, loader())
+            except Exception as e:
+                self.stats["refresh_errors"] += 1
+                logger.warning("ALP cache: background refresh of %s failed, serving stale copy: %s", key, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name=f"alp-cache-refresh:{key}", daemon=True).start()
+
+    def set(self, key, value, fetched_at=None):
+        fetched_at = fetched_at or time.time()
+        with self._lock:
+            self._entries[key] = (value, fetched_at)
+        if self.store is not None:
+            try:
+                self.store.save(key, value, fetched_at)
+            except Exception as e:
+                logger.warning("ALP cache: could not persist %s: %s", key, e)
+
+    def peek(self, key):
+        """Returns the cached value for key regardless of age, or None (never calls upstream)."""
+        entry = self._lookup(key)
+        return entry[0] if entry else None
+
+    def invalidate(self, keys=None):
+        """Drops the given keys (or everything when keys is None) from memory and the store."""
+        with self._lock:
+            if keys is None:
+                self._entries.clear()
+            else:
+                for key in keys:
+                    self._entries.pop(key, None)
+        if self.store is not None:
+            self.store.delete(None if keys is None else list(keys))
+
+_cache = TTLCache(
+    ALP_CACHE_TTL_SECONDS,
+    ALP_CACHE_STALE_SECONDS,
+    store=SqliteCacheStore() if ALP_CACHE_PERSIST else None,
+)
+
+def matters_key():
+    return "matters"
+
+def outcomes_key(matter_id):
+    return f"matters/{matter_id}/outcomes"
+
+def components_key(outcome_id):
+    return f"outcomes/{outcome_id}/components"
+
+def get_matters():
+    """Cached alp_api.get_matters()."""
+    return _cache.get(matters_key(), alp_api.get_matters)
+
+def get_matter_outcomes(matter_id: int):
+    """Cached alp_api.get_matter_outcomes()."""
+    return _cache.get(outcomes_key(matter_id), lambda: alp_api.get_matter_outcomes(matter_id))
+
+def get_outcome_components(outcome_id: int):
+    """Cached alp_api.get_outcome_components()."""
+    return _cache.get(components_key(outcome_id), lambda: alp_api.get_outcome_components(outcome_id))
+
+def invalidate_matter(matter_id: int):
+    """Drops a matter's outcomes and the components of every cached outcome under it."""
+    keys = [outcomes_key(matter_id)]
+    for outcome in _cache.peek(outcomes_key(matter_id)) or []:
+        keys.append(components_key(outcome["id"]))
+    _cache.invalidate(keys)
+    return keys
+
+def invalidate_outcome(outcome_id: int):
+    """Drops the cached components of one outcome."""
+    keys = [components_key(outcome_id)]
+    _cache.invalidate(keys)
+    return keys
+
+def invalidate(keys=None):
+    """Drops specific cache keys, or the whole cache when keys is None."""
+    _cache.invalidate(keys)
+
+def cache_stats():
+    """Hit/miss counters and the number of keys held in memory."""
+    return {**_cache.stats, "keys": len(_cache._entries)}
+
+def prefetch_tree():
+    """
+    Loads the whole matter -> outcome -> component tree into the cache, fanning the
+    per-matter and per-outcome calls out over a thread pool. Returns the number of keys loaded.
+    """
+    started = time.perf_counter()
+    matters = get_matters()
+    with ThreadPoolExecutor(max_workers=ALP_CACHE_PREFETCH_WORKERS, thread_name_prefix="alp-prefetch") as pool:
+        outcome_lists = list(pool.map(lambda matter: get_matter_outcomes(matter["id"]), matters))
+        outcome_ids = {outcome["id"] for outcomes in outcome_lists for outcome in outcomes}
+        list(pool.map(get_outcome_components, outcome_ids))
+    loaded = 1 + len(matters) + len(outcome_ids)
+    logger.info("ALP cache: prefetched %d lookups in %.2fs", loaded, time.perf_counter() - started)
+    return loaded
+
+def start_prefetch():
+    """Runs prefetch_tree() on a daemon thread so startup is not blocked by ALP."""
+    def run():
+        try:
+            prefetch_tree()
+        except Exception as e:
+            logger.warning("ALP cache: prefetch failed: %s", e)
+
+    thread = threading.Thread(target=run, name="alp-prefetch", daemon=True)
+    thread.start()
+    return thread
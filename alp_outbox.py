@@ -0,0 +1,214 @@
+"""
+Outbox-style submission of confirmed time entries to ALP.
+
+Entries are written to the alp_outbox table first (enqueue), and a background worker
+posts them in batches over alp_api's pooled session. Every entry carries an idempotency
+key derived from its source_hash, so a retry after a timeout or crash can never create
+a duplicate entry in ALP. Failures are retried with exponential backoff; successful
+posts stamp submitted_to_alp_at / alp_entry_id on the processed entry.
+
+Without ALP_API_URL (alp_api's mock mode) nothing is posted: entries queue up as pending
+and the worker does not run, so they are submitted once ALP is configured.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import alp_api
+import database
+import tenants
+from instrumentation import counter, get_logger, stage
+from storage import get_storage, require_sqlite
+
+logger = get_logger(__name__)
+
+ALP_OUTBOX_BATCH_SIZE = int(os.getenv("ALP_OUTBOX_BATCH_SIZE", "50"))
+ALP_OUTBOX_CONCURRENCY = int(os.getenv("ALP_OUTBOX_CONCURRENCY", str(alp_api.ALP_API_POOL_SIZE)))
+ALP_OUTBOX_MAX_ATTEMPTS = int(os.getenv("ALP_OUTBOX_MAX_ATTEMPTS", "8"))
+ALP_OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv("ALP_OUTBOX_BACKOFF_BASE_SECONDS", "5"))
+ALP_OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("ALP_OUTBOX_BACKOFF_MAX_SECONDS", "900"))
+ALP_OUTBOX_INTERVAL_SECONDS = float(os.getenv("ALP_OUTBOX_INTERVAL_SECONDS", "30"))
+
+ALP_SUBMISSIONS = counter("rescuetime_alp_submissions_total", "ALP outbox post attempts by result.", ("result",))
+
+# Fields used to route an entry through the outbox that are not part of the ALP payload
+_OUTBOX_FIELDS = ("processed_entry_id", "source_hash")
+
+def make_idempotency_key(source_hash, entry_date):
+    """Stable key for one processed entry (processed entries are unique per source_hash and date)."""
+    return hashlib.sha256(f"{source_hash}|{entry_date}".encode("utf-8")).hexdigest()[:32]
+
+def _prepare(entry):
+    """Splits an AlpTimeEntryCreate dict into an outbox row."""
+    payload = {key: value for key, value in entry.items() if key not in _OUTBOX_FIELDS}
+    payload_json = json.dumps(payload, default=str, sort_keys=True)
+
+    processed_entry_id = entry.get("processed_entry_id")
+    source_hash = entry.get("source_hash")
+    entry_date = entry.get("date")
+    if processed_entry_id and not source_hash:
+        source = database.get_processed_entry_source(processed_entry_id)
+        if source:
+            source_hash, entry_date = source
+
+    if source_hash:
+        key = make_idempotency_key(source_hash, entry_date)
+    else:
+        # No source entry to anchor on: identical payloads are treated as the same submission
+        key = hashlib.sha256(payload_json.encode("utf-8")).hexdigest()[:32]
+
+    return {"idempotency_key": key, "processed_entry_id": processed_entry_id, "payload": payload_json}
+
+def enqueue(entries):
+    """
+    Adds ALP time entries (dicts shaped like schemas.AlpTimeEntryCreate) to the outbox
+    in one transaction and wakes the worker. Returns the outbox rows.
+    """
+    require_sqlite("The ALP outbox")
+    rows = database.enqueue_alp_submissions([_prepare(entry) for entry in entries])
+    wake_worker()
+    return rows
+
+def backoff_seconds(attempts):
+    """Exponential backoff with full jitter, capped at ALP_OUTBOX_BACKOFF_MAX_SECONDS."""
+    ceiling = min(ALP_OUTBOX_BACKOFF_MAX_SECONDS, ALP_OUTBOX_BACKOFF_BASE_SECONDS * (2 ** (attempts - 1)))
+    return random.uniform(ceiling / 2, ceiling)
+
+def _is_retryable(error):
+    """
+    Timeouts, connection errors, 408/429 and 5xx are retried. Anything else (other client
+    errors, a missing ALP_API_KEY, an unreadable response) will fail again, so it is not.
+    """
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status in (408, 429) or status >= 500
+    return False
+
+def _post(row):
+    try:
+        response = alp_api.post_time_entry(json.loads(row["payload"]), idempotency_key=row["idempotency_key"])
+        alp_entry_id = response.get("id") if isinstance(response, dict) else None
+        return row, alp_entry_id, None
+    except Exception as e:
+        return row, None, e
+
+def flush(batch_size=None, max_batches=None):
+    """
+    Posts every due outbox entry to ALP, batch by batch, and records the results.
+    Returns counts of sent, retried and dead entries.
+    """
+    require_sqlite("The ALP outbox")
+    batch_size = batch_size or ALP_OUTBOX_BATCH_SIZE
+    stats = {"sent": 0, "retrying": 0, "dead": 0}
+    if not alp_api.ALP_API_URL:
+        logger.info("ALP outbox: ALP_API_URL is not set; queued entries stay pending.")
+        return stats
+    batches = 0
+    with ThreadPoolExecutor(max_workers=ALP_OUTBOX_CONCURRENCY, thread_name_prefix="alp-submit") as pool:
+        while max_batches is None or batches < max_batches:
+            rows = database.claim_alp_outbox_batch(batch_size, time.time(), ALP_OUTBOX_MAX_ATTEMPTS)
+            if not rows:
+                break
+            batches += 1
+
+            sent, failed = [], []
+            with stage("alp_submit", items=len(rows)):
+                results = list(pool.map(_post, rows))
+            for row, alp_entry_id, error in results:
+                if error is None:
+                    sent.append((row["id"], alp_entry_id))
+                    continue
+                attempts = row["attempts"] + 1
+                if _is_retryable(error) and attempts < ALP_OUTBOX_MAX_ATTEMPTS:
+                    failed.append((row["id"], "pending", attempts, time.time() + backoff_seconds(attempts), str(error)))
+                    stats["retrying"] += 1
+                else:
+                    failed.append((row["id"], "dead", attempts, 0, str(error)))
+                    stats["dead"] += 1
+            database.record_alp_outbox_results(sent, failed)
+            stats["sent"] += len(sent)
+
+    for result, total in stats.items():
+        if total:
+            ALP_SUBMISSIONS.inc(total, result=result)
+    if batches:
+        logger.info("ALP outbox: sent %d, retrying %d, dead %d in %d batch(es).",
+                    stats["sent"], stats["retrying"], stats["dead"], batches, extra=stats)
+    return stats
+
+class OutboxWorker(threading.Thread):
+    """Flushes the outbox every ALP_OUTBOX_INTERVAL_SECONDS, or immediately when woken."""
+
+    def __init__(self, interval=ALP_OUTBOX_INTERVAL_SECONDS):
+        super().__init__(name="alp-outbox-worker", daemon=True)
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._wake.set()
+        self.join(timeout)
+
+    def run(self):
+        # Anything still in flight was interrupted mid-post; idempotency keys make a re-post safe
+        for _ in _each_database():
+            released = database.release_in_flight_alp_outbox()
+            if released:
+                logger.info("ALP outbox: released %d interrupted submission(s).", released)
+            requeued = database.requeue_mock_alp_submissions()
+            if requeued:
+                logger.info("ALP outbox: requeued %d submission(s) only sent to the mock ALP.", requeued)
+        while not self._stopping.is_set():
+            for user_id in _each_database():
+                try:
+                    flush()
+                except Exception as e:
+                    logger.exception("ALP outbox: flush failed%s: %s", f" for user {user_id}" if user_id else "", e)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+def _each_database():
+    """Yields None in the main database, then each registered user's id inside their tenant context."""
+    yield None
+    for user_id in tenants.tenant_ids():
+        with tenants.tenant_context(user_id):
+            yield user_id
+
+_worker = None
+
+def start_worker(interval=ALP_OUTBOX_INTERVAL_SECONDS):
+    """Starts the background submission worker (once per process); not without ALP_API_URL."""
+    global _worker
+    if not alp_api.ALP_API_URL:
+        logger.info("ALP outbox: ALP_API_URL is not set; the submission worker is not started.")
+        return None
+    if get_storage().name != "sqlite":
+        logger.info("ALP outbox: the outbox needs the SQLite backend; the submission worker is not started.")
+        return None
+    if _worker is None or not _worker.is_alive():
+        _worker = OutboxWorker(interval)
+        _worker.start()
+    return _worker
+
+def stop_worker():
+    global _worker
+    if _worker is not None:
+        _worker.stop()
+        _worker = None
+
+def wake_worker():
+    """Asks the worker to flush now; a no-op when no worker is running (e.g. CLI use)."""
+    if _worker is not None:
+        _worker.wake()
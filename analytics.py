@@ -0,0 +1,161 @@
+"""
+Time by RescueTime category, productivity level or matter, over any date range.
+
+Everything is read from the daily rollups in database.py (activity_rollup_daily and
+matter_rollup_daily) rather than from activity_log, so a query reads at most one row per
+day and group however many raw rows those days hold.
+
+trend() buckets the daily rows into days, weeks (starting Monday), months or years for
+charts over long ranges. With NumPy installed (optional) the bucketing is vectorized;
+without it a plain loop gives the same result.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+
+import database
+from storage import require_sqlite
+
+try:
+    import numpy as np
+except ImportError:  # optional; trend() falls back to pure Python
+    np = None
+
+GROUP_BY = ("category", "productivity", "matter")
+BUCKETS = ("day", "week", "month", "year")
+
+# RescueTime's productivity scale
+PRODUCTIVITY_LABELS = {
+    2: "Very productive",
+    1: "Productive",
+    0: "Neutral",
+    -1: "Distracting",
+    -2: "Very distracting",
+}
+
+def _validate(start_date, end_date, group_by, bucket="day"):
+    if group_by not in GROUP_BY:
+        raise ValueError(f"group_by must be one of: {', '.join(GROUP_BY)}")
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of: {', '.join(BUCKETS)}")
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date or start_date)
+    if end < start:
+        raise ValueError("end_date is before start_date")
+    return start, end
+
+def _label(group_by, key):
+    if group_by == "productivity":
+        return PRODUCTIVITY_LABELS.get(key, str(key))
+    if key == "":
+        return "Uncategorized" if group_by == "category" else "No matter"
+    return key
+
+def summary(start_date, end_date=None, group_by="productivity", min_productivity=None):
+    """Total seconds per group over the range, largest first, with each group's share of the total."""
+    require_sqlite("Analytics")
+    start, end = _validate(start_date, end_date, group_by)
+    rows = database.get_rollup_totals(start.isoformat(), end.isoformat(), group_by, min_productivity)
+    total = sum(seconds for _, seconds in rows)
+    return {
+        "start_date": start,
+        "end_date": end,
+        "group_by": group_by,
+        "total_seconds": total,
+        "groups": [
+            {"key": str(key), "label": _label(group_by, key), "total_seconds": seconds,
+             "share": round(seconds / total, 4) if total else 0.0}
+            for key, seconds in rows
+        ],
+    }
+
+def _bucket_start(day, bucket):
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    if bucket == "year":
+        return day.replace(month=1, day=1)
+    return day
+
+def _next_bucket(start, bucket):
+    if bucket == "day":
+        return start + timedelta(days=1)
+    if bucket == "week":
+        return start + timedelta(days=7)
+    if bucket == "month":
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return date(start.year + 1, 1, 1)
+
+def _trend_python(rows, start, end, bucket):
+    periods = []
+    period = _bucket_start(start, bucket)
+    while period <= end:
+        periods.append(period)
+        period = _next_bucket(period, bucket)
+    index = {period: i for i, period in enumerate(periods)}
+
+    series = defaultdict(lambda: [0] * len(periods))
+    for log_date, key, seconds in rows:
+        series[key][index[_bucket_start(date.fromisoformat(log_date), bucket)]] += seconds
+    return periods, dict(series)
+
+def _to_buckets(days, bucket):
+    # days: datetime64[D]; the epoch (1970-01-01) was a Thursday, so Mondays are at 3 mod 7 days before
+    if bucket == "week":
+        return days - (days.astype("int64") + 3) % 7
+    if bucket == "month":
+        return days.astype("datetime64[M]")
+    if bucket == "year":
+        return days.astype("datetime64[Y]")
+    return days
+
+def _trend_numpy(rows, start, end, bucket):
+    unit = {"day": "D", "week": "D", "month": "M", "year": "Y"}[bucket]
+    step = 7 if bucket == "week" else 1
+    first = _to_buckets(np.array([start], dtype="datetime64[D]"), bucket)[0]
+    last = _to_buckets(np.array([end], dtype="datetime64[D]"), bucket)[0]
+    periods = np.arange(first, last + np.timedelta64(step, unit), np.timedelta64(step, unit))
+    if not rows:
+        return [period.astype("datetime64[D]").item() for period in periods], {}
+
+    log_dates, keys, seconds = zip(*rows)
+    days = np.array(log_dates, dtype="datetime64[D]")
+    period_index = (_to_buckets(days, bucket) - first).astype("int64") // step
+    key_values, key_index = np.unique(np.array(keys, dtype=object), return_inverse=True)
+
+    # One cell per (key, period); bincount sums the seconds landing in each
+    cells = np.bincount(
+        key_index * len(periods) + period_index,
+        weights=np.array(seconds, dtype="float64"),
+        minlength=len(key_values) * len(periods),
+    ).astype("int64").reshape(len(key_values), len(periods))
+    return (
+        [period.astype("datetime64[D]").item() for period in periods],
+        {key: cells[i].tolist() for i, key in enumerate(key_values)},
+    )
+
+def trend(start_date, end_date=None, group_by="productivity", bucket="week", min_productivity=None, use_numpy=None):
+    """
+    Seconds per group and period over the range: periods are the first days of the buckets
+    covering start_date..end_date, and each group's series has one total per period (zero
+    where it had no time). use_numpy=False forces the pure-Python path.
+    """
+    require_sqlite("Analytics")
+    start, end = _validate(start_date, end_date, group_by, bucket)
+    rows = database.get_rollup_daily(start.isoformat(), end.isoformat(), group_by, min_productivity)
+    if use_numpy is None:
+        use_numpy = np is not None
+    periods, series = (_trend_numpy if use_numpy else _trend_python)(rows, start, end, bucket)
+
+    ordered = sorted(series.items(), key=lambda item: (-sum(item[1]), str(item[0])))
+    return {
+        "start_date": start,
+        "end_date": end,
+        "group_by": group_by,
+        "bucket": bucket,
+        "periods": periods,
+        "total_seconds": sum(sum(values) for _, values in ordered),
+        "series": [
+            {"key": str(key), "label": _label(group_by, key), "total_seconds": sum(values), "seconds": values}
+            for key, values in ordered
+        ],
+    }
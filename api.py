@@ -1,18 +1,59 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
+from fastapi import Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Optional
+from pydantic import TypeAdapter
 import database
 import schemas
-import alp_api
+from storage import get_storage, require_sqlite
+import analytics
+import alp_cache
+import alp_outbox
 import jobs
+import processor
+import reporter
+import instrumentation
+import profiling
+import read_cache
+import replication
+import similarity
+import tenants
+import writer
 import os
+import time
+from contextlib import asynccontextmanager
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup/shutdown hooks for background services."""
+    instrumentation.configure_logging()
+    # Local-first mode: live database on local disk, replicated to DB_FILE in the background
+    replication.start_worker()
+    # One thread owns the SQLite write connections and group-commits every write
+    if os.getenv("WRITER_ENABLED", "true").lower() in ("1", "true", "yes"):
+        writer.start()
+    # Warm the ALP lookup cache without delaying startup
+    if os.getenv("ALP_CACHE_PREFETCH", "true").lower() in ("1", "true", "yes"):
+        alp_cache.start_prefetch()
+    # Post queued time entries to ALP in the background
+    if os.getenv("ALP_OUTBOX_WORKER", "true").lower() in ("1", "true", "yes"):
+        alp_outbox.start_worker()
+    yield
+    alp_outbox.stop_worker()
+    writer.stop()
+    replication.stop_worker()
+
+ALP_CACHE_GAUGE = instrumentation.gauge("rescuetime_alp_cache", "ALP lookup cache counters and size.", ("stat",))
+ALP_OUTBOX_GAUGE = instrumentation.gauge("rescuetime_alp_outbox_entries", "ALP outbox entries by status.", ("status",))
+READ_CACHE_GAUGE = instrumentation.gauge("rescuetime_read_cache", "Entry-list read cache counters, hit ratio and size.", ("stat",))
 
 app = FastAPI(
     title="RescueTime to ALP Integration API",
     description="An API to bridge the RescueTime assistant with the ALP practice management software.",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS to allow the Vue.js frontend to communicate with this API
@@ -24,6 +65,57 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Records per-route latency in the request histogram exposed at /api/metrics."""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template (/api/matters/{matter_code}), not the raw path, to bound cardinality
+        route = request.scope.get("route")
+        instrumentation.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status,
+        )
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """
+    Profiles a request when PROFILE_API_ENABLED is set and the caller asks for it with
+    ?profile=1 or an `X-Profile: 1` header. The summary file path is returned in the
+    X-Profile-Output response header. Sync endpoints run on worker threads that cProfile
+    cannot follow, so requests are always profiled with the sampling profiler.
+    """
+    requested = request.query_params.get("profile") or request.headers.get("x-profile")
+    if not (profiling.PROFILE_API_ENABLED and requested and requested.lower() not in ("0", "false", "no")):
+        return await call_next(request)
+
+    with profiling.profile(f"api-{request.method}-{request.url.path}", mode="sample") as result:
+        response = await call_next(request)
+    if result and result.summary_path:
+        response.headers["X-Profile-Output"] = result.summary_path
+    return response
+
+@app.middleware("http")
+async def route_tenant(request: Request, call_next):
+    """
+    Runs the request as the user named in the X-User-Id header (their database shard and
+    RescueTime key). Requests without the header use the main database, as in a single-user install.
+    """
+    user_id = request.headers.get("x-user-id")
+    if not user_id:
+        return await call_next(request)
+    if database.get_tenant(user_id) is None:
+        return JSONResponse({"detail": f"Unknown user '{user_id}'"}, status_code=404)
+    with tenants.tenant_context(user_id):
+        return await call_next(request)
+
 # --- Static Frontend Mount (built Vue app) ---
 # Expect the production build to exist at frontend/dist (run via run.sh)
 try:
@@ -50,21 +142,43 @@ def get_settings():
     """Return minimal runtime settings for the UI."""
     return {
         "backend_port": int(os.getenv("BACKEND_PORT", 8000)),
-        "database_path": os.getenv("DATABASE_PATH", "rescuetime.db"),
-        "has_api_key": bool(os.getenv("RESCUETIME_API_KEY")),
+        "database_path": database.current_db_file(),
+        "replica_path": replication.replica_path(),
+        "has_api_key": bool((tenants.current_tenant() or {}).get("rescuetime_api_key") or os.getenv("RESCUETIME_API_KEY")),
+        "user_id": (tenants.current_tenant() or {}).get("user_id"),
+        "rules_version": processor.RULES_VERSION,
     }
 
+TIME_ENTRY_LIST = TypeAdapter(List[schemas.TimeEntry])
+PROCESSED_TIME_ENTRY_LIST = TypeAdapter(List[schemas.ProcessedTimeEntry])
+
+def cached_entry_list(endpoint, date, load, adapter):
+    """
+    Serves an entry list from the read cache (see read_cache.py): the JSON body is built
+    with adapter on a miss and reused until a write touches that date, in this process or
+    any other. Without the cache (disabled, or a non-SQLite backend whose writes it cannot
+    see) returns load() as is.
+    """
+    if not (read_cache.READ_CACHE_ENABLED and get_storage().name == "sqlite"):
+        return load()
+    body = read_cache.get(
+        database.current_db_file(), endpoint, date,
+        lambda: adapter.dump_json(adapter.validate_python(load())),
+        database.get_entry_write_count(),
+    )
+    return Response(content=body, media_type="application/json")
+
 @app.get("/api/time_entries", response_model=List[schemas.TimeEntry])
 def get_time_entries(date: Optional[str] = None):
     """
     Retrieve time entries from the local database with a 'pending' status, optionally filtered by date.
     """
-    try:
+    def load():
         if date:
-            entries = database.get_time_entries_by_date(date)
-        else:
-            entries = database.get_pending_time_entries()
-        return entries
+            return get_storage().get_time_entries_by_date(date)
+        return get_storage().get_pending_time_entries()
+    try:
+        return cached_entry_list("time_entries", date, load, TIME_ENTRY_LIST)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -80,9 +194,9 @@ def get_time_entries_raw(date: Optional[str] = None):
         db_exists = os.path.exists(db_file)
         
         if date:
-            entries = database.get_time_entries_by_date(date)
+            entries = get_storage().get_time_entries_by_date(date)
         else:
-            entries = database.get_pending_time_entries()
+            entries = get_storage().get_pending_time_entries()
             
         return {
             "debug": {
@@ -107,8 +221,50 @@ def get_processed_time_entries(date: Optional[str] = None):
     Retrieve processed time entries, optionally filtered by date.
     """
     try:
-        entries = database.get_processed_time_entries(date)
-        return entries
+        return cached_entry_list(
+            "processed_time_entries", date, lambda: get_storage().get_processed_time_entries(date), PROCESSED_TIME_ENTRY_LIST,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Bulk routes are registered before the /{entry_id} routes so "bulk" is not read as an id
+@app.post("/api/processed_time_entries/bulk", response_model=List[schemas.ProcessedTimeEntry])
+def confirm_time_entries(request: schemas.BulkConfirmRequest):
+    """
+    Confirm many time entries at once: creates their processed entries and marks the
+    originals as submitted in a single transaction. Nothing is written if any entry is unknown.
+    """
+    try:
+        return get_storage().confirm_time_entries([entry.dict() for entry in request.entries])
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.put("/api/time_entries/bulk/ignore", response_model=schemas.BulkUpdateResult)
+def ignore_time_entries(request: schemas.BulkEntryIds):
+    """
+    Mark many time entries as 'ignored' in a single transaction.
+    """
+    try:
+        updated = get_storage().set_time_entries_status(request.entry_ids, "ignored")
+        return {"status": "success", "updated": updated, "entry_ids": request.entry_ids}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.put("/api/processed_time_entries/bulk/revert", response_model=schemas.BulkUpdateResult)
+def revert_processed_time_entries(request: schemas.BulkEntryIds):
+    """
+    Revert many processed time entries back to pending in a single transaction.
+    Returns the ids of the original entries that are pending again.
+    """
+    try:
+        original_ids = get_storage().revert_processed_time_entries(request.entry_ids)
+        return {"status": "success", "updated": len(request.entry_ids), "entry_ids": original_ids}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -118,11 +274,9 @@ def create_processed_time_entry(entry: schemas.ProcessedTimeEntryCreate):
     Create a new processed time entry and mark the original as submitted.
     """
     try:
-        created_entry = database.create_processed_time_entry(entry.dict())
-        # Also update the original time entry status to 'submitted'
-        if entry.original_entry_id:
-            database.update_time_entry_status(entry.original_entry_id, "submitted")
-        return created_entry
+        return get_storage().confirm_time_entries([entry.dict()])[0]
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -132,11 +286,24 @@ def ignore_time_entry(entry_id: int):
     Update a time entry's status to 'ignored' in the local database.
     """
     try:
-        database.update_time_entry_status(entry_id, "ignored")
+        get_storage().update_time_entry_status(entry_id, "ignored")
         return {"status": "success", "message": f"Time entry {entry_id} has been ignored."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/time_entries/{entry_id}/sources", response_model=schemas.EntrySources)
+def get_time_entry_sources(entry_id: int):
+    """
+    Audit a time entry: the raw activity rows (document titles and seconds) it was aggregated from.
+    """
+    try:
+        entry = get_storage().get_entry_sources(entry_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not entry:
+        raise HTTPException(status_code=404, detail=f"Time entry {entry_id} not found")
+    return entry
+
 @app.put("/api/processed_time_entries/{entry_id}/revert", response_model=dict)
 def revert_processed_time_entry(entry_id: int):
     """
@@ -144,53 +311,311 @@ def revert_processed_time_entry(entry_id: int):
     This removes the processed entry and sets the original entry status back to 'pending'.
     """
     try:
-        # Get the processed entry to find the original entry ID
-        processed_entry = database.get_processed_entry_by_id(entry_id)
-        if not processed_entry:
-            raise HTTPException(status_code=404, detail="Processed time entry not found")
-        
-        original_entry_id = processed_entry.get('original_entry_id')
-        if not original_entry_id:
-            raise HTTPException(status_code=400, detail="Original entry ID not found in processed entry")
-        
-        # Delete the processed entry
-        database.delete_processed_time_entry(entry_id)
-        
-        # Revert the original entry status back to pending
-        database.update_time_entry_status(original_entry_id, "pending")
-        
+        get_storage().revert_processed_time_entries([entry_id])
         return {"status": "success", "message": f"Processed entry {entry_id} has been reverted to pending."}
-    except HTTPException:
-        raise
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Processed time entry not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Pipeline stage timings, request latencies, ALP cache/outbox and read cache state in
+    the Prometheus text exposition format.
+    """
+    for name, value in alp_cache.cache_stats().items():
+        ALP_CACHE_GAUGE.set(value, stat=name)
+    if get_storage().name == "sqlite":
+        for status, total in database.get_alp_outbox_summary(recent_limit=0)["counts"].items():
+            ALP_OUTBOX_GAUGE.set(total, status=status)
+    for name, value in read_cache.cache_stats().items():
+        READ_CACHE_GAUGE.set(value, stat=name)
+    return PlainTextResponse(instrumentation.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/search", response_model=schemas.SearchResults)
+def search(
+    q: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    scope: str = "all",
+    limit: int = Query(default=50, ge=1, le=500),
+):
+    """
+    Ranked full-text search over time entry descriptions/notes and raw document titles,
+    optionally bounded by date. scope is one of all, entries or documents.
+    """
+    if scope not in ("all", "entries", "documents"):
+        raise HTTPException(status_code=400, detail="scope must be one of: all, entries, documents")
+    try:
+        require_sqlite("Full-text search")
+        entries = database.search_time_entries(q, start_date, end_date, limit) if scope != "documents" else []
+        documents = database.search_documents(q, start_date, end_date, limit) if scope != "entries" else []
+        return {"query": q, "time_entries": entries, "documents": documents}
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/reports/export")
+def export_report(
+    start_date: str,
+    end_date: Optional[str] = None,
+    group_by: Optional[str] = None,
+    format: str = "csv",
+):
+    """
+    Streams a time entry report for an inclusive date range as a file download.
+    group_by is a comma-separated list of matter_code, application and status;
+    format is one of csv, jsonl or xlsx. Rows are written as they are read from the database.
+    """
+    try:
+        chunks = reporter.stream_report(start_date, end_date, group_by, format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    filename = reporter.report_filename(start_date, end_date, group_by, format)
+    return StreamingResponse(
+        chunks,
+        media_type=reporter.REPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.get("/api/matters", response_model=List[schemas.MatterIndexEntry])
+def get_matters():
+    """
+    List every matter code found in local time entries with its date range and total time.
+    """
+    try:
+        return get_storage().get_matter_index()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/matters/{matter_code}", response_model=schemas.MatterSummary)
+def get_matter(matter_code: str, start_date: Optional[str] = None, end_date: Optional[str] = None):
+    """
+    Billing view for one matter: its rollup plus the contributing time entries,
+    optionally limited to a date range.
+    """
+    try:
+        summary = get_storage().get_matter_summary(matter_code, start_date, end_date)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not summary:
+        raise HTTPException(status_code=404, detail=f"No time entries found for matter {matter_code}")
+    return summary
+
+@app.get("/api/analytics/summary", response_model=schemas.AnalyticsSummary)
+def get_analytics_summary(
+    start_date: str,
+    end_date: Optional[str] = None,
+    group_by: str = Query("productivity", description="One of: category, productivity, matter"),
+    min_productivity: Optional[int] = Query(None, ge=-2, le=2, description="Only count time at least this productive"),
+):
+    """
+    Time per RescueTime category, productivity level or matter over a date range,
+    from the daily rollups.
+    """
+    try:
+        return analytics.summary(start_date, end_date, group_by, min_productivity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/analytics/trend", response_model=schemas.AnalyticsTrend)
+def get_analytics_trend(
+    start_date: str,
+    end_date: Optional[str] = None,
+    group_by: str = Query("productivity", description="One of: category, productivity, matter"),
+    bucket: str = Query("week", description="One of: day, week, month, year"),
+    min_productivity: Optional[int] = Query(None, ge=-2, le=2, description="Only count time at least this productive"),
+):
+    """
+    Time per category, productivity level or matter for each day, week, month or year of
+    a date range (e.g. productive time per matter per week: group_by=matter&min_productivity=1).
+    """
+    try:
+        return analytics.trend(start_date, end_date, group_by, bucket, min_productivity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/similar-tasks", response_model=schemas.SimilarTaskClusters)
+def get_similar_tasks(
+    start_date: str,
+    end_date: Optional[str] = None,
+    min_similarity: float = Query(similarity.DEFAULT_MIN_SIMILARITY, gt=0, le=1, description="Estimated Jaccard similarity of the titles' trigrams"),
+    limit: int = Query(default=100, ge=1, le=1000),
+):
+    """
+    Clusters of near-duplicate task descriptions among the time entries of a date range
+    (the same work split across entries by small title differences), as merge candidates.
+    """
+    try:
+        return similarity.clusters(start_date, end_date, min_similarity, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/tenants", response_model=List[schemas.Tenant])
+def get_tenants():
+    """
+    List the users of a multi-tenant deployment.
+    """
+    return [
+        {"user_id": t["user_id"], "display_name": t["display_name"], "has_api_key": bool(t["rescuetime_api_key"])}
+        for t in database.list_tenants()
+    ]
+
+@app.get("/api/tenants/rollup", response_model=List[schemas.TenantRollupRow])
+def get_tenant_rollup(
+    start_date: str,
+    end_date: Optional[str] = None,
+    group_by: Optional[str] = Query(None, description="Comma-separated: matter_code, application, status"),
+):
+    """
+    Time entry totals per user across every user's database for a date range,
+    optionally split by matter, application or status.
+    """
+    try:
+        return tenants.rollup(start_date, end_date, group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/alp/matters")
 def get_alp_matters():
-    # TODO: Proxy request to ALP API to fetch matters
-    return alp_api.get_matters()
+    """
+    List ALP matters (cached), each annotated with its local time from the matter index.
+    """
+    try:
+        matters = alp_cache.get_matters()
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"ALP API error: {e}")
+
+    # Cross-reference with local time via the matter index (one lookup for all matters)
+    codes = {
+        matter.get("id"): matter.get("matter_code") or processor.extract_matter_code(matter.get("name"))
+        for matter in matters
+    }
+    index = {row["matter_code"]: row for row in get_storage().get_matter_index(codes.values())}
+    return [{**matter, "local_time": index.get(codes[matter.get("id")])} for matter in matters]
 
 @app.get("/api/alp/matters/{matter_id}/outcomes")
 def get_alp_matter_outcomes(matter_id: int):
-    # TODO: Proxy request to ALP API
-    return alp_api.get_matter_outcomes(matter_id)
+    """
+    List the outcomes of an ALP matter (cached).
+    """
+    try:
+        return alp_cache.get_matter_outcomes(matter_id)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"ALP API error: {e}")
 
 @app.get("/api/alp/outcomes/{outcome_id}/components")
 def get_alp_outcome_components(outcome_id: int):
-    # TODO: Proxy request to ALP API
-    return alp_api.get_outcome_components(outcome_id)
+    """
+    List the components of an ALP outcome (cached).
+    """
+    try:
+        return alp_cache.get_outcome_components(outcome_id)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"ALP API error: {e}")
+
+@app.get("/api/alp/cache", response_model=dict)
+def get_alp_cache_stats():
+    """
+    Hit/miss counters for the ALP lookup cache.
+    """
+    return alp_cache.cache_stats()
 
-@app.post("/api/time_entries", response_model=dict)
+@app.delete("/api/alp/cache", response_model=dict)
+def invalidate_alp_cache(matter_id: Optional[int] = None, outcome_id: Optional[int] = None, key: Optional[str] = None):
+    """
+    Invalidate cached ALP lookups: one matter's subtree, one outcome's components,
+    a single cache key, or (with no parameters) everything.
+    """
+    if matter_id is not None:
+        keys = alp_cache.invalidate_matter(matter_id)
+    elif outcome_id is not None:
+        keys = alp_cache.invalidate_outcome(outcome_id)
+    elif key is not None:
+        keys = [key]
+        alp_cache.invalidate(keys)
+    else:
+        keys = None
+        alp_cache.invalidate()
+    return {"status": "success", "invalidated": keys if keys is not None else "all"}
+
+@app.post("/api/alp/cache/prefetch", status_code=202)
+def prefetch_alp_cache(background_tasks: BackgroundTasks):
+    """
+    Reload the whole matter -> outcome -> component tree in the background.
+    """
+    background_tasks.add_task(alp_cache.prefetch_tree)
+    return {"message": "Accepted: ALP cache prefetch started in the background."}
+
+@app.post("/api/time_entries", response_model=schemas.AlpOutboxEntry, status_code=202)
 def create_alp_time_entry(entry: schemas.AlpTimeEntryCreate):
     """
-    Receives a validated time entry object and posts it to the main ALP API.
+    Receives a validated time entry object and queues it for submission to the main ALP API.
+    The background worker posts it; poll /api/alp/outbox for progress.
     """
     try:
-        response = alp_api.post_time_entry(entry.dict())
-        return response
+        return alp_outbox.enqueue([entry.dict()])[0]
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/alp/outbox", response_model=List[schemas.AlpOutboxEntry], status_code=202)
+def enqueue_alp_time_entries(entries: List[schemas.AlpTimeEntryCreate]):
+    """
+    Queues many time entries for ALP in one transaction (e.g. end-of-day submission).
+    """
+    try:
+        return alp_outbox.enqueue([entry.dict() for entry in entries])
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/alp/outbox", response_model=dict)
+def get_alp_outbox():
+    """
+    Outbox counts by status plus the most recent submission errors.
+    """
+    try:
+        require_sqlite("The ALP outbox")
+        return database.get_alp_outbox_summary()
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/alp/outbox/flush", status_code=202)
+def flush_alp_outbox(background_tasks: BackgroundTasks):
+    """
+    Posts all due outbox entries now instead of waiting for the worker's next cycle.
+    """
+    try:
+        require_sqlite("The ALP outbox")
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    background_tasks.add_task(alp_outbox.flush)
+    return {"message": "Accepted: ALP outbox flush started in the background."}
+
 @app.post("/api/jobs/fetch", status_code=202)
 def trigger_fetch_job(request: schemas.FetchJobRequest, background_tasks: BackgroundTasks):
     """
@@ -198,7 +623,12 @@ def trigger_fetch_job(request: schemas.FetchJobRequest, background_tasks: Backgr
     If target_date is provided, fetches data for that date plus the specified number of days before it.
     If no target_date is provided, fetches data for the last N days from today.
     """
-    background_tasks.add_task(jobs.run_fetch_job, days=request.days, target_date=request.target_date)
+    if request.all_users:
+        background_tasks.add_task(
+            jobs.run_fetch_job_all_users, days=request.days, target_date=request.target_date, refetch=request.refetch
+        )
+        return {"message": f"Accepted: Data fetching job for {request.days} day(s) started for every user in the background."}
+    background_tasks.add_task(jobs.run_fetch_job, days=request.days, target_date=request.target_date, refetch=request.refetch)
     
     if request.target_date:
         return {"message": f"Accepted: Data fetching job for {request.days} day(s) from {request.target_date} started in the background."}
@@ -206,13 +636,31 @@ def trigger_fetch_job(request: schemas.FetchJobRequest, background_tasks: Backgr
         return {"message": f"Accepted: Data fetching job for the last {request.days} day(s) started in the background."}
 
 @app.post("/api/jobs/process", status_code=202)
-def trigger_process_job(background_tasks: BackgroundTasks):
+def trigger_process_job(background_tasks: BackgroundTasks, all_users: bool = False):
     """
-    Triggers a background job to process all unprocessed raw data into time entries.
+    Triggers a background job to process all unprocessed raw data into time entries,
+    for the current user or, with all_users, for every registered user concurrently.
     """
+    if all_users:
+        background_tasks.add_task(jobs.run_process_job_all_users)
+        return {"message": "Accepted: Data processing job started for every user in the background."}
     background_tasks.add_task(jobs.run_process_job)
     return {"message": "Accepted: Data processing job started in the background."} 
 
+@app.post("/api/jobs/replay", status_code=202)
+def trigger_replay_job(
+    background_tasks: BackgroundTasks,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    process: bool = False,
+):
+    """
+    Triggers a background job that rebuilds raw data from stored RescueTime responses
+    (no API calls), optionally processing it afterwards.
+    """
+    background_tasks.add_task(jobs.run_replay_job, start_date, end_date, process)
+    return {"message": "Accepted: Replay of stored responses started in the background."}
+
 # --- SPA Fallback (must be last) ---
 @app.get("/{full_path:path}", include_in_schema=False)
 def spa_fallback(full_path: str):  # pragma: no cover
@@ -0,0 +1,91 @@
+"""
+Benchmark for /api/analytics over years of history.
+
+Builds (or reuses, with --db) a database holding --years of synthetic activity (about 1000
+raw rows per working day, so the rollups are maintained by the activity_log triggers as the
+rows are upserted), then times, over the whole range:
+
+  - the full scan the rollups replace: a GROUP BY over activity_log per week and productivity
+  - analytics.summary() by category
+  - analytics.trend() per week and productivity, with NumPy (if installed) and in pure Python
+
+    python benchmarks/bench_analytics.py --years 4 --db /tmp/analytics.db
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import analytics
+import database
+import jobs
+from benchmarks.workload import Workload
+
+ROWS_PER_DAY = 1000
+
+FULL_SCAN_SQL = """
+SELECT date(log_date, 'weekday 0', '-6 days') AS week, productivity, SUM(time_spent_seconds)
+FROM activity_log
+WHERE log_date BETWEEN ? AND ?
+GROUP BY 1, 2
+"""
+
+def build_database(path, days, seed):
+    database.DB_FILE = path
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.initialize_database()
+    conn = database.get_db_connection()
+    try:
+        existing = conn.execute("SELECT COUNT(DISTINCT log_date) FROM activity_log").fetchone()[0]
+    finally:
+        conn.close()
+    if existing >= days * 0.95:
+        return
+    started = time.perf_counter()
+    total = 0
+    for _, date_str, payload in Workload(days=days, rows_per_day=ROWS_PER_DAY, seed=seed):
+        total += database.upsert_activity_data(jobs.activity_rows_from_response(date_str, payload))
+    print(f"Built {total} rows in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark analytics queries over years of activity.")
+    parser.add_argument("--years", type=int, default=4, help="Years of working days of history (default: 4).")
+    parser.add_argument("--db", help="Database file to build or reuse (default: a temporary file).")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the median is reported.")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        build_database(args.db or os.path.join(tmp, "analytics.db"), args.years * 261, args.seed)
+        conn = database.get_db_connection()
+        start_date, end_date, raw_rows = conn.execute("SELECT MIN(log_date), MAX(log_date), COUNT(*) FROM activity_log").fetchone()
+        rollup_rows = conn.execute("SELECT COUNT(*) FROM activity_rollup_daily").fetchone()[0]
+
+        results = {
+            "full scan of activity_log": timed(lambda: conn.execute(FULL_SCAN_SQL, (start_date, end_date)).fetchall(), args.repeat),
+            "summary by category": timed(lambda: analytics.summary(start_date, end_date, "category"), args.repeat),
+            "trend, pure Python": timed(lambda: analytics.trend(start_date, end_date, "productivity", "week", use_numpy=False), args.repeat),
+        }
+        if analytics.np is not None:
+            results["trend, NumPy"] = timed(lambda: analytics.trend(start_date, end_date, "productivity", "week"), args.repeat)
+        conn.close()
+
+        print(f"{start_date} to {end_date}: {raw_rows} raw rows, {rollup_rows} rollup rows")
+        for name, ms in results.items():
+            print(f"{name:<28} {ms:9.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark for retention compaction (retention.compact) of processed raw activity.
+
+Builds a database holding --days days of synthetic activity, processed into time entries,
+then compacts everything older than --keep days. Reports the file size, the row counts and
+the time of a full activity_log scan and of processing the newest day before and after,
+the time compaction and the incremental vacuum take, and checks that the daily analytics
+rollup, the time entries and the seconds each entry's lineage accounts for did not change.
+Lineage rows are entry_sources (one per entry and document) and entry_sources_compacted
+(one per entry, day, activity and productivity once compacted).
+
+    python benchmarks/bench_compaction.py --days 730 --keep 90
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+import jobs
+import processor
+import retention
+from benchmarks.workload import Workload
+
+ROWS_PER_DAY = 1000
+
+def build_database(path, days, seed):
+    database.DB_FILE = path
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.initialize_database()
+    started = time.perf_counter()
+    for _, date_str, payload in Workload(days=days, rows_per_day=ROWS_PER_DAY, seed=seed):
+        database.upsert_activity_data(jobs.activity_rows_from_response(date_str, payload))
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.process_all_data()
+    print(f"Built and processed {days} days in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+def snapshot():
+    conn = database.get_db_connection()
+    try:
+        return (
+            conn.execute("SELECT * FROM activity_rollup_daily ORDER BY 1, 2, 3").fetchall(),
+            conn.execute("SELECT COUNT(*), SUM(total_seconds) FROM time_entries").fetchone()[:],
+            conn.execute("""
+                SELECT source_hash, SUM(time_spent_seconds) FROM (
+                    SELECT source_hash, time_spent_seconds FROM entry_sources
+                    UNION ALL
+                    SELECT source_hash, time_spent_seconds FROM entry_sources_compacted
+                ) GROUP BY source_hash ORDER BY source_hash
+            """).fetchall(),
+        )
+    finally:
+        conn.close()
+
+def measure(label):
+    conn = database.get_db_connection()
+    try:
+        raw, newest = conn.execute("SELECT COUNT(*), MAX(log_date) FROM activity_log").fetchone()
+        compacted = conn.execute("SELECT COUNT(*) FROM activity_log_compacted").fetchone()[0]
+        sources = conn.execute("SELECT COUNT(*) FROM entry_sources").fetchone()[0]
+        folded = conn.execute("SELECT COUNT(*) FROM entry_sources_compacted").fetchone()[0]
+        started = time.perf_counter()
+        conn.execute("SELECT SUM(time_spent_seconds), COUNT(DISTINCT activity) FROM activity_log").fetchone()
+        scan = (time.perf_counter() - started) * 1000
+    finally:
+        conn.close()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.process_data_for_date(newest)
+    process = (time.perf_counter() - started) * 1000
+    size = os.path.getsize(database.current_db_file())
+    print(f"{label:<7} {size / 2**20:8.1f} MiB  {raw:>9} raw rows  {compacted:>7} summary rows  "
+          f"{sources:>8} lineage rows  {folded:>7} compacted lineage rows  scan {scan:7.1f} ms  process newest day {process:7.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retention compaction of processed raw activity.")
+    parser.add_argument("--days", type=int, default=730, help="Working days of history (default: 730).")
+    parser.add_argument("--keep", type=int, default=90, help="Calendar days kept raw (default: 90).")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        build_database(os.path.join(tmp, "compaction.db"), args.days, args.seed)
+        conn = database.get_db_connection()
+        last_date = conn.execute("SELECT MAX(log_date) FROM activity_log").fetchone()[0]
+        conn.close()
+        # Relative to the workload's last day rather than today
+        older_than = args.keep + (date.today() - date.fromisoformat(last_date)).days
+        before = snapshot()
+        measure("before")
+
+        summary = retention.compact(older_than, vacuum_after=False, pause=0)
+        print(f"compact: {summary['dates']} days, {summary['rows_removed']} raw rows -> "
+              f"{summary['summary_rows']} summary rows, {summary['sources_folded']} lineage rows folded "
+              f"in {summary['seconds']:.2f}s")
+        started = time.perf_counter()
+        released = retention.vacuum(pause=0)
+        print(f"vacuum:  {released / 2**20:.1f} MiB released in {time.perf_counter() - started:.2f}s")
+        measure("after")
+        print(f"rollup, time entries and lineage totals unchanged: {snapshot() == before}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark for importing RescueTime export files (importer.run_import).
+
+Writes a synthetic export of about --rows rows in the chosen format: the workload's daily
+rows split across the hours of the day, with a Date column, like an hourly export. Then
+imports it into a fresh database and reports rows per second, next to loading the same
+(already summed) rows through upsert_activity_data in batches as the replay job does.
+The two must give identical activity_log contents.
+
+    python benchmarks/bench_import.py --rows 1000000 --format csv
+    python benchmarks/bench_import.py --rows 1000000 --format json
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+import importer
+import jobs
+from benchmarks.workload import Workload
+
+HEADERS = ["Date", "Time Spent (seconds)", "Number of People", "Activity", "Document", "Category", "Productivity"]
+ROWS_PER_DAY = 1000
+
+def export_rows(rows, seed):
+    """Hourly export rows (in header order) for about `rows` rows of the synthetic workload."""
+    rng = random.Random(seed)
+    produced = 0
+    for _, date_str, payload in Workload(days=max(1, rows // (ROWS_PER_DAY * 2)), rows_per_day=ROWS_PER_DAY, seed=seed):
+        for _, seconds, people, activity, document, category, productivity in payload["rows"]:
+            hours = rng.randint(1, 3)
+            for hour in range(hours):
+                share = seconds // hours + (seconds % hours if hour == 0 else 0)
+                yield [f"{date_str}T{9 + hour:02d}:00:00", share, people, activity, document, category, productivity]
+                produced += 1
+        if produced >= rows:
+            return
+
+def write_export(path, fmt, rows, seed):
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(HEADERS)
+            for row in export_rows(rows, seed):
+                writer.writerow(row)
+                count += 1
+        elif fmt == "json":
+            f.write('{"notes": "synthetic export", "row_headers": %s, "rows": [' % json.dumps(HEADERS))
+            for row in export_rows(rows, seed):
+                f.write(("," if count else "") + json.dumps(row))
+                count += 1
+            f.write("]}")
+        else:
+            for row in export_rows(rows, seed):
+                f.write(json.dumps(dict(zip(HEADERS, row))) + "\n")
+                count += 1
+    return count
+
+def fresh_database(path):
+    database.DB_FILE = path
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.initialize_database()
+
+def activity_log():
+    conn = database.get_db_connection()
+    try:
+        return conn.execute("""
+            SELECT log_date, time_spent_seconds, activity, category, productivity, document
+            FROM activity_log ORDER BY log_date, activity, document
+        """).fetchall()
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bulk import of RescueTime export files.")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Approximate export rows (default: 1000000).")
+    parser.add_argument("--format", choices=importer.IMPORT_FORMATS, default="csv")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        export_path = os.path.join(tmp, f"export.{args.format}")
+        count = write_export(export_path, args.format, args.rows, args.seed)
+        size = os.path.getsize(export_path)
+
+        fresh_database(os.path.join(tmp, "import.db"))
+        started = time.perf_counter()
+        summary = importer.run_import(export_path)
+        imported = time.perf_counter() - started
+        imported_rows = activity_log()
+
+        # The same rows, summed per day, activity and document, through upsert_activity_data
+        totals = defaultdict(int)
+        details = {}
+        for log_date, seconds, _, activity, document, category, productivity in export_rows(args.rows, args.seed):
+            key = (log_date[:10], activity, document)
+            totals[key] += seconds
+            details[key] = (category, productivity)
+        rows = [(key[0], seconds, key[1], *details[key], key[2]) for key, seconds in totals.items()]
+        fresh_database(os.path.join(tmp, "upsert.db"))
+        started = time.perf_counter()
+        for start in range(0, len(rows), jobs.REPLAY_BATCH_ROWS):
+            database.upsert_activity_data(rows[start:start + jobs.REPLAY_BATCH_ROWS])
+        upserted = time.perf_counter() - started
+
+        print(f"{count} export rows ({size / 2**20:.1f} MiB {args.format}) -> {summary['records']} records over {summary['dates']} days")
+        print(f"import:                {imported:7.2f}s ({count / imported:,.0f} export rows/s)")
+        print(f"upsert_activity_data:  {upserted:7.2f}s ({len(rows) / upserted:,.0f} records/s, rows pre-summed)")
+        print(f"activity_log identical: {imported_rows == activity_log()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Benchmark for migrating a large database while the API keeps writing to it.
+
+Builds a database in the pre-migration schema (no rule_version or source_key columns, the
+legacy UNIQUE index on source_hash, time_units unset) holding --rows time entries, then
+migrates it in a child process while this process plays the API: the writer thread running,
+one small upsert_time_entries every --interval seconds and a date read in between. Reports
+the migration's duration and the write and read latencies seen meanwhile (calls made
+before migration 2 has added source_key fail, as they would on the unmigrated database).
+
+--single-transaction migrates the way initialize_database used to (ALTER TABLE and one
+UPDATE per table in a single transaction) for comparison.
+
+    python benchmarks/bench_migration.py --rows 1000000
+    python benchmarks/bench_migration.py --rows 1000000 --single-transaction
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+import migrations
+import writer
+
+def build_legacy_database(path, rows):
+    """A database as initialize_database created it before migrations 1-3, with `rows` entries."""
+    database.DB_FILE = path
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.initialize_database()
+    conn = database.get_db_connection()
+    conn.executescript("""
+        DROP INDEX idx_time_entries_source_key;
+        DROP INDEX idx_processed_time_entries_source_key;
+        ALTER TABLE time_entries DROP COLUMN source_key;
+        ALTER TABLE time_entries DROP COLUMN rule_version;
+        ALTER TABLE processed_time_entries DROP COLUMN source_key;
+        CREATE UNIQUE INDEX legacy_time_entries_source_hash ON time_entries(source_hash);
+        DELETE FROM update_metadata;
+    """)
+    batch = 20000
+    for start in range(0, rows, batch):
+        entries = []
+        for i in range(start, min(start + batch, rows)):
+            date_str = f"2024-{1 + i // 28000 % 12:02d}-{1 + i // 1000 % 28:02d}"
+            description = f"Contract_Review_Client{i % 977}_{20000 + i}.docx"
+            source_hash = hashlib.md5(f"{date_str}-microsoft word-{description}".encode("utf-8")).hexdigest()
+            entries.append((date_str, "microsoft word", description, 600 + i % 50, source_hash, str(20000 + i % 5000)))
+        conn.executemany("""
+            INSERT INTO time_entries (entry_date, application, task_description, total_seconds, source_hash, matter_code)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, entries)
+        conn.commit()
+    conn.close()
+
+def migrate_single_transaction(path):
+    import processor
+    conn = database.get_db_connection(db_file=path)
+    conn.create_function("source_key", 1, database.source_key, deterministic=True)
+    conn.create_function("seconds_to_units", 1, processor.seconds_to_units, deterministic=True)
+    conn.executescript("""
+        BEGIN;
+        ALTER TABLE time_entries ADD COLUMN rule_version TEXT;
+        ALTER TABLE time_entries ADD COLUMN source_key INTEGER;
+        ALTER TABLE processed_time_entries ADD COLUMN source_key INTEGER;
+        UPDATE time_entries SET source_key = source_key(source_hash);
+        UPDATE processed_time_entries SET source_key = source_key(source_hash);
+        CREATE UNIQUE INDEX idx_time_entries_source_key ON time_entries(source_key);
+        CREATE UNIQUE INDEX idx_processed_time_entries_source_key ON processed_time_entries(source_key, entry_date);
+        UPDATE time_entries SET time_units = seconds_to_units(total_seconds) WHERE time_units IS NULL;
+        COMMIT;
+    """)
+    conn.close()
+
+def run_migration(path, single_transaction):
+    database.DB_FILE = path
+    if single_transaction:
+        migrate_single_transaction(path)
+    else:
+        migrations.migrate()
+
+def percentile(values, fraction):
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+def api_calls(keep_going, interval, first=0):
+    """One small upsert and one date read every interval seconds while keep_going() is true."""
+    write_ms, read_ms, errors, i = [], [], 0, first
+    while keep_going():
+        source_hash = hashlib.md5(f"api-{i}".encode("utf-8")).hexdigest()
+        entry = ("2025-06-02", "microsoft word", f"Letter_of_Advice_{i}.docx", 420, 1.2, source_hash, "30001", "v1")
+        try:
+            started = time.perf_counter()
+            database.upsert_time_entries([entry])
+            write_ms.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            database.get_time_entries_by_date("2025-06-02")
+            read_ms.append((time.perf_counter() - started) * 1000)
+        except Exception:
+            errors += 1
+        i += 1
+        time.sleep(interval)
+    return write_ms, read_ms, errors
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API write latency during a large migration.")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Time entries to migrate (default: 1000000).")
+    parser.add_argument("--interval", type=float, default=0.02, help="Seconds between API writes (default: 0.02).")
+    parser.add_argument("--single-transaction", action="store_true", help="Migrate in one transaction, as before.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "migration.db")
+        started = time.perf_counter()
+        build_legacy_database(path, args.rows)
+        print(f"Built {args.rows} legacy entries in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+        database.DB_FILE = path
+        writer.start()
+        child = multiprocessing.Process(target=run_migration, args=(path, args.single_transaction))
+        started = time.perf_counter()
+        child.start()
+
+        during = api_calls(lambda: child.is_alive(), args.interval)
+        child.join()
+        elapsed = time.perf_counter() - started
+        # The same calls once the migration is over, for reference
+        deadline = time.perf_counter() + 3
+        after = api_calls(lambda: time.perf_counter() < deadline, args.interval, first=len(during[0]) + during[2])
+        writer.stop()
+
+        mode = "single transaction" if args.single_transaction else f"chunked ({migrations.MIGRATION_CHUNK_ROWS} rows)"
+        print(f"Migration ({mode}): {elapsed:.1f}s for {args.rows} entries, exit code {child.exitcode}")
+        for phase, (write_ms, read_ms, errors) in (("during", during), ("after", after)):
+            for name, values in (("writes", write_ms), ("reads", read_ms)):
+                print(f"API {name:<6} {phase:<6} n={len(values):<6} p50={percentile(values, 0.5):7.1f} ms  "
+                      f"p99={percentile(values, 0.99):7.1f} ms  max={max(values, default=0):8.1f} ms")
+            print(f"Failed API calls {phase}: {errors}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark for the processing hot loop (processor.ProcessingEngine) on multi-million-row inputs.
+
+Builds a throwaway database with --rows synthetic activity_log rows (about 1000 per working
+day), then measures one aggregation pass over all of them: throughput in rows per second
+(timed on its own) and memory (a second pass under tracemalloc, reporting the peak and what
+the finished Aggregation still holds). --full additionally times process_all_data end to
+end, including the upsert of entries and lineage.
+
+    python benchmarks/bench_processing.py --rows 2000000
+    python benchmarks/bench_processing.py --rows 500000 --full --db /tmp/processing.db
+"""
+import argparse
+import contextlib
+import gc
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+import jobs
+import processor
+from benchmarks.workload import Workload
+
+ROWS_PER_DAY = 1000
+
+def build_database(path, rows, seed):
+    """Fills path with about `rows` activity rows (reused if it already holds that many)."""
+    database.DB_FILE = path
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.initialize_database()
+    conn = database.get_db_connection()
+    try:
+        existing = conn.execute("SELECT COUNT(*) FROM activity_log").fetchone()[0]
+    finally:
+        conn.close()
+    if existing >= rows * 0.95:
+        return existing
+    started = time.perf_counter()
+    total = 0
+    for _, date_str, payload in Workload(days=max(1, rows // ROWS_PER_DAY), rows_per_day=ROWS_PER_DAY, seed=seed):
+        total += database.upsert_activity_data(jobs.activity_rows_from_response(date_str, payload))
+    print(f"Built {total} rows in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return total
+
+def aggregate():
+    return processor.ProcessingEngine(processor.UnprocessedRows(), processor.DryRunSink()).aggregate()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the processing engine's aggregation pass.")
+    parser.add_argument("--rows", type=int, default=2_000_000, help="Approximate activity rows (default: 2000000).")
+    parser.add_argument("--db", help="Database file to build or reuse (default: a temporary file).")
+    parser.add_argument("--full", action="store_true", help="Also time process_all_data end to end.")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rows = build_database(args.db or os.path.join(tmp, "processing.db"), args.rows, args.seed)
+
+        gc.collect()
+        started = time.perf_counter()
+        aggregation = aggregate()
+        elapsed = time.perf_counter() - started
+        groups = len(aggregation.groups)
+        del aggregation
+
+        gc.collect()
+        tracemalloc.start()
+        aggregation = aggregate()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del aggregation
+
+        print(f"Rows:               {rows}")
+        print(f"Task-day groups:    {groups}")
+        print(f"Aggregate pass:     {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s)")
+        print(f"Peak traced memory: {peak / 2**20:.1f} MiB")
+        print(f"Aggregation held:   {retained / 2**20:.1f} MiB ({retained / max(rows, 1):.0f} B/row)")
+
+        if args.full:
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                processor.process_all_data()
+            elapsed = time.perf_counter() - started
+            print(f"process_all_data:   {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s)")
+
+if __name__ == "__main__":
+    main()
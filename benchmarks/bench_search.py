@@ -0,0 +1,133 @@
+"""
+Benchmark for the FTS5 search endpoints' queries.
+
+Builds a throwaway database with several years of synthetic entries and raw document
+rows, then times database.search_time_entries / search_documents and reports the
+median and p95 latency. Targeted queries (a client and/or document name, the UI's use
+case) are held to the 10 ms p95 target; broad single-term queries that match a large
+share of all history are reported as the worst case.
+
+    python benchmarks/bench_search.py --years 4
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+from benchmarks.workload import CLIENTS, DOC_TYPES, EXTENSIONS
+
+TARGET_MS = 10.0
+
+def build_database(path, years, entries_per_day, raw_rows_per_day, seed):
+    """
+    Creates and fills a database at path; returns (entry_count, raw_row_count).
+    Documents come from a pool of matters that are each active for a few weeks, so titles
+    recur across days the way real client work does, with page-number variants in Preview.
+    """
+    rng = random.Random(seed)
+    database.DB_FILE = path
+    database.initialize_database()
+
+    start = date.today() - timedelta(days=365 * years)
+    total_days = (date.today() - start).days
+    documents = []  # (first_day, last_day, name)
+    for matter in range(20000, 20000 + 150 * years):
+        client = rng.choice(CLIENTS)
+        opened = rng.randrange(total_days)
+        closed = opened + rng.randint(10, 120)
+        for _ in range(rng.randint(3, 8)):
+            name = f"{rng.choice(DOC_TYPES)}_{client}_{matter}{rng.choice(EXTENSIONS)}"
+            documents.append((opened, closed, name))
+
+    entries, raw_rows = [], []
+    for offset in range(total_days):
+        day = start + timedelta(days=offset)
+        if day.weekday() >= 5:
+            continue
+        date_str = day.isoformat()
+        active = [name for opened, closed, name in documents if opened <= offset <= closed]
+        worked = rng.sample(active, min(entries_per_day, len(active)))
+        for i, name in enumerate(worked):
+            matter = name.rsplit("_", 1)[1].split(".")[0]
+            entries.append((date_str, "microsoft word", name, rng.randint(60, 7200), f"{date_str}-{i}", matter))
+        for name in rng.choices(worked, k=raw_rows_per_day) if worked else []:
+            doc = f"{name} – Page {rng.randint(1, 12)} of 12" if name.endswith(".pdf") else name
+            raw_rows.append((date_str, rng.randint(5, 900), "Preview", "Reading", 1, doc))
+
+    conn = database.get_db_connection()
+    conn.executemany("""
+        INSERT INTO time_entries (entry_date, application, task_description, total_seconds, source_hash, matter_code)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, entries)
+    conn.executemany("""
+        INSERT OR IGNORE INTO activity_log (log_date, time_spent_seconds, activity, category, productivity, document)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, raw_rows)
+    conn.commit()
+    conn.execute("INSERT INTO time_entries_fts (time_entries_fts) VALUES ('optimize')")
+    conn.execute("INSERT INTO document_catalog_fts (document_catalog_fts) VALUES ('optimize')")
+    conn.commit()
+    conn.close()
+    return len(entries), len(raw_rows)
+
+def time_queries(search_fn, queries, repeats):
+    """Runs every query `repeats` times and returns per-call latencies in milliseconds."""
+    timings = []
+    for _ in range(repeats):
+        for text, start_date, end_date in queries:
+            started = time.perf_counter()
+            search_fn(text, start_date, end_date, 50)
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def summarize(label, timings, enforce=True):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    median = statistics.median(timings)
+    verdict = ("PASS" if p95 < TARGET_MS else "FAIL") if enforce else "info"
+    print(f"{label:<32} median {median:6.2f} ms   p95 {p95:6.2f} ms   [{verdict}]")
+    return p95 < TARGET_MS or not enforce
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FTS5 search over synthetic multi-year data.")
+    parser.add_argument("--years", type=int, default=4, help="Years of history to generate (default: 4).")
+    parser.add_argument("--entries-per-day", type=int, default=40, help="Time entries per working day (default: 40).")
+    parser.add_argument("--raw-rows-per-day", type=int, default=250, help="Raw activity rows per working day (default: 250).")
+    parser.add_argument("--repeats", type=int, default=20, help="Times to run each query (default: 20).")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        started = time.perf_counter()
+        entry_count, raw_count = build_database(path, args.years, args.entries_per_day, args.raw_rows_per_day, args.seed)
+        print(f"Built {entry_count:,} time entries and {raw_count:,} raw rows in {time.perf_counter() - started:.1f}s")
+
+        today = date.today()
+        last_quarter = ((today - timedelta(days=90)).isoformat(), today.isoformat())
+        targeted = [
+            ("Smith Trust", None, None),
+            ("Statement_of_Claim Okafor", None, None),
+            ("Lease Rossi 2", *last_quarter),
+            ("Trust_Deed_Nguyen", None, None),
+            ("Letter_of_Advice Patel", *last_quarter),
+        ]
+        broad = [
+            ("Tanaka", None, None),
+            ("Memo", None, None),
+        ]
+        print(f"Target: p95 < {TARGET_MS:.0f} ms for targeted queries")
+        ok = True
+        for label, search_fn in (("entries", database.search_time_entries), ("documents", database.search_documents)):
+            ok &= summarize(f"{label} / targeted", time_queries(search_fn, targeted, args.repeats))
+            summarize(f"{label} / broad single term", time_queries(search_fn, broad, args.repeats), enforce=False)
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Benchmark for near-duplicate task clustering (similarity.clusters) over years of entries.
+
+Builds (or reuses, with --db) a database holding --years of synthetic activity processed
+into time entries, so task_signatures is filled as processing writes the entries, then
+times clusters() over the whole range, the last year and the last month. For reference it
+also times the exact pairwise comparison LSH avoids (difflib ratios of every pair of
+distinct descriptions) on --pairwise-sample descriptions and extrapolates to the full range.
+
+    python benchmarks/bench_similarity.py --years 4 --db /tmp/similarity.db
+"""
+import argparse
+import contextlib
+import difflib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+import jobs
+import processor
+import similarity
+from benchmarks.workload import Workload
+
+ROWS_PER_DAY = 1000
+
+def build_database(path, days, seed):
+    database.DB_FILE = path
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.initialize_database()
+    conn = database.get_db_connection()
+    try:
+        existing = conn.execute("SELECT COUNT(DISTINCT entry_date) FROM time_entries").fetchone()[0]
+    finally:
+        conn.close()
+    if existing >= days * 0.95:
+        return
+    started = time.perf_counter()
+    for _, date_str, payload in Workload(days=days, rows_per_day=ROWS_PER_DAY, seed=seed):
+        database.upsert_activity_data(jobs.activity_rows_from_response(date_str, payload))
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.process_all_data()
+    print(f"Built and processed {days} days in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times), result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark near-duplicate task clustering over years of entries.")
+    parser.add_argument("--years", type=int, default=4, help="Years of working days of history (default: 4).")
+    parser.add_argument("--db", help="Database file to build or reuse (default: a temporary file).")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the median is reported.")
+    parser.add_argument("--pairwise-sample", type=int, default=1000, help="Descriptions in the pairwise reference.")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        build_database(args.db or os.path.join(tmp, "similarity.db"), args.years * 261, args.seed)
+        conn = database.get_db_connection()
+        first_date, last_date, entries = conn.execute(
+            "SELECT MIN(entry_date), MAX(entry_date), COUNT(*) FROM time_entries"
+        ).fetchone()
+        descriptions = [row[0] for row in conn.execute("SELECT DISTINCT task_description FROM time_entries")]
+        conn.close()
+
+        last = date.fromisoformat(last_date)
+        ranges = {
+            "whole range": first_date,
+            "last year": (last - timedelta(days=365)).isoformat(),
+            "last month": (last - timedelta(days=30)).isoformat(),
+        }
+        print(f"{first_date} to {last_date}: {entries} time entries, {len(descriptions)} distinct descriptions")
+        for name, start in ranges.items():
+            ms, result = timed(lambda: similarity.clusters(start, last_date), args.repeat)
+            members = sum(len(cluster["members"]) for cluster in result["clusters"])
+            print(f"clusters(), {name:<12} {ms:9.1f} ms  ({result['descriptions']} descriptions, "
+                  f"{len(result['clusters'])} clusters shown with {members} members)")
+
+        sample = descriptions[:args.pairwise_sample]
+        started = time.perf_counter()
+        for i, first in enumerate(sample):
+            matcher = difflib.SequenceMatcher(None, first)
+            for second in sample[i + 1:]:
+                matcher.set_seq2(second)
+                matcher.quick_ratio()
+        elapsed = time.perf_counter() - started
+        pairs = len(sample) * (len(sample) - 1) / 2
+        full_pairs = len(descriptions) * (len(descriptions) - 1) / 2
+        print(f"pairwise quick_ratio, {len(sample)} descriptions: {elapsed * 1000:9.1f} ms "
+              f"(~{elapsed / pairs * full_pairs:,.0f} s for all {len(descriptions)})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark for the time_entries upsert key: the legacy UNIQUE source_hash TEXT index (32-char
+MD5 hex) against the integer source_key index (database.source_key).
+
+Both variants use the same time_entries columns and no triggers, so the only difference is
+the key the upsert conflicts on. Each loads --entries entries in batches of --batch (like
+processing one day at a time), then upserts all of them again (the update path taken by
+every re-process), and reports rows per second and the on-disk size of the key index.
+
+    python benchmarks/bench_source_keys.py --entries 500000
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+TABLE_SQL = """
+CREATE TABLE time_entries (
+    entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    entry_date TEXT NOT NULL,
+    application TEXT NOT NULL,
+    task_description TEXT NOT NULL,
+    total_seconds INTEGER NOT NULL,
+    time_units REAL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    notes TEXT,
+    matter_code TEXT,
+    source_hash TEXT NOT NULL {hash_constraint},
+    source_key INTEGER,
+    rule_version TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+LEGACY_UPSERT_SQL = """
+INSERT INTO time_entries (entry_date, application, task_description, total_seconds, time_units, source_hash, matter_code, rule_version, source_key)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(source_hash) DO UPDATE SET
+    total_seconds = excluded.total_seconds,
+    time_units = excluded.time_units,
+    task_description = excluded.task_description,
+    matter_code = excluded.matter_code,
+    rule_version = excluded.rule_version,
+    updated_at = CURRENT_TIMESTAMP;
+"""
+
+VARIANTS = {
+    # name: (source_hash constraint, key index DDL, upsert SQL, index name)
+    "text": ("UNIQUE", None, LEGACY_UPSERT_SQL, "sqlite_autoindex_time_entries_1"),
+    "integer": (
+        "",
+        "CREATE UNIQUE INDEX idx_time_entries_source_key ON time_entries(source_key)",
+        database.TIME_ENTRY_UPSERT_SQL,
+        "idx_time_entries_source_key",
+    ),
+}
+
+def make_entries(count, seconds_offset=0):
+    entries = []
+    for i in range(count):
+        date_str = f"2025-{1 + i // 30000 % 12:02d}-{1 + i // 1000 % 28:02d}"
+        description = f"Contract_Review_Client{i % 977}_{20000 + i}.docx"
+        source_hash = hashlib.md5(f"{date_str}-microsoft word-{description}".encode("utf-8")).hexdigest()
+        entries.append((date_str, "microsoft word", description, 600 + i % 50 + seconds_offset, 1.7, source_hash, str(20000 + i % 5000), "v1"))
+    return entries
+
+def run(variant, path, entries, updates, batch):
+    hash_constraint, index_sql, upsert_sql, index_name = VARIANTS[variant]
+    conn = sqlite3.connect(path)
+    conn.execute(TABLE_SQL.format(hash_constraint=hash_constraint))
+    if index_sql:
+        conn.execute(index_sql)
+    conn.commit()
+
+    results = {}
+    for phase, rows in (("insert", entries), ("update", updates)):
+        started = time.perf_counter()
+        for start in range(0, len(rows), batch):
+            # Key computation is part of the cost of the integer variant
+            chunk = [entry + (database.source_key(entry[5]),) for entry in rows[start:start + batch]]
+            conn.executemany(upsert_sql, chunk)
+            conn.commit()
+        results[phase] = len(rows) / (time.perf_counter() - started)
+
+    results["index_bytes"] = conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = ?", (index_name,)).fetchone()[0]
+    conn.close()
+    results["file_bytes"] = os.path.getsize(path)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark text vs integer upsert keys for time_entries.")
+    parser.add_argument("--entries", type=int, default=500_000, help="Time entries to load (default: 500000).")
+    parser.add_argument("--batch", type=int, default=5000, help="Entries per transaction (default: 5000).")
+    args = parser.parse_args()
+
+    entries = make_entries(args.entries)
+    updates = make_entries(args.entries, seconds_offset=60)
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {variant: run(variant, os.path.join(tmp, f"{variant}.db"), entries, updates, args.batch) for variant in VARIANTS}
+
+    print(f"{args.entries} entries, {args.batch} per transaction")
+    print(f"{'Key':<8} {'insert rows/s':>14} {'update rows/s':>14} {'key index MiB':>14} {'file MiB':>10}")
+    for variant, stats in results.items():
+        print(f"{variant:<8} {stats['insert']:>14,.0f} {stats['update']:>14,.0f} "
+              f"{stats['index_bytes'] / 2**20:>14.1f} {stats['file_bytes'] / 2**20:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark for concurrent small writes: the API's status updates and upserts, issued from
+many threads at once the way the FastAPI threadpool and background jobs do.
+
+Runs the same workload twice against a throwaway database: with every write opening its
+own connection and committing on its own (the CLI path), then through the writer thread
+(writer.py), which group-commits them. Reports writes per second and per-write latency.
+
+    python benchmarks/bench_writes.py --threads 16 --writes 200
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+import writer
+
+def build_database(path, entries):
+    database.DB_FILE = path
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.initialize_database()
+    database.upsert_time_entries([
+        ("2025-07-01", "microsoft word", f"Doc_{i}.docx", 600, 1.7, f"hash{i}", None, None)
+        for i in range(entries)
+    ])
+
+def run_workload(threads, writes, entries, seed):
+    """Each thread alternates status updates and single-row activity upserts. Returns per-write latencies (ms)."""
+    latencies = [[] for _ in range(threads)]
+    errors = []
+
+    def work(index):
+        rng = random.Random(seed + index)
+        try:
+            for i in range(writes):
+                started = time.perf_counter()
+                if i % 2:
+                    database.update_time_entry_status(rng.randrange(1, entries + 1), rng.choice(["pending", "ignored"]))
+                else:
+                    database.upsert_activity_data([("2025-07-02", i, f"app{index}", "Writing", 2, f"doc{i}")])
+                latencies[index].append((time.perf_counter() - started) * 1000)
+        except Exception as e:
+            errors.append(e)
+
+    pool = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise errors[0]
+    flat = sorted(latency for per_thread in latencies for latency in per_thread)
+    return {
+        "writes_per_second": round(len(flat) / elapsed, 1),
+        "median_ms": round(statistics.median(flat), 3),
+        "p95_ms": round(flat[math.ceil(len(flat) * 0.95) - 1], 3),
+        "max_ms": round(flat[-1], 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent writes with and without the writer thread.")
+    parser.add_argument("--threads", type=int, default=16, help="Concurrent writer threads (default: 16).")
+    parser.add_argument("--writes", type=int, default=200, help="Writes per thread (default: 200).")
+    parser.add_argument("--entries", type=int, default=1000, help="Time entries to update (default: 1000).")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for mode in ("inline", "writer"):
+            build_database(os.path.join(tmp, f"{mode}.db"), args.entries)
+            if mode == "writer":
+                writer.start()
+            try:
+                results[mode] = run_workload(args.threads, args.writes, args.entries, args.seed)
+            finally:
+                writer.stop()
+
+    print(f"{args.threads} threads x {args.writes} writes")
+    print(f"{'Mode':<8} {'writes/s':>10} {'median ms':>10} {'p95 ms':>10} {'max ms':>10}")
+    for mode, stats in results.items():
+        print(f"{mode:<8} {stats['writes_per_second']:>10} {stats['median_ms']:>10} {stats['p95_ms']:>10} {stats['max_ms']:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Check of the ALP lookup cache (alp_cache.py) against a local stub ALP server.
+
+Starts an http.server on an ephemeral port serving a small matter -> outcome -> component
+tree, points ALP_API_URL at it and checks, against the requests the stub receives:
+TTL hits, stale-while-revalidate (the stale value is served while exactly one background
+refresh runs), invalidate_matter / invalidate_outcome cascading through memory and the
+alp_cache table, a warm restart from SqliteCacheStore, the GETs prefetch_tree issues,
+and falling back to the expired copy when the stub answers 5xx. Exits non-zero on failure.
+
+    python benchmarks/check_alp_cache.py
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TREE = {
+    "matters": [{"id": 1, "name": "Matter 001"}, {"id": 2, "name": "Matter 002"}],
+    "outcomes": {1: [{"id": 101, "name": "Discovery"}, {"id": 102, "name": "Negotiation"}],
+                 2: [{"id": 201, "name": "Advice"}]},
+}
+
+class StubALP(BaseHTTPRequestHandler):
+    """Serves TREE; every response carries the request's sequence number as 'version'."""
+    requests = []
+    fail = False
+    gate = threading.Event()
+
+    def do_GET(self):
+        cls = type(self)
+        cls.requests.append(self.path)
+        version = len(cls.requests)
+        if self.path == "/matters":
+            cls.gate.wait(10)
+            body = [dict(matter, version=version) for matter in TREE["matters"]]
+        elif self.path.startswith("/matters/"):
+            body = TREE["outcomes"].get(int(self.path.split("/")[2]), [])
+        elif self.path.startswith("/outcomes/"):
+            outcome_id = int(self.path.split("/")[2])
+            body = [{"id": outcome_id * 10 + i, "name": f"Component {i}"} for i in (1, 2)]
+        else:
+            self.send_error(404)
+            return
+        if cls.fail:
+            self.send_error(503)
+            return
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+def age(cache, key, seconds):
+    """Backdates a cached entry by `seconds`."""
+    value, fetched_at = cache._entries[key]
+    cache.set(key, value, fetched_at - seconds)
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubALP)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["ALP_API_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["ALP_API_KEY"] = "stub"
+    os.environ["ALP_CACHE_PERSIST"] = "true"
+
+    import alp_cache
+    import database
+    import requests
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_FILE = os.path.join(tmp, "alp.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            database.initialize_database()
+        cache = alp_cache._cache
+        ttl = cache.ttl
+        StubALP.gate.set()
+
+        # TTL: the second lookup is a hit and never reaches the stub
+        first = alp_cache.get_matters()
+        assert alp_cache.get_matters() == first
+        assert StubALP.requests == ["/matters"], StubALP.requests
+        assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1, cache.stats
+        print("TTL hit: ok")
+
+        # Stale-while-revalidate: stale value served meanwhile, one refresh
+        StubALP.gate.clear()
+        age(cache, "matters", ttl + 1)
+        assert alp_cache.get_matters() == first
+        wait_for(lambda: len(StubALP.requests) == 2)
+        for _ in range(5):
+            assert alp_cache.get_matters() == first
+        assert StubALP.requests == ["/matters"] * 2, StubALP.requests
+        StubALP.gate.set()
+        wait_for(lambda: cache.peek("matters") != first)
+        wait_for(lambda: not cache._refreshing)
+        assert cache.peek("matters")[0]["version"] == 2
+        assert cache.stats["stale_hits"] == 6, cache.stats
+        print("stale-while-revalidate, one background refresh: ok")
+
+        # Invalidation cascades from a matter to its outcomes' components
+        for matter in TREE["matters"]:
+            for outcome in alp_cache.get_matter_outcomes(matter["id"]):
+                alp_cache.get_outcome_components(outcome["id"])
+        dropped = alp_cache.invalidate_matter(1)
+        assert sorted(dropped) == ["matters/1/outcomes", "outcomes/101/components", "outcomes/102/components"], dropped
+        for key in dropped:
+            assert cache.peek(key) is None and database.load_alp_cache_entry(key) is None, key
+        assert cache.peek("matters/2/outcomes") is not None and cache.peek("outcomes/201/components") is not None
+        assert alp_cache.invalidate_outcome(201) == ["outcomes/201/components"]
+        assert cache.peek("outcomes/201/components") is None and cache.peek("matters/2/outcomes") is not None
+        print("invalidate_matter / invalidate_outcome cascade: ok")
+
+        # Warm restart: a new cache answers from the alp_cache table without calling ALP
+        restarted = alp_cache.TTLCache(ttl, cache.stale_ttl, store=alp_cache.SqliteCacheStore())
+        def unreachable():
+            raise AssertionError("warm cache called ALP")
+        assert restarted.get("matters", unreachable) == cache.peek("matters")
+        assert restarted.get("matters/2/outcomes", unreachable) == TREE["outcomes"][2]
+        assert restarted.stats["hits"] == 2, restarted.stats
+        print("SqliteCacheStore warm restart: ok")
+
+        # prefetch_tree issues one GET per matter list, matter and outcome
+        alp_cache.invalidate()
+        StubALP.requests = []
+        loaded = alp_cache.prefetch_tree()
+        expected = ["/matters"] + [f"/matters/{m['id']}/outcomes" for m in TREE["matters"]] + \
+                   [f"/outcomes/{o['id']}/components" for outcomes in TREE["outcomes"].values() for o in outcomes]
+        assert sorted(StubALP.requests) == sorted(expected), StubALP.requests
+        assert loaded == len(expected), loaded
+        print("prefetch_tree GETs: ok")
+
+        # 5xx: expired entries are served as they are; missing ones raise
+        StubALP.fail = True
+        errors = cache.stats["refresh_errors"]
+        outcomes = cache.peek("matters/1/outcomes")
+        age(cache, "matters/1/outcomes", ttl + cache.stale_ttl + 1)
+        assert alp_cache.get_matter_outcomes(1) == outcomes
+        assert cache.stats["refresh_errors"] == errors + 1, cache.stats
+        try:
+            alp_cache.get_matter_outcomes(3)
+        except requests.HTTPError:
+            pass
+        else:
+            raise AssertionError("a miss during an outage must raise")
+        print("stale fallback on 5xx: ok")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Equivalence check of processor.ProcessingEngine against the processing code it replaced.
+
+Runs a seeded synthetic workload (benchmarks/workload.py) through every processing path on
+fresh throwaway databases and compares the results with benchmarks/data/engine_legacy.json.gz,
+recorded with the per-path loops that preceded the engine:
+
+  - process_all:  process_all_data(): time_entries, entry_sources, canonical_names and the
+                  processed flags of activity_log;
+  - dry_run:      process_all_data(debug=True) (DryRunSink): the task-day lines and counts
+                  it prints, and that nothing is written;
+  - per_date:     process_data_for_date() for every date (processed flags excluded: the
+                  engine marks aggregated rows processed, the old per-date path did not);
+  - cleaning:     process_data_for_date(debug=True) (CleaningReportSink): the per-document
+                  lines it prints;
+  - reprocess:    reprocess_changed_rules() after a rule change, on the per-date database.
+
+Printed reports are compared as multisets of their data lines; headings and line order are
+not part of the contract. Exits non-zero if any path differs.
+
+    python benchmarks/check_engine_equivalence.py
+    python benchmarks/check_engine_equivalence.py --record   # rewrite the expected output
+"""
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+import processor
+from benchmarks.workload import Workload
+
+EXPECTED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "engine_legacy.json.gz")
+DAYS = 12
+ROWS_PER_DAY = 250
+SEED = 7
+CLEANING_DATE_INDEX = 3
+
+def fresh_database(tmp, name, rows):
+    database.DB_FILE = os.path.join(tmp, f"{name}.db")
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.initialize_database()
+        database.upsert_activity_data(rows)
+
+def snapshot(with_processed=True):
+    conn = database.get_db_connection()
+    try:
+        result = {
+            "time_entries": conn.execute("""
+                SELECT entry_date, application, task_description, total_seconds, time_units, source_hash, matter_code
+                FROM time_entries
+            """).fetchall(),
+            "entry_sources": conn.execute(
+                "SELECT source_hash, log_date, activity, document, time_spent_seconds FROM entry_sources"
+            ).fetchall(),
+            "canonical_names": conn.execute("SELECT activity, document, canonical_name FROM canonical_names").fetchall(),
+        }
+        if with_processed:
+            result["processed"] = conn.execute(
+                "SELECT log_date, activity, document FROM activity_log WHERE processed = 1"
+            ).fetchall()
+    finally:
+        conn.close()
+    return {name: sorted(map(list, rows), key=repr) for name, rows in result.items()}
+
+def report_lines(output):
+    """The data lines of a printed report (table rows and counts), as a sorted multiset."""
+    lines = Counter()
+    for line in output.splitlines():
+        line = line.rstrip()
+        if " | " in line and not line.startswith(("Date ", "Original Document")):
+            lines[line] += 1
+        elif line.startswith(("Records that would be processed:", "Unique task-day combinations:")):
+            lines[line] += 1
+    return sorted(f"{count} x {line}" for line, count in lines.items())
+
+def captured(fn, *args, **kwargs):
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        result = fn(*args, **kwargs)
+    return result, buffer.getvalue()
+
+def changed_rules(canonicalize):
+    """A rule change for the reprocess path: inboxes are filtered out, leases renamed."""
+    def changed(document, activity):
+        name = canonicalize(document, activity)
+        if name and name.startswith("Inbox"):
+            return None
+        return name.upper() if name and "Lease" in name else name
+    return changed
+
+def run():
+    workload = Workload(days=DAYS, rows_per_day=ROWS_PER_DAY, seed=SEED)
+    rows = workload.activity_rows()
+    dates = [str(d) for d in workload.dates()]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        fresh_database(tmp, "dry_run", rows)
+        _, output = captured(processor.process_all_data, debug=True)
+        results["dry_run"] = {"lines": report_lines(output), "written": snapshot()}
+
+        fresh_database(tmp, "process_all", rows)
+        captured(processor.process_all_data)
+        results["process_all"] = snapshot()
+
+        fresh_database(tmp, "per_date", rows)
+        for date_str in dates:
+            captured(processor.process_data_for_date, date_str)
+        results["per_date"] = snapshot(with_processed=False)
+
+        _, output = captured(processor.process_data_for_date, dates[CLEANING_DATE_INDEX], debug=True)
+        results["cleaning"] = report_lines(output)
+
+        canonicalize, rules_version = processor.canonicalize, processor.RULES_VERSION
+        processor.canonicalize, processor.RULES_VERSION = changed_rules(canonicalize), "check-changed-rules"
+        try:
+            summary, _ = captured(processor.reprocess_changed_rules)
+        finally:
+            processor.canonicalize, processor.RULES_VERSION = canonicalize, rules_version
+        results["reprocess"] = {"summary": summary, **snapshot(with_processed=False)}
+    # Through JSON, so tuples and lists compare equal to the recorded file
+    return json.loads(json.dumps(results, default=str))
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the processing engine against recorded legacy output.")
+    parser.add_argument("--record", action="store_true", help=f"Write the current output to {EXPECTED_PATH} instead of checking.")
+    args = parser.parse_args()
+
+    results = run()
+    if args.record:
+        os.makedirs(os.path.dirname(EXPECTED_PATH), exist_ok=True)
+        with gzip.open(EXPECTED_PATH, "wt", encoding="utf-8") as f:
+            json.dump(results, f, sort_keys=True, separators=(",", ":"))
+        print(f"Recorded {EXPECTED_PATH}")
+        return
+
+    with gzip.open(EXPECTED_PATH, "rt", encoding="utf-8") as f:
+        expected = json.load(f)
+    failed = []
+    for path, value in expected.items():
+        parts = value.items() if isinstance(value, dict) else [("", value)]
+        for part, expected_part in parts:
+            actual_part = results[path][part] if part else results[path]
+            ok = actual_part == expected_part
+            if not ok:
+                failed.append(f"{path} {part}".strip())
+            print(f"{path:<12} {part:<16} {'ok' if ok else 'DIFFERENT'}")
+    if failed:
+        sys.exit(f"Processing engine differs from the recorded legacy output in: {', '.join(failed)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Check that the PostgreSQL backend (storage_postgres.PostgresBackend) behaves like the SQLite
+one on the same synthetic workload. Needs a reachable PostgreSQL: set POSTGRES_DSN (any libpq
+connection string); without it the check is skipped. Everything is created in a throwaway
+schema that is dropped afterwards, so any database the role can create schemas in will do.
+
+Runs the workload through both backends and compares:
+  - upsert_activity_data (Postgres' COPY path), including a batch that repeats keys;
+  - the time entries and entry_sources processing writes through upsert_time_entries, for
+    all dates, again for one date marked for reprocessing, and after a rule change
+    (reprocess_changed_rules);
+  - get_entry_sources and delete_pending_time_entries;
+  - the matter index and a matter summary;
+  - bulk set_time_entries_status / confirm_time_entries / revert_processed_time_entries,
+    including the all-or-nothing ValueError on an unknown id;
+  - iter_rows streaming output for reports and raw activity.
+Exits non-zero if any of them differ.
+
+    POSTGRES_DSN=postgresql://localhost/rescuetime_check python benchmarks/check_postgres_backend.py
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+import jobs
+import processor
+import reporter
+import storage
+from benchmarks.workload import Workload
+
+ENTRY_COLUMNS = ("entry_date", "application", "task_description", "total_seconds", "time_units",
+                 "status", "notes", "matter_code", "source_hash", "rule_version")
+MATTER_COLUMNS = ("matter_code", "first_date", "last_date", "total_seconds", "entry_count")
+CONFIRMED_COLUMNS = ("entry_date", "application", "task_description", "time_units", "matter_code",
+                     "status", "notes", "source_hash")
+
+def ordered(rows):
+    # repr orders rows holding NULLs too
+    return sorted(rows, key=repr)
+
+def normalized(rows, columns):
+    """Rows as comparable tuples: REAL columns rounded (Postgres REAL is single precision)."""
+    return ordered(
+        tuple(round(row[c], 4) if isinstance(row[c], float) else (str(row[c]) if c.endswith("_date") else row[c])
+              for c in columns)
+        for row in rows
+    )
+
+def changed_rules(canonicalize):
+    """A rule change for reprocess_changed_rules: inboxes are filtered out, leases renamed."""
+    def changed(document, activity):
+        name = canonicalize(document, activity)
+        if name and name.startswith("Inbox"):
+            return None
+        return name.upper() if name and "Lease" in name else name
+    return changed
+
+def entry_sources(backend, entries):
+    """get_entry_sources of every entry, keyed by source hash (entry ids may differ)."""
+    results = {}
+    for entry in entries:
+        found = backend.get_entry_sources(entry["entry_id"])
+        sources = [tuple(sorted(source.items())) for source in found.pop("sources")]
+        found.pop("entry_id")
+        results[entry["source_hash"]] = (sorted(found.items()), ordered(sources))
+    return sorted(results.items())
+
+def query(backend, sql):
+    return ordered(backend.iter_rows(sql))
+
+def expect_value_error(fn, *args):
+    try:
+        fn(*args)
+    except ValueError:
+        return
+    raise AssertionError(f"{fn.__name__} accepted an unknown id")
+
+def run(backend, batches):
+    """Loads and processes the workload through backend; returns what the comparisons need."""
+    previous = storage.set_storage(backend)
+    try:
+        results = {}
+        results["upserted"] = sum(backend.upsert_activity_data(rows) for rows in batches)
+        results["activity"] = query(backend, """
+            SELECT log_date, time_spent_seconds, activity, category, productivity, document, processed
+            FROM activity_log
+        """)
+        with contextlib.redirect_stdout(io.StringIO()):
+            processor.process_all_data()
+        results["processed"] = query(backend, "SELECT log_date, activity, document, processed FROM activity_log")
+        entries = backend.get_pending_time_entries()
+        results["entries"] = normalized(entries, ENTRY_COLUMNS)
+        results["sources"] = query(backend, "SELECT source_hash, log_date, activity, document, time_spent_seconds FROM entry_sources")
+        results["entry_sources"] = entry_sources(backend, sorted(entries, key=lambda e: e["source_hash"])[:25])
+
+        first_date = results["activity"][0][0]
+        backend.mark_date_for_reprocessing(first_date)
+        with contextlib.redirect_stdout(io.StringIO()):
+            processor.process_data_for_date(first_date)
+        entries = backend.get_pending_time_entries()
+        results["reprocessed_date"] = normalized(entries, ENTRY_COLUMNS)
+
+        canonicalize, rules_version = processor.canonicalize, processor.RULES_VERSION
+        processor.canonicalize, processor.RULES_VERSION = changed_rules(canonicalize), "check-changed-rules"
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                results["rule_change"] = processor.reprocess_changed_rules()
+        finally:
+            processor.canonicalize, processor.RULES_VERSION = canonicalize, rules_version
+        entries = backend.get_pending_time_entries()
+        results["rule_change_entries"] = normalized(entries, ENTRY_COLUMNS)
+        results["rule_change_sources"] = query(backend, "SELECT source_hash, log_date, activity, document, time_spent_seconds FROM entry_sources")
+
+        stale = sorted(entry["source_hash"] for entry in entries)[:10]
+        results["deleted_pending"] = backend.delete_pending_time_entries(stale)
+        entries = backend.get_pending_time_entries()
+        results["after_delete"] = (normalized(entries, ENTRY_COLUMNS),
+                                   query(backend, "SELECT source_hash FROM entry_sources GROUP BY source_hash"))
+
+        index = backend.get_matter_index()
+        results["matter_index"] = normalized(index, MATTER_COLUMNS)
+        summary = backend.get_matter_summary(index[0]["matter_code"])
+        results["matter_summary"] = (normalized([summary], MATTER_COLUMNS + ("range_total_seconds",)),
+                                     normalized(summary["entries"], ("entry_date", "total_seconds")))
+
+        # Entry ids may differ between the backends; the source hash identifies an entry
+        by_hash = {entry["source_hash"]: entry for entry in entries}
+        hashes = sorted(by_hash)
+        ids = [by_hash[h]["entry_id"] for h in hashes]
+        unknown = max(ids) + 1000
+
+        expect_value_error(backend.set_time_entries_status, ids[:5] + [unknown], "ignored")
+        results["after_failed_ignore"] = normalized(backend.get_pending_time_entries(), ENTRY_COLUMNS)
+        results["ignored"] = backend.set_time_entries_status(ids[:5], "ignored")
+
+        to_confirm = [{**by_hash[h], "original_entry_id": by_hash[h]["entry_id"], "status": "submitted"} for h in hashes[5:15]]
+        expect_value_error(backend.confirm_time_entries, to_confirm + [{**to_confirm[0], "original_entry_id": unknown}])
+        results["after_failed_confirm"] = normalized(backend.get_processed_time_entries(), CONFIRMED_COLUMNS)
+        confirmed = backend.confirm_time_entries(to_confirm)
+        results["confirmed"] = normalized(confirmed, CONFIRMED_COLUMNS)
+
+        processed_ids = [row["id"] for row in confirmed]
+        expect_value_error(backend.revert_processed_time_entries, processed_ids[:3] + [max(processed_ids) + 1000])
+        results["after_failed_revert"] = normalized(backend.get_processed_time_entries(), CONFIRMED_COLUMNS)
+        reverted = backend.revert_processed_time_entries(processed_ids[:3])
+        id_to_hash = {entry_id: h for h, entry_id in zip(hashes, ids)}
+        results["reverted"] = sorted(id_to_hash[entry_id] for entry_id in reverted)
+        results["statuses"] = query(backend, "SELECT source_hash, status FROM time_entries")
+
+        first, last = results["entries"][0][0], results["entries"][-1][0]
+        for group_by in (None, "matter_code,status"):
+            sql, params, columns = reporter.build_report_query(first, last, group_by)
+            rows = list(backend.iter_rows(sql, params, chunk_rows=97))
+            if "entry_id" in columns:
+                index = columns.index("entry_id")
+                rows = [row[:index] + (id_to_hash.get(row[index]),) + row[index + 1:] for row in rows]
+            results[f"report:{group_by}"] = ordered(
+                tuple(round(value, 4) if isinstance(value, float) else value for value in row) for row in rows
+            )
+        return results
+    finally:
+        storage.set_storage(previous)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the PostgreSQL backend with SQLite on a synthetic workload.")
+    parser.add_argument("--days", type=int, default=10)
+    parser.add_argument("--rows-per-day", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    dsn = os.getenv("POSTGRES_DSN")
+    if not dsn:
+        print("POSTGRES_DSN is not set; skipping the PostgreSQL backend check.")
+        return
+
+    import psycopg
+    from storage_postgres import PostgresBackend
+
+    batches = [jobs.activity_rows_from_response(date_str, payload)
+               for _, date_str, payload in Workload(days=args.days, rows_per_day=args.rows_per_day, seed=args.seed)]
+    # A refetch of the first day with changed seconds: later rows replace earlier ones
+    batches.append([(row[0], row[1] + 60, *row[2:]) for row in batches[0]])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_FILE = os.path.join(tmp, "check.db")
+        sqlite_backend = storage.SqliteBackend()
+        with contextlib.redirect_stdout(io.StringIO()):
+            sqlite_backend.initialize()
+        expected = run(sqlite_backend, batches)
+
+    schema = f"check_{uuid.uuid4().hex[:12]}"
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        conn.execute(f"CREATE SCHEMA {schema}")
+    postgres_backend = PostgresBackend(psycopg.conninfo.make_conninfo(dsn, options=f"-c search_path={schema}"))
+    try:
+        postgres_backend.initialize()
+        actual = run(postgres_backend, batches)
+    finally:
+        postgres_backend.close()
+        with psycopg.connect(dsn, autocommit=True) as conn:
+            conn.execute(f"DROP SCHEMA {schema} CASCADE")
+
+    failed = [name for name in expected if expected[name] != actual[name]]
+    for name in expected:
+        print(f"{name:<22} {'ok' if name not in failed else 'DIFFERENT'}")
+    if failed:
+        sys.exit(f"PostgreSQL backend differs from SQLite in: {', '.join(failed)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Benchmark suite for the processing pipeline and the API read endpoints.
+
+Generates a seeded synthetic workload (see workload.py), loads it into a throwaway
+database and times:
+
+  - processor.get_canonical_name / extract_matter_code over every generated title
+  - database.upsert_activity_data for the whole workload
+  - processor.process_all_data over the freshly upserted rows
+  - GET requests against the API's read endpoints (needs fastapi + httpx)
+
+Results are written as JSON so runs can be compared; pass --compare with an earlier
+result file to print the change per benchmark.
+
+    python benchmarks/run_benchmarks.py --days 60 --output before.json
+    python benchmarks/run_benchmarks.py --days 60 --compare before.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+import database
+import processor
+from benchmarks.workload import Workload
+
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+def measure(fn, rounds, setup=None):
+    """
+    Calls fn() `rounds` times (after setup(), if given, which is not timed) and returns
+    timing stats in milliseconds. The pipeline's progress output is swallowed.
+    """
+    timings = []
+    for _ in range(rounds):
+        if setup:
+            with contextlib.redirect_stdout(io.StringIO()):
+                setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "rounds": rounds,
+        "min_ms": round(timings[0], 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "p95_ms": round(timings[math.ceil(len(timings) * 0.95) - 1], 3),
+        "stdev_ms": round(statistics.stdev(timings), 3) if len(timings) > 1 else 0.0,
+    }
+
+def bench_text_functions(documents, rounds):
+    results = {}
+
+    def canonical_names():
+        for doc, activity in documents:
+            processor.get_canonical_name(doc, activity)
+    results["get_canonical_name"] = measure(canonical_names, rounds)
+
+    names = [processor.get_canonical_name(doc, activity) or doc for doc, activity in documents]
+
+    def matter_codes():
+        for name in names:
+            processor.extract_matter_code(name)
+    results["extract_matter_code"] = measure(matter_codes, rounds)
+
+    for stats in results.values():
+        stats["calls_per_round"] = len(documents)
+        stats["us_per_call"] = round(stats["median_ms"] * 1000 / len(documents), 3)
+    return results
+
+def reset_database(path):
+    if os.path.exists(path):
+        os.remove(path)
+    database.DB_FILE = path
+    database.initialize_database()
+
+def bench_pipeline(path, rows, rounds):
+    """Times upsert_activity_data and process_all_data, each against a fresh database."""
+    results = {}
+    results["upsert_activity_data"] = measure(
+        lambda: database.upsert_activity_data(rows),
+        rounds,
+        setup=lambda: reset_database(path),
+    )
+
+    def load():
+        reset_database(path)
+        database.upsert_activity_data(rows)
+    results["process_all_data"] = measure(processor.process_all_data, rounds, setup=load)
+
+    results["upsert_activity_data"]["rows"] = len(rows)
+    results["process_all_data"]["rows"] = len(rows)
+    # Leave the database processed for the API benchmarks
+    with contextlib.redirect_stdout(io.StringIO()):
+        load()
+        processor.process_all_data()
+    return results
+
+def bench_api(dates, rounds):
+    """Times the read endpoints through FastAPI's TestClient; skipped when it is unavailable."""
+    try:
+        from fastapi.testclient import TestClient
+        import api
+    except ImportError as e:
+        print(f"Skipping API benchmarks: {e}")
+        return {}
+
+    client = TestClient(api.app)
+    busiest = dates[-1]
+    first, last = dates[0], dates[-1]
+    endpoints = {
+        "GET /api/time_entries": f"/api/time_entries?date={busiest}",
+        "GET /api/processed_time_entries": f"/api/processed_time_entries?date={busiest}",
+        "GET /api/matters": "/api/matters",
+        "GET /api/search": f"/api/search?q=Trust Deed&start_date={first}&end_date={last}",
+        "GET /api/reports/export": f"/api/reports/export?start_date={first}&end_date={last}&group_by=matter_code",
+    }
+    results = {}
+    for name, url in endpoints.items():
+        def call(url=url):
+            response = client.get(url)
+            response.raise_for_status()
+        results[name] = measure(call, rounds)
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current, previous_path):
+    """Prints the median change of every benchmark present in both runs."""
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\nCompared with {previous_path} ({previous.get('git_revision') or 'unknown revision'}):")
+    for name, stats in current["benchmarks"].items():
+        before = previous.get("benchmarks", {}).get(name)
+        if not before:
+            print(f"  {name:<36} (new)")
+            continue
+        change = (stats["median_ms"] - before["median_ms"]) / before["median_ms"] * 100 if before["median_ms"] else 0.0
+        print(f"  {name:<36} {before['median_ms']:10.2f} -> {stats['median_ms']:10.2f} ms   {change:+6.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark processing and API reads over a synthetic workload.")
+    parser.add_argument("--days", type=int, default=20, help="Working days of data to generate (default: 20).")
+    parser.add_argument("--users", type=int, default=1, help="Users to generate text for (default: 1); the pipeline runs on user 0.")
+    parser.add_argument("--rows-per-day", type=int, default=300, help="RescueTime rows per day (default: 300).")
+    parser.add_argument("--rounds", type=int, default=5, help="Timed rounds per benchmark (default: 5).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-api", action="store_true", help="Do not benchmark the API endpoints.")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<timestamp>.json).")
+    parser.add_argument("--compare", help="Earlier result file to compare against.")
+    args = parser.parse_args()
+
+    workload = Workload(days=args.days, users=args.users, rows_per_day=args.rows_per_day, seed=args.seed)
+    documents = workload.documents()
+    rows = workload.activity_rows(user=0)
+    print(f"Workload: {args.days} day(s), {args.users} user(s), {len(documents):,} titles, {len(rows):,} rows for the pipeline")
+
+    benchmarks = {}
+    benchmarks.update(bench_text_functions(documents, args.rounds))
+    with tempfile.TemporaryDirectory() as tmp:
+        benchmarks.update(bench_pipeline(os.path.join(tmp, "bench.db"), rows, args.rounds))
+        if not args.skip_api:
+            benchmarks.update(bench_api([d.isoformat() for d in workload.dates()], args.rounds))
+
+    for name, stats in benchmarks.items():
+        print(f"{name:<36} median {stats['median_ms']:10.2f} ms   p95 {stats['p95_ms']:10.2f} ms")
+
+    result = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "workload": {"days": args.days, "users": args.users, "rows_per_day": args.rows_per_day, "seed": args.seed},
+        "benchmarks": benchmarks,
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(result, args.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
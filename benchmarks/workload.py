@@ -0,0 +1,179 @@
+"""
+Seeded generator for synthetic RescueTime workloads.
+
+Produces payloads shaped like the RescueTime analytic API response used by the fetch job
+({"row_headers": [...], "rows": [[rank, seconds, people, activity, document, category,
+productivity], ...]}), with the kinds of titles the processor has to cope with: Word
+documents carrying matter codes in their various spellings, Read-Only / Compatibility Mode
+suffixes, Preview PDFs with page-number noise, browser and mail titles, and vague names
+that should be filtered out. The same seed always yields the same workload, so benchmark
+runs are comparable.
+
+    from benchmarks.workload import Workload
+    for user, date_str, payload in Workload(days=30, users=2, seed=7):
+        ...
+"""
+import random
+from datetime import date, timedelta
+
+import jobs
+
+ROW_HEADERS = ["Rank", "Time Spent (seconds)", "Number of People", "Activity", "Document", "Category", "Productivity"]
+
+CLIENTS = ["Smith", "Nguyen", "Patel", "Okafor", "Rossi", "Kowalski", "Haddad", "Jensen", "Moreau", "Tanaka"]
+DOC_TYPES = ["Trust_Deed", "Contract_Review", "Letter_of_Advice", "Statement_of_Claim", "Will", "Lease", "Memo"]
+EXTENSIONS = [".docx", ".pdf", ".xlsx"]
+
+# How people name matter documents; the code is not always delimited where the extractor looks
+BASE_NAME_FORMATS = [
+    "{doc_type}_{client}_{matter}",
+    "{doc_type}_{matter}_{client}",
+    "{client} {matter} {doc_type}",
+    "{matter}_{doc_type}_{client}",
+]
+
+VAGUE_TITLES = [
+    "No Details", "Paste", "New Tab", "Untitled", "Reminders", "Calendar", "Microsoft Teams",
+    "Styles", "Downloads", "Document1", "Document4", "1 Reminder", "Search, Suggestions",
+]
+BROWSER_TITLES = [
+    "Inbox ({n} unread) - Google Chrome",
+    "Matter {matter} - {client} - Client Portal - Google Chrome",
+    "ASIC Connect - Company search {matter} - Google Chrome",
+    "Portal - Analytics",
+    "LinkedIn - Microsoft​ Edge",
+    "Court listings — Mozilla Firefox",
+]
+MAIL_TITLES = [
+    "RE: {client} {matter} advice",
+    "FW: Draft {doc_type} for review",
+    "Inbox ({n} unread)",
+]
+
+# Workloads end on a fixed date by default so a seed describes exactly the same data on any day
+DEFAULT_END_DATE = date(2025, 6, 30)
+
+# (activity, category, productivity, relative weight)
+APPLICATIONS = [
+    ("microsoft word", "Writing", 2, 40),
+    ("Preview", "Reading", 1, 20),
+    ("Google Chrome", "Browsers", 0, 20),
+    ("Microsoft Outlook", "Email", 1, 12),
+    ("Microsoft Excel", "Spreadsheets", 1, 8),
+]
+
+def build_document_pool(rng, total_days, matters_per_year=150, first_matter=20000):
+    """
+    Returns a list of (first_day, last_day, matter, client, base_name) tuples: matters that are
+    each open for a few weeks with several documents, so titles recur across days the way
+    real client work does.
+    """
+    years = max(1, round(total_days / 365))
+    pool = []
+    for matter in range(first_matter, first_matter + matters_per_year * years):
+        client = rng.choice(CLIENTS)
+        opened = rng.randrange(max(total_days, 1))
+        closed = opened + rng.randint(10, 120)
+        for _ in range(rng.randint(3, 8)):
+            doc_type = rng.choice(DOC_TYPES)
+            base_name = rng.choice(BASE_NAME_FORMATS).format(doc_type=doc_type, client=client, matter=matter)
+            pool.append((opened, closed, str(matter), client, base_name))
+    return pool
+
+def _word_title(rng, base_name, matter):
+    title = base_name + ".docx"
+    roll = rng.random()
+    if roll < 0.15:
+        title = title.replace(f"_{matter}", f"_[{matter}]")
+    elif roll < 0.30:
+        title += " - Read-Only"
+    elif roll < 0.38:
+        title += "  -  Compatibility Mode"
+    return title
+
+def _preview_title(rng, base_name):
+    if rng.random() < 0.8:
+        pages = rng.randint(2, 40)
+        return f"{base_name}.pdf – Page {rng.randint(1, pages)} of {pages}"
+    return f"{base_name}.pdf – {rng.randint(2, 40)} pages"
+
+def generate_day(rng, day_offset, pool, rows_per_day, active_matters=12):
+    """Generates the RescueTime rows for one day of work."""
+    active = [doc for doc in pool if doc[0] <= day_offset <= doc[1]] or pool[:active_matters]
+    worked = rng.sample(active, min(len(active), active_matters * 4))
+    weights = [app[3] for app in APPLICATIONS]
+
+    rows = {}
+    attempts = 0
+    while len(rows) < rows_per_day and attempts < rows_per_day * 4:
+        attempts += 1
+        activity, category, productivity, _ = rng.choices(APPLICATIONS, weights)[0]
+        _, _, matter, client, base_name = rng.choice(worked)
+        if rng.random() < 0.08:
+            document = rng.choice(VAGUE_TITLES)
+        elif activity == "microsoft word":
+            document = _word_title(rng, base_name, matter)
+        elif activity == "Preview":
+            document = _preview_title(rng, base_name)
+        elif activity == "Microsoft Excel":
+            document = f"{base_name}.xlsx"
+        else:
+            template = rng.choice(BROWSER_TITLES if activity == "Google Chrome" else MAIL_TITLES)
+            document = template.format(n=rng.randint(1, 40), matter=matter, client=client, doc_type=rng.choice(DOC_TYPES))
+        # RescueTime reports one row per (activity, document); keep the first occurrence
+        rows.setdefault((activity, document), [activity, document, category, productivity, 0])
+        rows[(activity, document)][4] += int(rng.expovariate(1 / 240)) + 5
+
+    ranked = sorted(rows.values(), key=lambda row: row[4], reverse=True)
+    return {
+        "row_headers": ROW_HEADERS,
+        "rows": [
+            [rank, seconds, 1, activity, document, category, productivity]
+            for rank, (activity, document, category, productivity, seconds) in enumerate(ranked, start=1)
+        ],
+    }
+
+class Workload:
+    """
+    Iterates (user, date_str, payload) over `days` working days for `users` users.
+    Each user has their own document pool; weekends are skipped unless include_weekends is set.
+    """
+
+    def __init__(self, days=30, users=1, rows_per_day=300, seed=42, end_date=DEFAULT_END_DATE, include_weekends=False):
+        self.days = days
+        self.users = users
+        self.rows_per_day = rows_per_day
+        self.seed = seed
+        self.end_date = end_date
+        self.include_weekends = include_weekends
+
+    def dates(self):
+        """The working dates covered, oldest first."""
+        dates = []
+        day = self.end_date
+        while len(dates) < self.days:
+            if self.include_weekends or day.weekday() < 5:
+                dates.append(day)
+            day -= timedelta(days=1)
+        return dates[::-1]
+
+    def __iter__(self):
+        dates = self.dates()
+        total_days = (dates[-1] - dates[0]).days + 1
+        for user in range(self.users):
+            rng = random.Random(f"{self.seed}-{user}")
+            pool = build_document_pool(rng, total_days)
+            for day in dates:
+                yield user, day.isoformat(), generate_day(rng, (day - dates[0]).days, pool, self.rows_per_day)
+
+    def activity_rows(self, user=0):
+        """All of one user's rows, converted the way the fetch job stores them in activity_log."""
+        rows = []
+        for row_user, date_str, payload in self:
+            if row_user == user:
+                rows.extend(jobs.activity_rows_from_response(date_str, payload))
+        return rows
+
+    def documents(self):
+        """Every (document, activity) pair in the workload, for micro-benchmarks."""
+        return [(row[4], row[3]) for _, _, payload in self for row in payload["rows"]]
@@ -1,6 +1,17 @@
 import sqlite3
+import hashlib
 import os
+import re
+from contextvars import ContextVar
 from datetime import datetime, timedelta, date
+from pathlib import Path
+from instrumentation import get_logger, stage
+import migrations
+import read_cache
+import similarity
+import writer
+
+logger = get_logger(__name__)
 
 def convert_db_entry_to_dict(row):
     """Convert database row to dict with proper date conversion for Pydantic."""
@@ -19,21 +30,102 @@ def convert_db_entry_to_dict(row):
 
 DB_FILE = "/Users/andrewandreyev/Library/CloudStorage/OneDrive-SYNTAQ/Documents SYN/Coding/RescueTime DB/rescuetime.db"
 
-def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DB_FILE, timeout=10.0)
+# Database file for the current context. tenants.tenant_context() points it at a user's shard;
+# unset, every connection goes to DB_FILE.
+_db_file_override = ContextVar("db_file_override", default=None)
+
+# Local-first mode (see replication.py) installs a function mapping a database path (DB_FILE
+# or a tenant shard, which then become replicas) to the live copy on local disk
+_live_path_resolver = None
+
+def live_db_file(path):
+    """The file actually opened for the database at path: itself, or its local copy in local-first mode."""
+    return _live_path_resolver(path) if _live_path_resolver else path
+
+def current_db_file():
+    """The database file connections in this context go to (a tenant shard or DB_FILE)."""
+    return live_db_file(_db_file_override.get() or DB_FILE)
+
+def get_db_connection(check_same_thread=True, db_file=None):
+    """
+    Establishes a connection to the SQLite database: db_file if given, otherwise the current
+    context's database (see current_db_file()).
+    Pass check_same_thread=False for connections handed across threads (e.g. streamed responses).
+    """
+    path = live_db_file(db_file) if db_file else current_db_file()
+    conn = sqlite3.connect(path, timeout=10.0, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
     return conn
 
+def _write(fn, *args, db_file=None):
+    """
+    Runs fn(cursor, *args) as one write to db_file (default: the current context's database)
+    through writer.py: group-committed on the writer thread when it is running (the API
+    server), otherwise in a transaction of its own. Returns fn's result; if fn raises,
+    nothing it did is kept.
+    """
+    return writer.execute(live_db_file(db_file) if db_file else current_db_file(), fn, *args)
+
+def _write_entries(fn, *args, db_file=None):
+    """
+    _write for mutations of time_entries / processed_time_entries: fn(cursor, entry_dates, *args)
+    adds the entry_date of every entry it changes to the entry_dates set (None for all of
+    them). A write that changed entries also bumps the entry write counter in the same
+    transaction; once it has committed, those dates are dropped from the API's read cache.
+    """
+    entry_dates = set()
+
+    def write(cursor, *args):
+        result = fn(cursor, entry_dates, *args)
+        return result, _count_entry_write(cursor) if entry_dates else None
+
+    result, write_count = _write(write, *args, db_file=db_file)
+    read_cache.invalidate(live_db_file(db_file) if db_file else current_db_file(), entry_dates, write_count)
+    return result
+
+# update_metadata key of the number of committed writes to time_entries / processed_time_entries,
+# from any process. The API's read cache compares it before serving (see read_cache.py).
+ENTRY_WRITE_COUNT_KEY = "entry_write_count"
+
+def _count_entry_write(cursor):
+    """Bumps the entry write counter inside the caller's transaction and returns its new value."""
+    cursor.execute("""
+        INSERT INTO update_metadata (key, value, updated_at)
+        VALUES (?, '1', CURRENT_TIMESTAMP)
+        ON CONFLICT(key) DO UPDATE SET
+            value = CAST(value AS INTEGER) + 1,
+            updated_at = CURRENT_TIMESTAMP
+    """, (ENTRY_WRITE_COUNT_KEY,))
+    cursor.execute("SELECT value FROM update_metadata WHERE key = ?", (ENTRY_WRITE_COUNT_KEY,))
+    return int(cursor.fetchone()[0])
+
+def get_entry_write_count(db_file=None):
+    """The entry write counter of db_file (default: the current context's database); 0 before the first write."""
+    conn = get_db_connection(db_file=db_file)
+    try:
+        row = conn.execute("SELECT value FROM update_metadata WHERE key = ?", (ENTRY_WRITE_COUNT_KEY,)).fetchone()
+    finally:
+        conn.close()
+    return int(row[0]) if row else 0
+
+def entries_rewritten():
+    """
+    Records a change to entries of any date made outside _write_entries (a migration
+    backfill): bumps the entry write counter and drops every cached list of the database.
+    """
+    read_cache.invalidate(current_db_file(), None, _write(_count_entry_write))
+
 def initialize_database():
     """Initializes the database and creates tables with enhanced schema."""
-    if os.path.exists(DB_FILE):
+    if os.path.exists(current_db_file()):
         print("Database already exists.")
     else:
         print("Creating new database...")
     
     conn = get_db_connection()
     cursor = conn.cursor()
+    # Lets `compact` return freed pages to the file system (only takes effect on a new, empty database)
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
     
     # Enhanced activity_log table with processing tracking
     cursor.execute("""
@@ -63,11 +155,38 @@ def initialize_database():
         status TEXT NOT NULL DEFAULT 'pending',
         notes TEXT,
         matter_code TEXT,
-        source_hash TEXT NOT NULL UNIQUE,
+        source_hash TEXT NOT NULL,  -- legacy MD5 key, still returned to clients; lookups use source_key
+        source_key INTEGER NOT NULL,  -- source_key(source_hash), unique (idx_time_entries_source_key)
+        rule_version TEXT,  -- processor.RULES_VERSION of the rules that produced the entry
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )
     """)
+    # Canonical name each raw (activity, document) pair had when it was last processed, and
+    # under which rule version; `reprocess --changed-rules` diffs new rules against it
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS canonical_names (
+        activity TEXT NOT NULL,
+        document TEXT NOT NULL,
+        canonical_name TEXT,  -- NULL when the rules filter the document out
+        rule_version TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (activity, document)
+    )
+    """)
+
+    # Lineage: the raw activity_log rows (and their seconds) aggregated into each time entry,
+    # keyed by the entry's source_hash so an entry's sources are one index range scan
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS entry_sources (
+        source_hash TEXT NOT NULL,
+        log_date TEXT NOT NULL,
+        activity TEXT NOT NULL,
+        document TEXT NOT NULL,
+        time_spent_seconds INTEGER NOT NULL,
+        PRIMARY KEY (source_hash, log_date, activity, document)
+    ) WITHOUT ROWID
+    """)
     
     # Processed time entries table
     cursor.execute("""
@@ -82,11 +201,11 @@ def initialize_database():
         status TEXT NOT NULL DEFAULT 'submitted',
         notes TEXT,
         source_hash TEXT NOT NULL,
+        source_key INTEGER NOT NULL,  -- unique per entry_date (idx_processed_time_entries_source_key)
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         submitted_to_alp_at TIMESTAMP,
         alp_entry_id TEXT,
-        UNIQUE(source_hash, entry_date),
         FOREIGN KEY (original_entry_id) REFERENCES time_entries (entry_id)
     )
     """)
@@ -99,135 +218,1435 @@ def initialize_database():
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )
     """)
-    
-    # Add indexes for performance
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_activity_log_processed ON activity_log(processed)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_activity_log_date ON activity_log(log_date)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_time_entries_date ON time_entries(entry_date)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_time_entries_matter ON time_entries(matter_code)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_processed_time_entries_date ON processed_time_entries(entry_date)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_processed_time_entries_matter ON processed_time_entries(matter_code)")
-    
-    conn.commit()
-    conn.close()
-    print("Database initialized successfully.")
+    
+    # Per-matter rollup of time_entries, maintained by the processor on every upsert
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS matter_index (
+        matter_code TEXT PRIMARY KEY,
+        first_date TEXT NOT NULL,
+        last_date TEXT NOT NULL,
+        total_seconds INTEGER NOT NULL,
+        entry_count INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    
+    # Persisted ALP lookups (matters, outcomes, components) so the cache survives restarts
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS alp_cache (
+        cache_key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        fetched_at REAL NOT NULL
+    )
+    """)
+    
+    # Outbox of time entries waiting to be posted to ALP by the submission worker
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS alp_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        idempotency_key TEXT NOT NULL UNIQUE,
+        processed_entry_id INTEGER,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',  -- pending, in_flight, sent, dead
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        last_error TEXT,
+        alp_entry_id TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (processed_entry_id) REFERENCES processed_time_entries (id)
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_alp_outbox_due ON alp_outbox(status, next_attempt_at)")
+    
+    # Users of a multi-tenant deployment; only read from the main database (see tenants.py)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS tenants (
+        user_id TEXT PRIMARY KEY,
+        display_name TEXT,
+        rescuetime_api_key TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    
+    # Full-text search over entry descriptions/notes and raw document titles
+    create_search_tables(cursor)
+    # Per-day summaries of compacted raw rows (before the rollup triggers that read them)
+    create_retention_tables(cursor)
+    # Daily category / productivity / matter rollups behind /api/analytics
+    create_analytics_tables(cursor)
+    # MinHash signatures of task descriptions for near-duplicate clustering
+    create_similarity_tables(cursor)
+    
+    # Add indexes for performance
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_activity_log_processed ON activity_log(processed)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_activity_log_date ON activity_log(log_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_time_entries_date ON time_entries(entry_date)")
+    # Covering index for per-matter lookups: entry ids (rowid), dates and seconds without touching the table.
+    # Supersedes the original single-column idx_time_entries_matter.
+    cursor.execute("DROP INDEX IF EXISTS idx_time_entries_matter")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_time_entries_matter_date ON time_entries(matter_code, entry_date, total_seconds)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_processed_time_entries_date ON processed_time_entries(entry_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_processed_time_entries_matter ON processed_time_entries(matter_code)")
+    
+    # Backfill the matter index for databases created before it existed
+    cursor.execute("SELECT 1 FROM matter_index LIMIT 1")
+    if cursor.fetchone() is None:
+        rebuild_matter_index(cursor)
+    
+    conn.commit()
+    conn.close()
+
+    # Brings databases created by older versions up to date (a no-op on new ones)
+    applied = migrations.migrate()
+    if applied:
+        print(f"Applied migrations {', '.join(map(str, applied))} (schema version {migrations.LATEST_VERSION}).")
+    print("Database initialized successfully.")
+
+# --- Integer source keys ---
+#
+# Time entries are identified by source_hash, the MD5 hex of (date, application, task). Upserts
+# and lookups go through source_key instead: the first 8 bytes of a keyed BLAKE2b of source_hash,
+# as a signed 64-bit integer, so the unique indexes compare integers rather than 32-char strings.
+# The key is derived from source_hash itself, so existing rows (and processed entries whose
+# original is gone) can be backfilled, and every backend and client keeps the same source_hash.
+SOURCE_KEY_HASH_KEY = b"rescuetime.source_key.v1"
+
+def source_key(source_hash):
+    digest = hashlib.blake2b(source_hash.encode("utf-8"), digest_size=8, key=SOURCE_KEY_HASH_KEY).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+def _fill_source_keys(cursor, table, pairs):
+    """
+    Until migration 2 (migrations.py) has backfilled source_key, rows of older databases have
+    none, and upserts and lookups by key would not find them. Gives the rows with these
+    (source_key, source_hash) pairs their key first; once the backfill is done this is a
+    single index probe.
+    """
+    cursor.execute(f"SELECT 1 FROM {table} WHERE source_key IS NULL LIMIT 1")
+    if cursor.fetchone() is not None:
+        cursor.executemany(f"UPDATE {table} SET source_key = ? WHERE source_hash = ? AND source_key IS NULL", pairs)
+
+def _check_source_key_collisions(cursor, table, rows, key_index, hash_index):
+    """
+    Called when an upsert changed fewer rows than it was given: the conflict clause skips a
+    row whose source_key is taken by a different source_hash. Raises IntegrityError naming them.
+    """
+    collisions = []
+    for row in rows:
+        cursor.execute(f"SELECT DISTINCT source_hash FROM {table} WHERE source_key = ?", (row[key_index],))
+        collisions.extend(
+            (row[hash_index], existing[0], row[key_index]) for existing in cursor.fetchall() if existing[0] != row[hash_index]
+        )
+    if collisions:
+        details = "; ".join(f"{new} vs {existing} -> {key}" for new, existing, key in collisions[:5])
+        logger.error("source_key collision in %s: %s", table, details)
+        raise sqlite3.IntegrityError(f"source_key collision in {table}: {details}")
+
+def create_search_tables(cursor):
+    """
+    Creates the FTS5 indexes and the triggers that keep them in sync with their content tables.
+    Both are external-content tables, so the text itself is only stored once.
+    Existing rows are indexed the first time the tables are created.
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('time_entries_fts', 'document_catalog_fts')")
+    existing = {row[0] for row in cursor.fetchall()}
+
+    cursor.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS time_entries_fts USING fts5(
+        task_description, notes,
+        content='time_entries', content_rowid='entry_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS time_entries_fts_insert AFTER INSERT ON time_entries BEGIN
+        INSERT INTO time_entries_fts (rowid, task_description, notes)
+        VALUES (new.entry_id, new.task_description, new.notes);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS time_entries_fts_delete AFTER DELETE ON time_entries BEGIN
+        INSERT INTO time_entries_fts (time_entries_fts, rowid, task_description, notes)
+        VALUES ('delete', old.entry_id, old.task_description, old.notes);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS time_entries_fts_update AFTER UPDATE OF task_description, notes ON time_entries BEGIN
+        INSERT INTO time_entries_fts (time_entries_fts, rowid, task_description, notes)
+        VALUES ('delete', old.entry_id, old.task_description, old.notes);
+        INSERT INTO time_entries_fts (rowid, task_description, notes)
+        VALUES (new.entry_id, new.task_description, new.notes);
+    END
+    """)
+
+    # Raw documents are searched through a catalog of distinct (activity, document) pairs:
+    # the same title recurs on many days, so ranking the catalog is far cheaper than
+    # ranking every raw row, and time is then summed per hit via idx_activity_log_document.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS document_catalog (
+        doc_id INTEGER PRIMARY KEY,
+        activity TEXT NOT NULL,
+        document TEXT NOT NULL,
+        UNIQUE(activity, document)
+    )
+    """)
+    cursor.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS document_catalog_fts USING fts5(
+        document,
+        content='document_catalog', content_rowid='doc_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS document_catalog_fts_insert AFTER INSERT ON document_catalog BEGIN
+        INSERT INTO document_catalog_fts (rowid, document) VALUES (new.doc_id, new.document);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS activity_log_catalog_insert AFTER INSERT ON activity_log
+    WHEN new.document IS NOT NULL BEGIN
+        INSERT OR IGNORE INTO document_catalog (activity, document) VALUES (new.activity, new.document);
+    END
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_activity_log_document ON activity_log(activity, document, log_date, time_spent_seconds)")
+
+    if 'time_entries_fts' not in existing:
+        cursor.execute("INSERT INTO time_entries_fts (time_entries_fts) VALUES ('rebuild')")
+    if 'document_catalog_fts' not in existing:
+        cursor.execute("""
+            INSERT OR IGNORE INTO document_catalog (activity, document)
+            SELECT DISTINCT activity, document FROM activity_log WHERE document IS NOT NULL
+        """)
+
+# --- Analytics rollups (see analytics.py) ---
+#
+# activity_rollup_daily holds the seconds and row count of activity_log per (log_date,
+# category, productivity); triggers on activity_log keep it current with every insert,
+# update and delete. matter_rollup_daily splits the raw time behind each day's time entries
+# by (matter_code, productivity), following entry_sources; it changes with the entries'
+# lineage, so the writes that replace lineage refresh it for the dates they touched
+# (refresh_matter_rollup). Uncategorized rows are stored under category '' and entries
+# without a matter under matter_code ''.
+
+ACTIVITY_ROLLUP_KEY = "coalesce({row}.category, ''), coalesce({row}.productivity, 0)"
+
+def create_analytics_tables(cursor):
+    """Creates the analytics rollup tables and the triggers that maintain activity_rollup_daily."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS activity_rollup_daily (
+        log_date TEXT NOT NULL,
+        category TEXT NOT NULL,
+        productivity INTEGER NOT NULL,
+        total_seconds INTEGER NOT NULL,
+        row_count INTEGER NOT NULL,
+        PRIMARY KEY (log_date, category, productivity)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS matter_rollup_daily (
+        log_date TEXT NOT NULL,
+        matter_code TEXT NOT NULL,
+        productivity INTEGER NOT NULL,
+        total_seconds INTEGER NOT NULL,
+        PRIMARY KEY (log_date, matter_code, productivity)
+    ) WITHOUT ROWID
+    """)
+
+    add_new = f"""
+        INSERT INTO activity_rollup_daily (log_date, category, productivity, total_seconds, row_count)
+        VALUES (new.log_date, {ACTIVITY_ROLLUP_KEY.format(row="new")}, new.time_spent_seconds, 1)
+        ON CONFLICT(log_date, category, productivity) DO UPDATE SET
+            total_seconds = total_seconds + excluded.total_seconds,
+            row_count = row_count + 1;
+    """
+    old_key = "log_date = old.log_date AND category = coalesce(old.category, '') AND productivity = coalesce(old.productivity, 0)"
+    remove_old = f"""
+        UPDATE activity_rollup_daily
+        SET total_seconds = total_seconds - old.time_spent_seconds, row_count = row_count - 1
+        WHERE {old_key};
+        DELETE FROM activity_rollup_daily WHERE {old_key} AND row_count <= 0;
+    """
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS activity_rollup_insert AFTER INSERT ON activity_log BEGIN {add_new} END")
+    # Rows removed by compaction stay counted: their time is in activity_log_compacted
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS activity_rollup_delete AFTER DELETE ON activity_log
+    WHEN NOT EXISTS (SELECT 1 FROM activity_log_compacted WHERE log_date = old.log_date)
+    BEGIN {remove_old} END
+    """)
+    # Re-fetching a day rewrites every row, mostly with the same values; those are skipped
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS activity_rollup_update
+    AFTER UPDATE OF log_date, time_spent_seconds, category, productivity ON activity_log
+    WHEN old.log_date IS NOT new.log_date OR old.time_spent_seconds IS NOT new.time_spent_seconds
+        OR old.category IS NOT new.category OR old.productivity IS NOT new.productivity
+    BEGIN {remove_old} {add_new} END
+    """)
+
+def rebuild_activity_rollup(cursor, dates):
+    """Recomputes activity_rollup_daily for these dates from activity_log and the compacted summaries."""
+    params = [(date_str,) for date_str in dates]
+    cursor.executemany("DELETE FROM activity_rollup_daily WHERE log_date = ?", params)
+    cursor.executemany(f"""
+        WITH day_rows (log_date, category, productivity, seconds, row_count) AS (
+            SELECT log_date, {ACTIVITY_ROLLUP_KEY.format(row="activity_log")}, time_spent_seconds, 1
+            FROM activity_log
+            WHERE log_date = ?1
+            UNION ALL
+            SELECT log_date, category, productivity, total_seconds, row_count
+            FROM activity_log_compacted
+            WHERE log_date = ?1
+        )
+        INSERT INTO activity_rollup_daily (log_date, category, productivity, total_seconds, row_count)
+        SELECT log_date, category, productivity, SUM(seconds), SUM(row_count)
+        FROM day_rows
+        GROUP BY 1, 2, 3
+    """, params)
+
+def refresh_matter_rollup(cursor, dates):
+    """
+    Recomputes matter_rollup_daily for these dates from the time entries of those dates and
+    their sources. Runs on the caller's cursor, like refresh_matter_index.
+    """
+    params = [(date_str,) for date_str in dates if date_str]
+    cursor.executemany("DELETE FROM matter_rollup_daily WHERE log_date = ?", params)
+    cursor.executemany("""
+        INSERT INTO matter_rollup_daily (log_date, matter_code, productivity, total_seconds)
+        SELECT entry_date, matter_code, productivity, SUM(seconds)
+        FROM (
+            SELECT t.entry_date, coalesce(t.matter_code, '') AS matter_code,
+                   coalesce(a.productivity, 0) AS productivity, s.time_spent_seconds AS seconds
+            FROM time_entries AS t
+            JOIN entry_sources AS s ON s.source_hash = t.source_hash
+            LEFT JOIN activity_log AS a ON a.log_date = s.log_date AND a.activity = s.activity AND a.document = s.document
+            WHERE t.entry_date = ?1
+            UNION ALL
+            -- Lineage of compacted days
+            SELECT t.entry_date, coalesce(t.matter_code, ''), c.productivity, c.time_spent_seconds
+            FROM time_entries AS t
+            JOIN entry_sources_compacted AS c ON c.source_hash = t.source_hash
+            WHERE t.entry_date = ?1
+        )
+        GROUP BY 1, 2, 3
+    """, params)
+
+ROLLUP_GROUP_COLUMNS = {
+    "category": ("activity_rollup_daily", "category"),
+    "productivity": ("activity_rollup_daily", "productivity"),
+    "matter": ("matter_rollup_daily", "matter_code"),
+}
+
+def _rollup_query(select, start_date, end_date, group_by, min_productivity, group):
+    table, column = ROLLUP_GROUP_COLUMNS[group_by]
+    sql = f"SELECT {select.format(key=column)} FROM {table} WHERE log_date BETWEEN ? AND ?"
+    params = [start_date, end_date]
+    if min_productivity is not None:
+        sql += " AND productivity >= ?"
+        params.append(min_productivity)
+    return f"{sql} GROUP BY {group}", params
+
+def get_rollup_totals(start_date, end_date, group_by, min_productivity=None):
+    """(key, total_seconds) per category, productivity level or matter over a date range, from the rollups."""
+    sql, params = _rollup_query("{key}, SUM(total_seconds)", start_date, end_date, group_by, min_productivity, "1")
+    conn = get_db_connection()
+    conn.row_factory = None
+    try:
+        return conn.execute(sql + " ORDER BY 2 DESC", params).fetchall()
+    finally:
+        conn.close()
+
+def get_rollup_daily(start_date, end_date, group_by, min_productivity=None):
+    """(log_date, key, total_seconds) per day and category, productivity level or matter over a date range."""
+    sql, params = _rollup_query("log_date, {key}, SUM(total_seconds)", start_date, end_date, group_by, min_productivity, "1, 2")
+    conn = get_db_connection()
+    conn.row_factory = None
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+# --- Near-duplicate task index (see similarity.py) ---
+#
+# task_signatures holds the MinHash signature of every distinct time entry description.
+# upsert_time_entries adds the signatures of the descriptions it writes (computed before
+# the write, so the lock is not held while hashing); rows are never removed when entries
+# go away, since get_task_signature_rows only reads the signatures of current entries.
+
+def create_similarity_tables(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS task_signatures (
+        task_description TEXT PRIMARY KEY,
+        signature BLOB NOT NULL
+    ) WITHOUT ROWID
+    """)
+
+def record_task_signatures(cursor, rows):
+    """Stores (task_description, signature) rows for descriptions not yet indexed. Runs on the caller's cursor."""
+    cursor.executemany("INSERT OR IGNORE INTO task_signatures (task_description, signature) VALUES (?, ?)", rows)
+
+def get_task_signature_rows(start_date, end_date):
+    """
+    One row per distinct task description among the time entries of a date range:
+    (task_description, entry count, total seconds, first date, last date, signature or None
+    if it is not indexed yet).
+    """
+    conn = get_db_connection()
+    conn.row_factory = None
+    try:
+        return conn.execute("""
+            SELECT g.*, s.signature
+            FROM (
+                SELECT task_description, COUNT(*), SUM(total_seconds), MIN(entry_date), MAX(entry_date)
+                FROM time_entries
+                WHERE entry_date BETWEEN ? AND ?
+                GROUP BY task_description
+            ) AS g
+            LEFT JOIN task_signatures AS s ON s.task_description = g.task_description
+        """, (start_date, end_date)).fetchall()
+    finally:
+        conn.close()
+
+def get_task_entries(start_date, end_date, descriptions):
+    """(task_description, application, entry_id) of the time entries of a date range with these descriptions."""
+    if not descriptions:
+        return []
+    conn = get_db_connection()
+    conn.row_factory = None
+    try:
+        cursor = conn.cursor()
+        cursor.execute("CREATE TEMP TABLE wanted_descriptions (task_description TEXT PRIMARY KEY)")
+        cursor.executemany("INSERT OR IGNORE INTO wanted_descriptions VALUES (?)", ((text,) for text in descriptions))
+        cursor.execute("""
+            SELECT task_description, application, entry_id
+            FROM time_entries
+            WHERE entry_date BETWEEN ? AND ?
+              AND task_description IN (SELECT task_description FROM wanted_descriptions)
+        """, (start_date, end_date))
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+def mark_date_for_reprocessing(date_str):
+    """Sets the 'processed' flag to 0 for all records on a specific date."""
+    _write(lambda cursor: cursor.execute("UPDATE activity_log SET processed = 0 WHERE log_date = ?", (date_str,)))
+    logger.info("Marked all entries for %s for reprocessing.", date_str)
+
+ACTIVITY_UPSERT_SQL = """
+INSERT INTO activity_log (log_date, time_spent_seconds, activity, category, productivity, document, processed)
+VALUES (?, ?, ?, ?, ?, ?, 0)
+ON CONFLICT(log_date, activity, document) DO UPDATE SET
+    time_spent_seconds = excluded.time_spent_seconds,
+    category = excluded.category,
+    productivity = excluded.productivity,
+    processed = 0,  -- Mark as unprocessed when data changes
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+def upsert_activity_data(data_list):
+    """
+    Upserts activity data, marking records as unprocessed when updated.
+    This preserves existing data while allowing for updates.
+    """
+    try:
+        def write(cursor):
+            cursor.executemany(ACTIVITY_UPSERT_SQL, data_list)
+            restored = drop_compacted_summaries(cursor, {row[0] for row in data_list})
+            if restored:
+                rebuild_activity_rollup(cursor, restored)
+        with stage("upsert", items=len(data_list)):
+            _write(write)
+        logger.info("Successfully upserted %d activity records.", len(data_list), extra={"records": len(data_list)})
+        return len(data_list)
+    except sqlite3.Error as e:
+        logger.error("Database error during upsert: %s", e)
+        return 0
+
+# --- Bulk import (see importer.py) ---
+#
+# Export rows are first upserted into a staging table keyed like activity_log, in large
+# batches, adding up the seconds of rows with the same day, activity and document (exports
+# can hold one row per hour). One final transaction merges the staged records into
+# activity_log in key order, as upsert_activity_data would. It drops the triggers on
+# activity_log and document_catalog (and, for large imports, activity_log's secondary
+# indexes), does their work set-based instead, and recreates them before committing, so no
+# other connection ever sees the tables without them.
+
+IMPORT_STAGING_TABLE = "activity_import_staging"
+# Triggers whose work merge_activity_import does itself
+IMPORT_REPLACED_TRIGGERS = {
+    "activity_log": ("activity_log_catalog_insert", "activity_rollup_insert", "activity_rollup_update"),
+    "document_catalog": ("document_catalog_fts_insert",),
+}
+
+def begin_activity_import():
+    """Creates an empty staging table for an import (discarding one left by an interrupted import)."""
+    def write(cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {IMPORT_STAGING_TABLE}")
+        cursor.execute(f"""
+            CREATE TABLE {IMPORT_STAGING_TABLE} (
+                log_date TEXT NOT NULL,
+                time_spent_seconds INTEGER NOT NULL,
+                activity TEXT NOT NULL,
+                category TEXT,
+                productivity INTEGER,
+                document TEXT NOT NULL,
+                PRIMARY KEY (log_date, activity, document)
+            ) WITHOUT ROWID
+        """)
+    _write(write)
+
+def stage_activity_rows(rows):
+    """Adds (log_date, seconds, activity, category, productivity, document) rows to the staging table."""
+    _write(lambda cursor: cursor.executemany(f"""
+        INSERT INTO {IMPORT_STAGING_TABLE} VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(log_date, activity, document) DO UPDATE SET
+            time_spent_seconds = time_spent_seconds + excluded.time_spent_seconds,
+            category = excluded.category,
+            productivity = excluded.productivity
+    """, rows))
+    return len(rows)
+
+def _schema_sql(cursor, kind, table):
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = ? AND tbl_name = ? AND sql IS NOT NULL", (kind, table))
+    return [(row[0], row[1]) for row in cursor.fetchall()]
+
+def merge_activity_import(defer_indexes=None):
+    """
+    Merges the staging table into activity_log and drops it. defer_indexes drops and rebuilds
+    activity_log's secondary indexes around the merge; by default it does so when the import
+    is at least a quarter the size of the table. Returns (records merged, imported dates).
+    """
+    def write(cursor):
+        cursor.execute(f"SELECT COUNT(*) FROM {IMPORT_STAGING_TABLE}")
+        staged = cursor.fetchone()[0]
+        cursor.execute("SELECT MAX(rowid) FROM activity_log")
+        existing = cursor.fetchone()[0] or 0
+        defer = staged >= existing / 4 if defer_indexes is None else defer_indexes
+
+        triggers = [
+            (name, sql)
+            for table, names in IMPORT_REPLACED_TRIGGERS.items()
+            for name, sql in _schema_sql(cursor, "trigger", table) if name in names
+        ]
+        indexes = _schema_sql(cursor, "index", "activity_log") if defer else []
+        for name, _ in triggers:
+            cursor.execute(f"DROP TRIGGER {name}")
+        for name, _ in indexes:
+            cursor.execute(f"DROP INDEX {name}")
+
+        with stage("import_merge", items=staged):
+            cursor.execute(f"""
+                INSERT INTO activity_log (log_date, time_spent_seconds, activity, category, productivity, document, processed)
+                SELECT log_date, time_spent_seconds, activity, category, productivity, document, 0
+                FROM {IMPORT_STAGING_TABLE}
+                WHERE true
+                ORDER BY log_date, activity, document
+                ON CONFLICT(log_date, activity, document) DO UPDATE SET
+                    time_spent_seconds = excluded.time_spent_seconds,
+                    category = excluded.category,
+                    productivity = excluded.productivity,
+                    processed = 0,
+                    updated_at = CURRENT_TIMESTAMP
+            """)
+            merged = cursor.rowcount
+        cursor.execute(f"SELECT DISTINCT log_date FROM {IMPORT_STAGING_TABLE}")
+        dates = [row[0] for row in cursor.fetchall()]
+
+        # What the dropped triggers would have done row by row
+        with stage("import_triggers", items=len(dates)):
+            cursor.execute("SELECT coalesce(MAX(doc_id), 0) FROM document_catalog")
+            last_doc_id = cursor.fetchone()[0]
+            cursor.execute(f"INSERT OR IGNORE INTO document_catalog (activity, document) SELECT activity, document FROM {IMPORT_STAGING_TABLE}")
+            cursor.execute("INSERT INTO document_catalog_fts (rowid, document) SELECT doc_id, document FROM document_catalog WHERE doc_id > ?", (last_doc_id,))
+            drop_compacted_summaries(cursor, dates)
+            rebuild_activity_rollup(cursor, dates)
+        with stage("import_indexes", items=len(indexes)):
+            for _, sql in indexes + triggers:
+                cursor.execute(sql)
+        cursor.execute(f"DROP TABLE {IMPORT_STAGING_TABLE}")
+        return merged, dates
+    return _write(write)
+
+# --- Retention (see retention.py) ---
+#
+# Compaction removes the processed raw rows of old days from activity_log, folding each day
+# into activity_log_compacted: seconds and row counts per (activity, category, productivity),
+# without document titles. Only days with no pending rows are compacted, and all of a day's
+# rows at once, so a day is either raw or compacted. Rows the rules filtered out are never
+# marked processed, so a row is pending when it is unprocessed and its document is not
+# recorded as filtered out in canonical_names. Time entries are kept. Their lineage rows
+# (entry_sources) of the day are folded the same way into entry_sources_compacted: seconds
+# and document counts per (entry, activity, productivity), which get_entry_sources and
+# refresh_matter_rollup read alongside entry_sources. activity_rollup_daily keeps counting
+# the time, since its delete trigger skips compacted days and rebuild_activity_rollup reads
+# the summaries. Catalog and canonical-name rows of documents left with no raw rows are
+# removed with them. Raw rows written again for a compacted day (a refetch, replay or import)
+# replace its summary; its folded lineage is replaced when its entries are processed again.
+
+def create_retention_tables(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS activity_log_compacted (
+        log_date TEXT NOT NULL,
+        activity TEXT NOT NULL,
+        category TEXT NOT NULL,  -- '' for uncategorized, as in activity_rollup_daily
+        productivity INTEGER NOT NULL,
+        total_seconds INTEGER NOT NULL,
+        row_count INTEGER NOT NULL,
+        PRIMARY KEY (log_date, activity, category, productivity)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS entry_sources_compacted (
+        source_hash TEXT NOT NULL,
+        log_date TEXT NOT NULL,
+        activity TEXT NOT NULL,
+        productivity INTEGER NOT NULL,  -- 0 for none, as in matter_rollup_daily
+        time_spent_seconds INTEGER NOT NULL,
+        document_count INTEGER NOT NULL,
+        PRIMARY KEY (source_hash, log_date, activity, productivity)
+    ) WITHOUT ROWID
+    """)
+
+def drop_compacted_summaries(cursor, dates):
+    """Deletes the compacted summaries of these dates (raw rows are back). Returns the dates that had one."""
+    restored = []
+    for date_str in set(dates):
+        cursor.execute("DELETE FROM activity_log_compacted WHERE log_date = ?", (date_str,))
+        if cursor.rowcount:
+            restored.append(date_str)
+    if restored:
+        logger.info("Raw rows replaced the compacted summaries of %d day(s).", len(restored))
+    return restored
+
+PENDING_ACTIVITY_SQL = """
+    processed = 0 AND NOT EXISTS (
+        SELECT 1 FROM canonical_names AS c
+        WHERE c.activity = activity_log.activity AND c.document = activity_log.document AND c.canonical_name IS NULL
+    )
+"""
+
+def get_compaction_candidates(before_date):
+    """
+    The days before before_date that still have raw rows, split into those with no pending
+    rows (compactable) and those with some: (compactable, pending), both sorted.
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT log_date FROM activity_log WHERE log_date < ? ORDER BY log_date", (before_date,))
+        dates = [row[0] for row in cursor.fetchall()]
+        cursor.execute(f"SELECT DISTINCT log_date FROM activity_log WHERE log_date < ? AND {PENDING_ACTIVITY_SQL}", (before_date,))
+        pending = {row[0] for row in cursor.fetchall()}
+        return [d for d in dates if d not in pending], sorted(pending)
+    finally:
+        conn.close()
+
+def count_compactable_rows(dates):
+    """(raw activity rows, lineage rows) of these dates."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        activity = sum(cursor.execute("SELECT COUNT(*) FROM activity_log WHERE log_date = ?", (d,)).fetchone()[0] for d in dates)
+        # entry_sources has no log_date index: one scan for all the dates
+        wanted = set(dates)
+        cursor.execute("SELECT log_date, COUNT(*) FROM entry_sources GROUP BY log_date")
+        return activity, sum(count for log_date, count in cursor.fetchall() if log_date in wanted)
+    finally:
+        conn.close()
+
+# Columns copied to the archive, per table
+ARCHIVE_COLUMNS = {
+    "activity_log": "log_date, time_spent_seconds, activity, category, productivity, document, processed, created_at, updated_at",
+    "entry_sources": "source_hash, log_date, activity, document, time_spent_seconds",
+}
+
+def archive_activity_rows(archive_path, dates):
+    """
+    Copies the raw rows of these dates and their lineage rows into the activity_log and
+    entry_sources tables of the SQLite file at archive_path (created with the same schema if
+    needed), replacing rows already there. Returns (raw rows, lineage rows) copied.
+    """
+    conn = get_db_connection()
+    archive = sqlite3.connect(archive_path, timeout=10.0)
+    try:
+        placeholders = ",".join("?" * len(dates))
+        copied = []
+        for table, columns in ARCHIVE_COLUMNS.items():
+            (_, table_sql), = [item for item in _schema_sql(conn.cursor(), "table", table) if item[0] == table]
+            archive.execute(table_sql.replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1))
+            rows = conn.execute(f"SELECT {columns} FROM {table} WHERE log_date IN ({placeholders})", list(dates)).fetchall()
+            archive.executemany(
+                f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({','.join('?' * len(columns.split(',')))})", rows
+            )
+            copied.append(len(rows))
+        archive.commit()
+        return tuple(copied)
+    finally:
+        archive.close()
+        conn.close()
+
+def compact_activity_dates(dates):
+    """
+    Compacts these dates (see above), skipping any that have pending rows by now.
+    Returns (dates compacted, raw rows removed, summary rows written, lineage rows folded).
+    """
+    def write(cursor):
+        compacted = []
+        for date_str in dates:
+            cursor.execute(f"SELECT 1 FROM activity_log WHERE log_date = ? AND {PENDING_ACTIVITY_SQL} LIMIT 1", (date_str,))
+            if cursor.fetchone() is None:
+                compacted.append((date_str,))
+        if not compacted:
+            return [], 0, 0, 0
+
+        cursor.executemany(f"""
+            INSERT INTO activity_log_compacted (log_date, activity, category, productivity, total_seconds, row_count)
+            SELECT log_date, activity, {ACTIVITY_ROLLUP_KEY.format(row="activity_log")}, SUM(time_spent_seconds), COUNT(*)
+            FROM activity_log
+            WHERE log_date = ?
+            GROUP BY 1, 2, 3, 4
+            ON CONFLICT(log_date, activity, category, productivity) DO UPDATE SET
+                total_seconds = total_seconds + excluded.total_seconds,
+                row_count = row_count + excluded.row_count
+        """, compacted)
+        summaries = cursor.rowcount
+
+        # Lineage keeps the seconds per entry and activity, without the document titles
+        # (productivity comes from the raw rows, so this runs before they are deleted)
+        placeholders = ",".join("?" * len(compacted))
+        days = [row[0] for row in compacted]
+        cursor.execute(f"""
+            INSERT INTO entry_sources_compacted (source_hash, log_date, activity, productivity, time_spent_seconds, document_count)
+            SELECT s.source_hash, s.log_date, s.activity, coalesce(a.productivity, 0), SUM(s.time_spent_seconds), COUNT(*)
+            FROM entry_sources AS s
+            LEFT JOIN activity_log AS a ON a.log_date = s.log_date AND a.activity = s.activity AND a.document = s.document
+            WHERE s.log_date IN ({placeholders})
+            GROUP BY 1, 2, 3, 4
+            ON CONFLICT(source_hash, log_date, activity, productivity) DO UPDATE SET
+                time_spent_seconds = time_spent_seconds + excluded.time_spent_seconds,
+                document_count = document_count + excluded.document_count
+        """, days)
+        cursor.execute(f"DELETE FROM entry_sources WHERE log_date IN ({placeholders})", days)
+        folded = cursor.rowcount
+
+        cursor.execute("CREATE TEMP TABLE compacted_pairs (activity TEXT NOT NULL, document TEXT NOT NULL, PRIMARY KEY (activity, document))")
+        cursor.executemany("""
+            INSERT OR IGNORE INTO compacted_pairs
+            SELECT activity, document FROM activity_log WHERE log_date = ? AND document IS NOT NULL
+        """, compacted)
+        cursor.executemany("DELETE FROM activity_log WHERE log_date = ?", compacted)
+        removed = cursor.rowcount
+
+        # Documents with no raw rows left leave the search catalog and the rule snapshots
+        cursor.execute("""
+            DELETE FROM compacted_pairs
+            WHERE EXISTS (
+                SELECT 1 FROM activity_log AS a
+                WHERE a.activity = compacted_pairs.activity AND a.document = compacted_pairs.document
+            )
+        """)
+        cursor.execute("""
+            INSERT INTO document_catalog_fts (document_catalog_fts, rowid, document)
+            SELECT 'delete', c.doc_id, c.document
+            FROM document_catalog AS c
+            JOIN compacted_pairs AS p ON p.activity = c.activity AND p.document = c.document
+        """)
+        cursor.execute("DELETE FROM document_catalog WHERE (activity, document) IN (SELECT activity, document FROM compacted_pairs)")
+        cursor.execute("DELETE FROM canonical_names WHERE (activity, document) IN (SELECT activity, document FROM compacted_pairs)")
+        # The writer's connection is long-lived, so temp tables must not outlive the write
+        cursor.execute("DROP TABLE temp.compacted_pairs")
+        return days, removed, summaries, folded
+    return _write(write)
+
+def get_vacuum_state():
+    """(auto_vacuum mode: 0 none, 1 full, 2 incremental; free pages; page size) of the current database."""
+    conn = get_db_connection()
+    try:
+        return tuple(conn.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in ("auto_vacuum", "freelist_count", "page_size"))
+    finally:
+        conn.close()
+
+def enable_incremental_vacuum():
+    """
+    Switches an existing database to auto_vacuum=INCREMENTAL. That takes a full VACUUM, which
+    rewrites the whole file and holds the write lock until it is done; it is needed only once.
+    """
+    conn = get_db_connection()
+    conn.isolation_level = None
+    try:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+def incremental_vacuum(pages):
+    """Returns up to `pages` free pages to the file system in one write. Returns the free pages left."""
+    def write(cursor):
+        # Each step of the pragma frees one page, and execute() only takes one step
+        for _ in range(pages):
+            cursor.execute("PRAGMA incremental_vacuum")
+        cursor.execute("PRAGMA freelist_count")
+        return cursor.fetchone()[0]
+    return _write(write)
+
+def get_unprocessed_data(start_date=None, end_date=None):
+    """
+    Gets all unprocessed activity data, optionally filtered by date range.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    if start_date and end_date:
+        cursor.execute("""
+            SELECT * FROM activity_log 
+            WHERE processed = 0 AND log_date BETWEEN ? AND ? 
+            ORDER BY log_date, activity, document
+        """, (start_date, end_date))
+    elif start_date:
+        cursor.execute("""
+            SELECT * FROM activity_log 
+            WHERE processed = 0 AND log_date >= ? 
+            ORDER BY log_date, activity, document
+        """, (start_date,))
+    elif end_date:
+        cursor.execute("""
+            SELECT * FROM activity_log 
+            WHERE processed = 0 AND log_date <= ? 
+            ORDER BY log_date, activity, document
+        """, (end_date,))
+    else:
+        cursor.execute("""
+            SELECT * FROM activity_log 
+            WHERE processed = 0 
+            ORDER BY log_date, activity, document
+        """)
+    
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_activity_for_date(date_str):
+    """Gets every activity_log row for one date, processed or not."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM activity_log WHERE log_date = ?", (date_str,))
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+def mark_records_as_processed(record_ids):
+    """
+    Marks specified activity_log records as processed.
+    record_ids should be a list of (log_date, activity, document) tuples.
+    """
+    if not record_ids:
+        return 0
+        
+    update_sql = """
+    UPDATE activity_log 
+    SET processed = 1, updated_at = CURRENT_TIMESTAMP 
+    WHERE log_date = ? AND activity = ? AND document = ?
+    """
+    
+    try:
+        with stage("mark_processed", items=len(record_ids)):
+            affected_rows = _write(lambda cursor: cursor.executemany(update_sql, record_ids).rowcount)
+        logger.info("Marked %d records as processed.", affected_rows, extra={"records": affected_rows})
+        return affected_rows
+    except sqlite3.Error as e:
+        logger.error("Database error marking records as processed: %s", e)
+        return 0
+
+TIME_ENTRY_UPSERT_SQL = """
+INSERT INTO time_entries (entry_date, application, task_description, total_seconds, time_units, source_hash, matter_code, rule_version, source_key)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(source_key) DO UPDATE SET
+    total_seconds = excluded.total_seconds,
+    time_units = excluded.time_units,
+    task_description = excluded.task_description,
+    matter_code = excluded.matter_code,
+    rule_version = excluded.rule_version,
+    updated_at = CURRENT_TIMESTAMP
+WHERE time_entries.source_hash = excluded.source_hash;
+"""
+
+def upsert_time_entries(entries, sources=None):
+    """
+    Upserts aggregated time entries, given as
+    (entry_date, application, task_description, total_seconds, time_units, source_hash, matter_code, rule_version)
+    tuples, and refreshes the matter index for their matters (and indexes new task descriptions)
+    in the same transaction.
+    sources, if given, are (source_hash, log_date, activity, document, time_spent_seconds) lineage
+    rows; they replace the recorded sources of every upserted entry.
+    Rolls back and re-raises on a database error. Returns the number of entries written.
+    """
+    rows = [tuple(entry) + (source_key(entry[5]),) for entry in entries]
+    with stage("task_signatures", items=len(entries)):
+        signatures = similarity.signature_rows(entry[2] for entry in entries)
+
+    def write(cursor, entry_dates):
+        entry_dates.update(entry[0] for entry in entries)
+        with stage("upsert_entries", items=len(entries)):
+            _fill_source_keys(cursor, "time_entries", [(row[8], row[5]) for row in rows])
+            cursor.executemany(TIME_ENTRY_UPSERT_SQL, rows)
+            if cursor.rowcount < len(rows):
+                _check_source_key_collisions(cursor, "time_entries", rows, 8, 5)
+            refresh_matter_index(cursor, (entry[6] for entry in entries))
+            record_task_signatures(cursor, signatures)
+        if sources is not None:
+            with stage("upsert_sources", items=len(sources)):
+                cursor.executemany("DELETE FROM entry_sources WHERE source_hash = ?", ((entry[5],) for entry in entries))
+                cursor.executemany("DELETE FROM entry_sources_compacted WHERE source_hash = ?", ((entry[5],) for entry in entries))
+                cursor.executemany("INSERT OR REPLACE INTO entry_sources VALUES (?, ?, ?, ?, ?)", sources)
+            with stage("refresh_matter_rollup", items=len(entry_dates)):
+                refresh_matter_rollup(cursor, entry_dates)
+        return len(entries)
+    return _write_entries(write)
+
+def iter_rows(sql, params=(), chunk_rows=500):
+    """
+    Yields rows of a query as plain tuples, chunk_rows at a time, so the full result
+    set is never held in memory. The connection may be advanced from different threads
+    (e.g. a StreamingResponse).
+    """
+    conn = get_db_connection(check_same_thread=False)
+    # Plain tuples straight from the cursor, without building a sqlite3.Row per row
+    conn.row_factory = None
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+def delete_pending_time_entries(source_hashes):
+    """
+    Deletes the pending time entries with these source hashes (entries that were confirmed,
+    ignored or submitted are kept) and refreshes the matter index. Returns the number deleted.
+    """
+    hashes = [(source_hash, source_key(source_hash)) for source_hash in set(source_hashes)]
+    if not hashes:
+        return 0
+
+    def write(cursor, entry_dates):
+        cursor.execute("CREATE TEMP TABLE stale_hashes (source_hash TEXT PRIMARY KEY, source_key INTEGER NOT NULL)")
+        cursor.executemany("INSERT INTO stale_hashes VALUES (?, ?)", hashes)
+        _fill_source_keys(cursor, "time_entries", [(key, source_hash) for source_hash, key in hashes])
+        cursor.execute("""
+            SELECT DISTINCT matter_code, entry_date FROM time_entries
+            WHERE status = 'pending' AND source_key IN (SELECT source_key FROM stale_hashes)
+        """)
+        rows = cursor.fetchall()
+        matter_codes = {row[0] for row in rows}
+        entry_dates.update(row[1] for row in rows)
+        cursor.execute("""
+            DELETE FROM time_entries
+            WHERE status = 'pending' AND source_key IN (SELECT source_key FROM stale_hashes)
+        """)
+        deleted = cursor.rowcount
+        # Sources of entries that were kept (not pending) stay, so they can still be audited
+        for table in ("entry_sources", "entry_sources_compacted"):
+            cursor.execute(f"""
+                DELETE FROM {table}
+                WHERE source_hash IN (
+                    SELECT source_hash FROM stale_hashes AS s
+                    WHERE NOT EXISTS (SELECT 1 FROM time_entries AS t WHERE t.source_key = s.source_key)
+                )
+            """)
+        refresh_matter_index(cursor, matter_codes)
+        refresh_matter_rollup(cursor, entry_dates)
+        # The writer's connection is long-lived, so temp tables must not outlive the write
+        cursor.execute("DROP TABLE temp.stale_hashes")
+        return deleted
+    return _write_entries(write)
+
+# --- Canonicalization rule snapshots (see processor.reprocess_changed_rules) ---
+
+def get_distinct_documents():
+    """Every distinct (activity, document) pair in activity_log."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute("SELECT DISTINCT activity, document FROM activity_log WHERE document IS NOT NULL")
+        return [tuple(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+def get_canonical_names():
+    """The recorded canonical name of every processed pair: {(activity, document): canonical_name}."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute("SELECT activity, document, canonical_name FROM canonical_names")
+        return {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+    finally:
+        conn.close()
+
+def record_canonical_names(rows):
+    """
+    Records (activity, document, canonical_name, rule_version) results. Rows whose name and
+    version are unchanged are left alone, so repeat processing writes almost nothing.
+    """
+    if not rows:
+        return 0
+    _write(lambda cursor: cursor.executemany("""
+        INSERT INTO canonical_names (activity, document, canonical_name, rule_version) VALUES (?, ?, ?, ?)
+        ON CONFLICT(activity, document) DO UPDATE SET
+            canonical_name = excluded.canonical_name,
+            rule_version = excluded.rule_version,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE canonical_name IS NOT excluded.canonical_name OR rule_version != excluded.rule_version
+    """, rows))
+    return len(rows)
+
+def get_activity_dates_for_pairs(pairs):
+    """The distinct (log_date, activity) combinations in which any of these (activity, document) pairs occur."""
+    if not pairs:
+        return set()
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("CREATE TEMP TABLE changed_pairs (activity TEXT NOT NULL, document TEXT NOT NULL)")
+        cursor.executemany("INSERT INTO changed_pairs VALUES (?, ?)", pairs)
+        # Served by idx_activity_log_document (activity, document, log_date, ...)
+        cursor.execute("""
+            SELECT DISTINCT a.log_date, a.activity
+            FROM changed_pairs c
+            JOIN activity_log a ON a.activity = c.activity AND a.document = c.document
+        """)
+        return {(row[0], row[1]) for row in cursor.fetchall()}
+    finally:
+        conn.close()
+
+def clear_time_entries():
+    """Deletes all records from the time_entries table."""
+    def write(cursor, entry_dates):
+        cursor.execute("DELETE FROM time_entries")
+        cursor.execute("DELETE FROM entry_sources")
+        cursor.execute("DELETE FROM entry_sources_compacted")
+        cursor.execute("DELETE FROM matter_index")
+        cursor.execute("DELETE FROM matter_rollup_daily")
+        entry_dates.add(None)
+    _write_entries(write)
+    print("Cleared all records from the time_entries table.")
+
+def refresh_matter_index(cursor, matter_codes):
+    """
+    Recomputes the matter_index rows for the given matter codes from time_entries.
+    Runs on the caller's cursor so it commits atomically with the time entry upsert.
+    """
+    codes = [(code,) for code in set(matter_codes) if code]
+    if not codes:
+        return 0
+
+    cursor.executemany("DELETE FROM matter_index WHERE matter_code = ?", codes)
+    cursor.executemany("""
+        INSERT INTO matter_index (matter_code, first_date, last_date, total_seconds, entry_count)
+        SELECT matter_code, MIN(entry_date), MAX(entry_date), SUM(total_seconds), COUNT(*)
+        FROM time_entries
+        WHERE matter_code = ?
+        GROUP BY matter_code
+    """, codes)
+    return len(codes)
+
+def rebuild_matter_index(cursor):
+    """Rebuilds the whole matter_index from time_entries (caller commits)."""
+    cursor.execute("DELETE FROM matter_index")
+    cursor.execute("""
+        INSERT INTO matter_index (matter_code, first_date, last_date, total_seconds, entry_count)
+        SELECT matter_code, MIN(entry_date), MAX(entry_date), SUM(total_seconds), COUNT(*)
+        FROM time_entries
+        WHERE matter_code IS NOT NULL
+        GROUP BY matter_code
+    """)
 
-def mark_date_for_reprocessing(date_str):
-    """Sets the 'processed' flag to 0 for all records on a specific date."""
+def get_matter_index(matter_codes=None):
+    """Retrieves matter_index rows, either all of them or only the given matter codes."""
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
-        cursor.execute("UPDATE activity_log SET processed = 0 WHERE log_date = ?", (date_str,))
-        conn.commit()
-        print(f"Marked all entries for {date_str} for reprocessing.")
+        if matter_codes is None:
+            cursor.execute("SELECT * FROM matter_index ORDER BY last_date DESC, matter_code")
+            return [dict(row) for row in cursor.fetchall()]
+
+        codes = [code for code in set(matter_codes) if code]
+        if not codes:
+            return []
+        placeholders = ", ".join("?" for _ in codes)
+        cursor.execute(f"SELECT * FROM matter_index WHERE matter_code IN ({placeholders})", codes)
+        return [dict(row) for row in cursor.fetchall()]
     finally:
         conn.close()
 
-def upsert_activity_data(data_list):
+def get_entry_sources(entry_id):
     """
-    Upserts activity data, marking records as unprocessed when updated.
-    This preserves existing data while allowing for updates.
+    Returns a time entry (id, date, application, description, seconds, source hash, rule version)
+    with the raw activity rows it was aggregated from, largest first. None if the entry is unknown.
     """
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    upsert_sql = """
-    INSERT INTO activity_log (log_date, time_spent_seconds, activity, category, productivity, document, processed)
-    VALUES (?, ?, ?, ?, ?, ?, 0)
-    ON CONFLICT(log_date, activity, document) DO UPDATE SET
-        time_spent_seconds = excluded.time_spent_seconds,
-        category = excluded.category,
-        productivity = excluded.productivity,
-        processed = 0,  -- Mark as unprocessed when data changes
-        updated_at = CURRENT_TIMESTAMP
-    """
-    
     try:
-        cursor.executemany(upsert_sql, data_list)
-        conn.commit()
-        print(f"Successfully upserted {len(data_list)} activity records.")
-        return len(data_list)
-    except sqlite3.Error as e:
-        print(f"Database error during upsert: {e}")
-        conn.rollback()
-        return 0
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT entry_id, entry_date, application, task_description, total_seconds, source_hash, rule_version
+            FROM time_entries WHERE entry_id = ?
+        """, (entry_id,))
+        entry = cursor.fetchone()
+        if not entry:
+            return None
+
+        # Range scans of the two tables' primary keys; compacted days have one row per
+        # activity, with no document title but the number of documents folded into it
+        cursor.execute("""
+            SELECT log_date, activity, document, time_spent_seconds, NULL AS compacted_documents
+            FROM entry_sources
+            WHERE source_hash = ?1
+            UNION ALL
+            SELECT log_date, activity, '', SUM(time_spent_seconds), SUM(document_count)
+            FROM entry_sources_compacted
+            WHERE source_hash = ?1
+            GROUP BY log_date, activity
+            ORDER BY time_spent_seconds DESC, document
+        """, (entry['source_hash'],))
+        sources = [dict(row) for row in cursor.fetchall()]
+
+        result = dict(entry)
+        result['sources'] = sources
+        result['sources_total_seconds'] = sum(source['time_spent_seconds'] for source in sources)
+        return result
     finally:
         conn.close()
 
-def get_unprocessed_data(start_date=None, end_date=None):
+def get_matter_summary(matter_code, start_date=None, end_date=None):
     """
-    Gets all unprocessed activity data, optionally filtered by date range.
+    Returns billing details for one matter: the index row plus the per-entry breakdown
+    (entry id, date, seconds), optionally limited to a date range. None if the matter is unknown.
     """
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    if start_date and end_date:
-        cursor.execute("""
-            SELECT * FROM activity_log 
-            WHERE processed = 0 AND log_date BETWEEN ? AND ? 
-            ORDER BY log_date, activity, document
-        """, (start_date, end_date))
-    elif start_date:
-        cursor.execute("""
-            SELECT * FROM activity_log 
-            WHERE processed = 0 AND log_date >= ? 
-            ORDER BY log_date, activity, document
-        """, (start_date,))
-    elif end_date:
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM matter_index WHERE matter_code = ?", (matter_code,))
+        index_row = cursor.fetchone()
+        if not index_row:
+            return None
+
+        # Served entirely by idx_time_entries_matter_date
         cursor.execute("""
-            SELECT * FROM activity_log 
-            WHERE processed = 0 AND log_date <= ? 
-            ORDER BY log_date, activity, document
-        """, (end_date,))
-    else:
+            SELECT entry_id, entry_date, total_seconds
+            FROM time_entries
+            WHERE matter_code = ? AND entry_date BETWEEN ? AND ?
+            ORDER BY entry_date
+        """, (matter_code, start_date or index_row['first_date'], end_date or index_row['last_date']))
+        entries = [dict(row) for row in cursor.fetchall()]
+
+        summary = dict(index_row)
+        summary['entries'] = entries
+        summary['range_total_seconds'] = sum(entry['total_seconds'] for entry in entries)
+        return summary
+    finally:
+        conn.close()
+
+def build_fts_query(text):
+    """
+    Turns free text from the UI into a safe FTS5 query: every whitespace-separated term
+    is quoted (so punctuation in file names cannot break the syntax) and all terms must
+    match. The last term is prefix-matched so results follow the user's typing, unless it
+    is a single character (which would expand to a large share of the vocabulary).
+    """
+    raw_terms = [term for term in (t.replace('"', '') for t in text.split()) if term]
+    terms = [f'"{term}"' for term in raw_terms]
+    if terms and len(raw_terms[-1]) > 1:
+        terms[-1] += "*"
+    return " AND ".join(terms)
+
+def highlight_terms(text, query_text):
+    """
+    Wraps the words of text that match the search terms in [brackets], mirroring how the
+    FTS5 tokenizer splits words (letters and digits; the last term also matches as a prefix).
+    """
+    if not text:
+        return text
+    words = re.findall(r'[^\W_]+', query_text)
+    if not words:
+        return text
+    alternatives = [re.escape(word) for word in words[:-1]]
+    alternatives.append(re.escape(words[-1]) + (r'[^\W_]*' if len(words[-1]) > 1 else ''))
+    pattern = re.compile(r'(?<![^\W_])(?:' + '|'.join(alternatives) + r')(?![^\W_])', re.IGNORECASE)
+    return pattern.sub(lambda match: f"[{match.group(0)}]", text)
+
+def search_time_entries(text, start_date=None, end_date=None, limit=50):
+    """
+    Full-text search over time entry descriptions and notes, best matches first.
+    Descriptions are weighted above notes.
+    """
+    fts_query = build_fts_query(text)
+    if not fts_query:
+        return []
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
         cursor.execute("""
-            SELECT * FROM activity_log 
-            WHERE processed = 0 
-            ORDER BY log_date, activity, document
-        """)
-    
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+            SELECT t.entry_id, t.entry_date, t.application, t.task_description, t.notes,
+                   t.matter_code, t.total_seconds, t.time_units, t.status,
+                   bm25(time_entries_fts, 10.0, 3.0) AS rank
+            FROM time_entries_fts
+            JOIN time_entries t ON t.entry_id = time_entries_fts.rowid
+            WHERE time_entries_fts MATCH ?
+              AND t.entry_date BETWEEN ? AND ?
+            ORDER BY rank
+            LIMIT ?
+        """, (fts_query, start_date or '0000-00-00', end_date or '9999-99-99', limit))
+        hits = []
+        for row in cursor.fetchall():
+            hit = convert_db_entry_to_dict(row)
+            # Highlight in Python: FTS5 snippet() would be evaluated for every match, not just the page
+            snippet = highlight_terms(hit['task_description'], text)
+            if hit['notes']:
+                highlighted_notes = highlight_terms(hit['notes'], text)
+                if highlighted_notes != hit['notes']:
+                    snippet = f"{snippet} … {highlighted_notes}"
+            hit['snippet'] = snippet
+            hits.append(hit)
+        return hits
+    finally:
+        conn.close()
 
-def mark_records_as_processed(record_ids):
+def search_documents(text, start_date=None, end_date=None, limit=50):
     """
-    Marks specified activity_log records as processed.
-    record_ids should be a list of (log_date, activity, document) tuples.
+    Full-text search over raw RescueTime document titles, best matches first.
+    Each hit is one (activity, document) with its total time and the span of days it was
+    worked on within the date range; documents with no time in the range are skipped.
     """
-    if not record_ids:
-        return 0
-        
+    fts_query = build_fts_query(text)
+    if not fts_query:
+        return []
+
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    update_sql = """
-    UPDATE activity_log 
-    SET processed = 1, updated_at = CURRENT_TIMESTAMP 
-    WHERE log_date = ? AND activity = ? AND document = ?
+    try:
+        ranked = conn.execute("""
+            SELECT rowid AS doc_id, rank
+            FROM document_catalog_fts
+            WHERE document_catalog_fts MATCH ?
+            ORDER BY rank
+        """, (fts_query,))
+
+        # Walk the ranked catalog in pages, summing time per document through the
+        # covering index, until enough documents with time in the range are found.
+        hits = []
+        while len(hits) < limit:
+            page = ranked.fetchmany(max(limit, 100))
+            if not page:
+                break
+            ranks = {row['doc_id']: row['rank'] for row in page}
+            placeholders = ", ".join("?" for _ in ranks)
+            totals = conn.execute(f"""
+                SELECT c.doc_id, c.activity, c.document,
+                       SUM(a.time_spent_seconds) AS total_seconds,
+                       COUNT(DISTINCT a.log_date) AS days,
+                       MIN(a.log_date) AS first_date,
+                       MAX(a.log_date) AS last_date
+                FROM document_catalog c
+                JOIN activity_log a ON a.activity = c.activity AND a.document = c.document
+                WHERE c.doc_id IN ({placeholders})
+                  AND a.log_date BETWEEN ? AND ?
+                GROUP BY c.doc_id
+            """, (*ranks, start_date or '0000-00-00', end_date or '9999-99-99')).fetchall()
+            for row in sorted(totals, key=lambda row: ranks[row['doc_id']]):
+                hit = dict(row)
+                del hit['doc_id']
+                hit['rank'] = ranks[row['doc_id']]
+                hits.append(hit)
+        return hits[:limit]
+    finally:
+        conn.close()
+
+def load_alp_cache_entry(cache_key):
     """
-    
+    Returns (value_json, fetched_at) for a persisted ALP cache entry, or None.
+    ALP data is shared by every user, so the cache always lives in the main database.
+    """
+    conn = get_db_connection(db_file=DB_FILE)
     try:
-        cursor.executemany(update_sql, record_ids)
-        affected_rows = cursor.rowcount
-        conn.commit()
-        print(f"Marked {affected_rows} records as processed.")
-        return affected_rows
+        cursor = conn.cursor()
+        cursor.execute("SELECT value, fetched_at FROM alp_cache WHERE cache_key = ?", (cache_key,))
+        row = cursor.fetchone()
+        return (row['value'], row['fetched_at']) if row else None
+    finally:
+        conn.close()
+
+def save_alp_cache_entry(cache_key, value_json, fetched_at):
+    """Persists one ALP cache entry, replacing any previous copy."""
+    _write(lambda cursor: cursor.execute("""
+        INSERT INTO alp_cache (cache_key, value, fetched_at) VALUES (?, ?, ?)
+        ON CONFLICT(cache_key) DO UPDATE SET value = excluded.value, fetched_at = excluded.fetched_at
+    """, (cache_key, value_json, fetched_at)), db_file=DB_FILE)
+
+def delete_alp_cache_entries(cache_keys=None):
+    """Deletes the given persisted ALP cache entries, or all of them when cache_keys is None."""
+    def write(cursor):
+        if cache_keys is None:
+            cursor.execute("DELETE FROM alp_cache")
+        else:
+            cursor.executemany("DELETE FROM alp_cache WHERE cache_key = ?", [(key,) for key in cache_keys])
+    _write(write, db_file=DB_FILE)
+
+def enqueue_alp_submissions(items):
+    """
+    Adds time entries to the ALP outbox in one transaction.
+    items is a list of dicts with idempotency_key, processed_entry_id and payload (JSON text).
+    Re-enqueueing a key that is already sent is a no-op; otherwise the payload is replaced
+    and the entry is retried immediately. Returns the outbox rows.
+    """
+    if not items:
+        return []
+
+    def write(cursor):
+        cursor.executemany("""
+            INSERT INTO alp_outbox (idempotency_key, processed_entry_id, payload)
+            VALUES (:idempotency_key, :processed_entry_id, :payload)
+            ON CONFLICT(idempotency_key) DO UPDATE SET
+                processed_entry_id = excluded.processed_entry_id,
+                payload = excluded.payload,
+                status = 'pending',
+                attempts = 0,
+                next_attempt_at = 0,
+                last_error = NULL,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE alp_outbox.status NOT IN ('sent', 'in_flight')
+        """, items)
+        keys = [item['idempotency_key'] for item in items]
+        placeholders = ", ".join("?" for _ in keys)
+        cursor.execute(f"SELECT * FROM alp_outbox WHERE idempotency_key IN ({placeholders}) ORDER BY id", keys)
+        return [dict(row) for row in cursor.fetchall()]
+    try:
+        return _write(write)
     except sqlite3.Error as e:
-        print(f"Database error marking records as processed: {e}")
-        conn.rollback()
-        return 0
+        logger.error("Database error enqueueing ALP submissions: %s", e)
+        raise
+
+def get_processed_entry_source(processed_entry_id):
+    """Returns (source_hash, entry_date) for a processed entry, or None."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT source_hash, entry_date FROM processed_time_entries WHERE id = ?", (processed_entry_id,))
+        row = cursor.fetchone()
+        return (row['source_hash'], row['entry_date']) if row else None
     finally:
         conn.close()
 
-def clear_time_entries():
-    """Deletes all records from the time_entries table."""
+def claim_alp_outbox_batch(limit, now, max_attempts):
+    """
+    Atomically claims up to `limit` due outbox rows by moving them to 'in_flight'.
+    Returns the claimed rows.
+    """
+    # Writes take the write lock up front (BEGIN IMMEDIATE), so two workers never claim the same rows
+    def write(cursor):
+        cursor.execute("""
+            SELECT id, idempotency_key, processed_entry_id, payload, attempts
+            FROM alp_outbox
+            WHERE status = 'pending' AND next_attempt_at <= ? AND attempts < ?
+            ORDER BY next_attempt_at, id
+            LIMIT ?
+        """, (now, max_attempts, limit))
+        rows = [dict(row) for row in cursor.fetchall()]
+        cursor.executemany(
+            "UPDATE alp_outbox SET status = 'in_flight', updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            [(row['id'],) for row in rows],
+        )
+        return rows
+    return _write(write)
+
+def record_alp_outbox_results(sent, failed):
+    """
+    Records the outcome of a submission batch in one transaction.
+    sent: list of (outbox_id, alp_entry_id) - also stamps the processed entry.
+    failed: list of (outbox_id, status, attempts, next_attempt_at, error).
+    """
+    def write(cursor, entry_dates):
+        if sent:
+            placeholders = ",".join("?" * len(sent))
+            cursor.execute(f"""
+                SELECT DISTINCT p.entry_date FROM processed_time_entries p
+                JOIN alp_outbox o ON o.processed_entry_id = p.id
+                WHERE o.id IN ({placeholders})
+            """, [outbox_id for outbox_id, _ in sent])
+            entry_dates.update(row[0] for row in cursor.fetchall())
+        cursor.executemany("""
+            UPDATE alp_outbox
+            SET status = 'sent', alp_entry_id = ?, attempts = attempts + 1,
+                last_error = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, [(alp_entry_id, outbox_id) for outbox_id, alp_entry_id in sent])
+        cursor.executemany("""
+            UPDATE processed_time_entries
+            SET submitted_to_alp_at = CURRENT_TIMESTAMP, alp_entry_id = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = (SELECT processed_entry_id FROM alp_outbox WHERE id = ?)
+        """, [(alp_entry_id, outbox_id) for outbox_id, alp_entry_id in sent])
+        cursor.executemany("""
+            UPDATE alp_outbox
+            SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, [(status, attempts, next_attempt_at, error, outbox_id)
+              for outbox_id, status, attempts, next_attempt_at, error in failed])
+    try:
+        _write_entries(write)
+    except sqlite3.Error as e:
+        logger.error("Database error recording ALP submission results: %s", e)
+        raise
+
+def release_in_flight_alp_outbox():
+    """Returns rows left 'in_flight' by an interrupted worker to 'pending' (safe: posts are idempotent)."""
+    return _write(lambda cursor: cursor.execute(
+        "UPDATE alp_outbox SET status = 'pending', updated_at = CURRENT_TIMESTAMP WHERE status = 'in_flight'"
+    ).rowcount)
+
+def requeue_mock_alp_submissions():
+    """
+    Returns outbox rows that were only "sent" to the mock ALP (alp_entry_id 'mock-...', from
+    before the outbox stopped posting without ALP_API_URL) to 'pending', and clears the mock
+    stamp on their processed entries. Returns the number of rows requeued.
+    """
+    def write(cursor, entry_dates):
+        cursor.execute("""
+            SELECT DISTINCT p.entry_date FROM processed_time_entries p
+            JOIN alp_outbox o ON o.processed_entry_id = p.id
+            WHERE o.status = 'sent' AND o.alp_entry_id LIKE 'mock-%'
+        """)
+        entry_dates.update(row[0] for row in cursor.fetchall())
+        cursor.execute("""
+            UPDATE processed_time_entries
+            SET submitted_to_alp_at = NULL, alp_entry_id = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE alp_entry_id LIKE 'mock-%'
+        """)
+        return cursor.execute("""
+            UPDATE alp_outbox
+            SET status = 'pending', alp_entry_id = NULL, attempts = 0, next_attempt_at = 0,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'sent' AND alp_entry_id LIKE 'mock-%'
+        """).rowcount
+    return _write_entries(write)
+
+def get_alp_outbox_summary(recent_limit=20):
+    """Counts outbox rows by status and lists the most recent problem rows."""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM time_entries")
-    conn.commit()
-    conn.close()
-    print("Cleared all records from the time_entries table.")
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT status, COUNT(*) AS count FROM alp_outbox GROUP BY status")
+        counts = {row['status']: row['count'] for row in cursor.fetchall()}
+        cursor.execute("""
+            SELECT id, idempotency_key, processed_entry_id, status, attempts, next_attempt_at, last_error, updated_at
+            FROM alp_outbox
+            WHERE last_error IS NOT NULL
+            ORDER BY updated_at DESC
+            LIMIT ?
+        """, (recent_limit,))
+        return {"counts": counts, "recent_errors": [dict(row) for row in cursor.fetchall()]}
+    finally:
+        conn.close()
 
 # Backward compatibility - deprecated functions
 def clear_data_for_date(date_str):
@@ -247,19 +1666,13 @@ def set_last_current_day_update(date_str=None):
     
     timestamp = datetime.now().isoformat()
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
+    _write(lambda cursor: cursor.execute("""
         INSERT INTO update_metadata (key, value, updated_at)
         VALUES ('last_current_day_update', ?, CURRENT_TIMESTAMP)
         ON CONFLICT(key) DO UPDATE SET
             value = excluded.value,
             updated_at = CURRENT_TIMESTAMP
-    """, (f"{date_str}|{timestamp}",))
-    
-    conn.commit()
-    conn.close()
+    """, (f"{date_str}|{timestamp}",)))
 
 def get_last_current_day_update():
     """Gets info about the last current day update."""
@@ -336,9 +1749,6 @@ def get_time_entries_by_date(date):
 
 def update_time_entry(entry_id, status=None, notes=None):
     """Updates a time entry's status and/or notes without affecting time aggregation."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     # Build update query dynamically
     updates = []
     params = []
@@ -353,7 +1763,6 @@ def update_time_entry(entry_id, status=None, notes=None):
     
     if not updates:
         print("No updates specified.")
-        conn.close()
         return False
     
     # Add updated timestamp
@@ -366,48 +1775,44 @@ def update_time_entry(entry_id, status=None, notes=None):
     WHERE entry_id = ?
     """
     
-    try:
+    def write(cursor, entry_dates):
         cursor.execute(update_sql, params)
-        
-        if cursor.rowcount > 0:
-            conn.commit()
-            print(f"✅ Updated time entry {entry_id}")
-            
-            # Show the updated entry
-            cursor.execute("SELECT * FROM time_entries WHERE entry_id = ?", (entry_id,))
-            updated_entry = cursor.fetchone()
-            if updated_entry:
-                print(f"   Status: {updated_entry['status']}")
-                if updated_entry['notes']:
-                    print(f"   Notes: {updated_entry['notes']}")
-            
-            return True
-        else:
-            print(f"❌ No time entry found with ID {entry_id}")
-            return False
-            
+        if cursor.rowcount == 0:
+            return None
+        cursor.execute("SELECT * FROM time_entries WHERE entry_id = ?", (entry_id,))
+        updated_entry = cursor.fetchone()
+        entry_dates.add(updated_entry["entry_date"])
+        return updated_entry
+
+    try:
+        updated_entry = _write_entries(write)
     except sqlite3.Error as e:
         print(f"Database error updating entry: {e}")
-        conn.rollback()
         return False
-    finally:
-        conn.close()
+
+    if updated_entry is None:
+        print(f"❌ No time entry found with ID {entry_id}")
+        return False
+
+    print(f"✅ Updated time entry {entry_id}")
+    # Show the updated entry
+    print(f"   Status: {updated_entry['status']}")
+    if updated_entry['notes']:
+        print(f"   Notes: {updated_entry['notes']}")
+    return True
 
 def update_time_entry_status(entry_id: int, status: str):
     """Updates the status of a specific time entry."""
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
+    def write(cursor, entry_dates):
         cursor.execute("UPDATE time_entries SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE entry_id = ?", (status, entry_id))
         if cursor.rowcount == 0:
             raise ValueError(f"No time entry found with ID {entry_id}")
-        conn.commit()
+        entry_dates.update(_entry_dates(cursor, "time_entries", "entry_id", [entry_id]))
         return True
+    try:
+        return _write_entries(write)
     except sqlite3.Error as e:
-        conn.rollback()
         raise Exception(f"Database error updating entry status: {e}")
-    finally:
-        conn.close()
 
 def get_processed_time_entries(date=None):
     """Retrieves processed time entries, optionally filtered by date."""
@@ -432,114 +1837,196 @@ def get_processed_time_entries(date=None):
     finally:
         conn.close()
 
-def create_processed_time_entry(entry_data):
-    """Creates or updates a processed time entry (upsert on source_hash+entry_date)."""
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
+PROCESSED_ENTRY_UPSERT_SQL = """
+INSERT INTO processed_time_entries (
+    original_entry_id,
+    entry_date,
+    application,
+    task_description,
+    time_units,
+    matter_code,
+    status,
+    notes,
+    source_hash,
+    source_key
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(source_key, entry_date) DO UPDATE SET
+    original_entry_id = excluded.original_entry_id,
+    application       = excluded.application,
+    task_description  = excluded.task_description,
+    time_units        = excluded.time_units,
+    matter_code       = excluded.matter_code,
+    status            = excluded.status,
+    notes             = excluded.notes,
+    updated_at        = CURRENT_TIMESTAMP
+WHERE processed_time_entries.source_hash = excluded.source_hash
+"""
 
-        # Convert date object to string for database storage if needed
-        entry_date = entry_data['entry_date']
-        if hasattr(entry_date, 'strftime'):
-            entry_date = entry_date.strftime('%Y-%m-%d')
-
-        upsert_sql = """
-        INSERT INTO processed_time_entries (
-            original_entry_id,
-            entry_date,
-            application,
-            task_description,
-            time_units,
-            matter_code,
-            status,
-            notes,
-            source_hash
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(source_hash, entry_date) DO UPDATE SET
-            original_entry_id = excluded.original_entry_id,
-            application       = excluded.application,
-            task_description  = excluded.task_description,
-            time_units        = excluded.time_units,
-            matter_code       = excluded.matter_code,
-            status            = excluded.status,
-            notes             = excluded.notes,
-            updated_at        = CURRENT_TIMESTAMP
-        """
+def _processed_entry_params(entry_data):
+    """Builds the PROCESSED_ENTRY_UPSERT_SQL parameters for one entry."""
+    # Convert date object to string for database storage if needed
+    entry_date = entry_data['entry_date']
+    if hasattr(entry_date, 'strftime'):
+        entry_date = entry_date.strftime('%Y-%m-%d')
+    return (
+        entry_data['original_entry_id'],
+        entry_date,
+        entry_data['application'],
+        entry_data['task_description'],
+        entry_data['time_units'],
+        entry_data.get('matter_code'),
+        entry_data.get('status', 'submitted'),
+        entry_data.get('notes'),
+        entry_data['source_hash'],
+        source_key(entry_data['source_hash']),
+    )
 
-        cursor.execute(
-            upsert_sql,
-            (
-                entry_data['original_entry_id'],
-                entry_date,
-                entry_data['application'],
-                entry_data['task_description'],
-                entry_data['time_units'],
-                entry_data.get('matter_code'),
-                entry_data.get('status', 'submitted'),
-                entry_data.get('notes'),
-                entry_data['source_hash'],
-            ),
-        )
+def _missing_ids(cursor, table, id_column, ids):
+    """Returns the ids (in input order) that have no row in table."""
+    placeholders = ",".join("?" * len(ids))
+    cursor.execute(f"SELECT {id_column} FROM {table} WHERE {id_column} IN ({placeholders})", ids)
+    found = {row[0] for row in cursor.fetchall()}
+    return [entry_id for entry_id in ids if entry_id not in found]
 
+def _entry_dates(cursor, table, id_column, ids):
+    """The distinct entry_date values of the rows of table with these ids."""
+    placeholders = ",".join("?" * len(ids))
+    cursor.execute(f"SELECT DISTINCT entry_date FROM {table} WHERE {id_column} IN ({placeholders})", ids)
+    return [row[0] for row in cursor.fetchall()]
+
+def create_processed_time_entry(entry_data):
+    """Creates or updates a processed time entry (upsert on source_key+entry_date)."""
+    params = _processed_entry_params(entry_data)
+
+    def write(cursor, entry_dates):
+        entry_dates.add(params[1])
+        _fill_source_keys(cursor, "processed_time_entries", [(params[9], params[8])])
+        cursor.execute(PROCESSED_ENTRY_UPSERT_SQL, params)
+        if cursor.rowcount < 1:
+            _check_source_key_collisions(cursor, "processed_time_entries", [params], 9, 8)
         # Fetch the upserted row
         cursor.execute(
-            "SELECT * FROM processed_time_entries WHERE source_hash = ? AND entry_date = ?",
-            (entry_data['source_hash'], entry_date),
+            "SELECT * FROM processed_time_entries WHERE source_key = ? AND entry_date = ?",
+            (params[9], params[1]),
         )
-        created_entry = cursor.fetchone()
-        conn.commit()
-        return convert_db_entry_to_dict(created_entry) if created_entry else None
+        return cursor.fetchone()
 
+    try:
+        created_entry = _write_entries(write)
     except sqlite3.Error as e:
         print(f"Database error creating processed entry: {e}")
-        conn.rollback()
         raise
-    finally:
-        conn.close()
+    return convert_db_entry_to_dict(created_entry) if created_entry else None
 
-def populate_missing_time_units():
-    """Populate time_units for entries that don't have them calculated."""
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
-        
-        # Find entries without time_units
-        cursor.execute("SELECT entry_id, total_seconds FROM time_entries WHERE time_units IS NULL")
-        entries_to_update = cursor.fetchall()
-        
-        if not entries_to_update:
-            print("All time entries already have time_units calculated.")
-            return
-        
-        # Import the conversion function
-        import math
-        def seconds_to_units(seconds):
-            if seconds <= 0:
-                return 0.1  # Minimum 1 unit for any activity
-            units = seconds / 360  # 360 seconds = 6 minutes = 1 unit
-            return math.ceil(units * 10) / 10  # Round up to nearest 0.1
-        
-        # Update each entry
-        updated_count = 0
-        for entry in entries_to_update:
-            entry_id = entry['entry_id']
-            total_seconds = entry['total_seconds']
-            time_units = seconds_to_units(total_seconds)
-            
+def confirm_time_entries(entries):
+    """
+    Upserts processed entries for a batch of confirmed time entries and marks their
+    originals as submitted, all in one transaction. Raises ValueError (and changes
+    nothing) if any original_entry_id does not exist. Returns the processed rows in input order.
+    """
+    if not entries:
+        return []
+    params = [_processed_entry_params(entry) for entry in entries]
+    original_ids = list(dict.fromkeys(p[0] for p in params))
+
+    def write(cursor, entry_dates):
+        missing = _missing_ids(cursor, "time_entries", "entry_id", original_ids)
+        if missing:
+            raise ValueError(f"No time entry found with ID(s) {', '.join(map(str, missing))}")
+        entry_dates.update(_entry_dates(cursor, "time_entries", "entry_id", original_ids))
+        entry_dates.update(p[1] for p in params)
+
+        _fill_source_keys(cursor, "processed_time_entries", [(p[9], p[8]) for p in params])
+        cursor.executemany(PROCESSED_ENTRY_UPSERT_SQL, params)
+        if cursor.rowcount < len(params):
+            _check_source_key_collisions(cursor, "processed_time_entries", params, 9, 8)
+        cursor.executemany(
+            "UPDATE time_entries SET status = 'submitted', updated_at = CURRENT_TIMESTAMP WHERE entry_id = ?",
+            [(entry_id,) for entry_id in original_ids],
+        )
+
+        confirmed = []
+        for p in params:
             cursor.execute(
-                "UPDATE time_entries SET time_units = ?, updated_at = CURRENT_TIMESTAMP WHERE entry_id = ?",
-                (time_units, entry_id)
+                "SELECT * FROM processed_time_entries WHERE source_key = ? AND entry_date = ?",
+                (p[9], p[1]),
             )
-            updated_count += 1
-        
-        conn.commit()
-        print(f"Successfully populated time_units for {updated_count} entries.")
-        
+            confirmed.append(convert_db_entry_to_dict(cursor.fetchone()))
+        return confirmed
+    return _write_entries(write)
+
+def set_time_entries_status(entry_ids, status):
+    """
+    Sets the status of many time entries in one transaction. Raises ValueError (and
+    changes nothing) if any id does not exist. Returns the number of entries updated.
+    """
+    entry_ids = list(dict.fromkeys(entry_ids))
+    if not entry_ids:
+        return 0
+
+    def write(cursor, entry_dates):
+        missing = _missing_ids(cursor, "time_entries", "entry_id", entry_ids)
+        if missing:
+            raise ValueError(f"No time entry found with ID(s) {', '.join(map(str, missing))}")
+        entry_dates.update(_entry_dates(cursor, "time_entries", "entry_id", entry_ids))
+        cursor.executemany(
+            "UPDATE time_entries SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE entry_id = ?",
+            [(status, entry_id) for entry_id in entry_ids],
+        )
+        return len(entry_ids)
+    return _write_entries(write)
+
+def revert_processed_time_entries(processed_entry_ids):
+    """
+    Deletes processed entries and sets their original time entries back to 'pending',
+    in one transaction. Raises ValueError (and changes nothing) if any processed entry
+    does not exist. Returns the original entry ids that were reverted.
+    """
+    processed_entry_ids = list(dict.fromkeys(processed_entry_ids))
+    if not processed_entry_ids:
+        return []
+
+    def write(cursor, entry_dates):
+        placeholders = ",".join("?" * len(processed_entry_ids))
+        cursor.execute(
+            f"SELECT id, original_entry_id, entry_date FROM processed_time_entries WHERE id IN ({placeholders})",
+            processed_entry_ids,
+        )
+        rows = cursor.fetchall()
+        originals = {row["id"]: row["original_entry_id"] for row in rows}
+        entry_dates.update(row["entry_date"] for row in rows)
+        missing = [entry_id for entry_id in processed_entry_ids if entry_id not in originals]
+        if missing:
+            raise ValueError(f"No processed time entry found with ID(s) {', '.join(map(str, missing))}")
+
+        cursor.executemany(
+            "DELETE FROM processed_time_entries WHERE id = ?",
+            [(entry_id,) for entry_id in processed_entry_ids],
+        )
+        original_ids = [original_id for original_id in dict.fromkeys(originals.values()) if original_id]
+        if original_ids:
+            entry_dates.update(_entry_dates(cursor, "time_entries", "entry_id", original_ids))
+        cursor.executemany(
+            "UPDATE time_entries SET status = 'pending', updated_at = CURRENT_TIMESTAMP WHERE entry_id = ?",
+            [(original_id,) for original_id in original_ids],
+        )
+        return original_ids
+    return _write_entries(write)
+
+def populate_missing_time_units():
+    """
+    Populate time_units for entries that don't have them calculated, in short chunked
+    transactions (see migrations.fill_missing_time_units).
+    """
+    try:
+        updated_count = migrations.fill_missing_time_units()
     except sqlite3.Error as e:
         print(f"Database error populating time_units: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+        return
+    if updated_count:
+        print(f"Successfully populated time_units for {updated_count} entries.")
+    else:
+        print("All time entries already have time_units calculated.")
 
 def get_processed_entry_by_id(entry_id):
     """Retrieves a single processed time entry by its ID."""
@@ -554,17 +2041,94 @@ def get_processed_entry_by_id(entry_id):
 
 def delete_processed_time_entry(entry_id):
     """Deletes a processed time entry by its ID."""
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
+    def write(cursor, entry_dates):
+        entry_dates.update(_entry_dates(cursor, "processed_time_entries", "id", [entry_id]))
         cursor.execute("DELETE FROM processed_time_entries WHERE id = ?", (entry_id,))
         if cursor.rowcount == 0:
             raise ValueError(f"No processed time entry found with ID {entry_id}")
-        conn.commit()
         return True
+    try:
+        return _write_entries(write)
     except sqlite3.Error as e:
-        conn.rollback()
         raise Exception(f"Database error deleting processed entry: {e}")
+
+# --- Tenants (multi-user deployments) ---
+
+def upsert_tenant(user_id, display_name=None, rescuetime_api_key=None):
+    """Registers a user in the main database, or updates the fields given for an existing one."""
+    _write(lambda cursor: cursor.execute("""
+        INSERT INTO tenants (user_id, display_name, rescuetime_api_key) VALUES (?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            display_name = COALESCE(excluded.display_name, display_name),
+            rescuetime_api_key = COALESCE(excluded.rescuetime_api_key, rescuetime_api_key),
+            updated_at = CURRENT_TIMESTAMP
+    """, (user_id, display_name, rescuetime_api_key)), db_file=DB_FILE)
+
+def get_tenant(user_id):
+    """Returns a registered user as a dict, or None."""
+    rows = list_tenants(user_id)
+    return rows[0] if rows else None
+
+def list_tenants(user_id=None):
+    """
+    Returns every registered user (or just user_id), ordered by user_id. A database created
+    before multi-tenant support has no tenants table and therefore no users.
+    """
+    conn = get_db_connection(db_file=DB_FILE)
+    try:
+        if user_id is None:
+            rows = conn.execute("SELECT * FROM tenants ORDER BY user_id")
+        else:
+            rows = conn.execute("SELECT * FROM tenants WHERE user_id = ?", (user_id,))
+        return [dict(row) for row in rows]
+    except sqlite3.OperationalError as e:
+        if "no such table" in str(e):
+            return []
+        raise
+    finally:
+        conn.close()
+
+def rollup_time_entries(shards, start_date, end_date, group_by):
+    """
+    Aggregates time_entries across several databases by ATTACHing them read-only to one
+    in-memory connection. shards maps user_id -> database file; each returned row is one
+    (user_id, *group_by) group. SQLite limits how many databases can be attached at once,
+    so shards are queried in batches of that size.
+    """
+    group_cols = ", ".join(group_by)
+    select_cols = f"{group_cols}, " if group_by else ""
+    group_clause = f"GROUP BY {group_cols}" if group_by else ""
+    conn = sqlite3.connect("file::memory:", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        batch_size = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        items = list(shards.items())
+        rows = []
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            selects, params = [], []
+            for i, (user_id, path) in enumerate(batch):
+                conn.execute(f"ATTACH DATABASE ? AS shard{i}", (Path(live_db_file(path)).resolve().as_uri() + "?mode=ro",))
+                selects.append(f"""
+                    SELECT ? AS user_id, {select_cols}
+                           COUNT(*) AS entry_count,
+                           SUM(total_seconds) AS total_seconds,
+                           ROUND(CAST(SUM(time_units) AS NUMERIC), 1) AS time_units,
+                           MIN(entry_date) AS first_date,
+                           MAX(entry_date) AS last_date
+                    FROM shard{i}.time_entries
+                    WHERE entry_date BETWEEN ? AND ?
+                    {group_clause}
+                """)
+                params += [user_id, start_date, end_date]
+            try:
+                order = ", ".join(["user_id"] + list(group_by))
+                sql = " UNION ALL ".join(selects) + f" ORDER BY {order}"
+                rows.extend(dict(row) for row in conn.execute(sql, params) if row["entry_count"])
+            finally:
+                for i in range(len(batch)):
+                    conn.execute(f"DETACH DATABASE shard{i}")
+        return rows
     finally:
         conn.close()
 
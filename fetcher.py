@@ -1,11 +1,21 @@
 import requests
 import os
 from dotenv import load_dotenv
+import tenants
+from instrumentation import get_logger, stage
+
+logger = get_logger(__name__)
 
 def get_api_key():
     """
-    Reads the API key from environment variables loaded from .env
+    Returns the current user's RescueTime API key when running as a tenant
+    (see tenants.tenant_context), otherwise reads it from environment variables loaded from .env
     """
+    tenant = tenants.current_tenant()
+    if tenant is not None:
+        if not tenant["rescuetime_api_key"]:
+            raise ValueError(f"Error: no RescueTime API key registered for user {tenant['user_id']}.")
+        return tenant["rescuetime_api_key"]
     load_dotenv()
     api_key = os.getenv('RESCUETIME_API_KEY')
     if not api_key:
@@ -16,11 +26,11 @@ def fetch_data_for_date(date_str):
     """
     Fetches the raw document-level data from the RescueTime API for a specific date.
     """
-    print(f"Fetching data from RescueTime API for {date_str}...")
+    logger.info("Fetching data from RescueTime API for %s...", date_str)
     try:
         api_key = get_api_key()
     except (FileNotFoundError, ValueError) as e:
-        print(e)
+        logger.error("%s", e)
         return None
 
     base_url = "https://www.rescuetime.com/anapi/data"
@@ -33,12 +43,14 @@ def fetch_data_for_date(date_str):
         'restrict_kind': 'document', # Fetch the most granular data
     }
 
-    response = requests.get(base_url, params=params)
+    with stage("fetch"):
+        response = requests.get(base_url, params=params)
 
     if response.status_code == 200:
-        print("Successfully fetched data.")
-        return response.json()
+        data = response.json()
+        logger.info("Successfully fetched data.", extra={"date": date_str, "rows": len(data.get("rows", []))})
+        return data
     else:
-        print(f"Error fetching data: {response.status_code}")
-        print(response.text)
+        logger.error("Error fetching data: %s %s", response.status_code, response.text,
+                     extra={"date": date_str, "status": response.status_code})
         return None 
\ No newline at end of file
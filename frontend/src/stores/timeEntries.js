@@ -69,38 +69,57 @@ export const useTimeEntriesStore = defineStore('timeEntries', () => {
     }
   }
 
+  function buildProcessedEntry(entryId, editedData = {}) {
+    const originalEntry = timeEntries.value.find(e => e.entry_id === entryId)
+    if (!originalEntry) {
+      throw new Error(`Original entry ${entryId} not found`)
+    }
+
+    return {
+      original_entry_id: entryId,
+      entry_date: currentDate.value,
+      application: originalEntry.application,
+      task_description: editedData.task_description || originalEntry.task_description,
+      time_units: editedData.time_units || originalEntry.time_units,
+      matter_code: editedData.matter_code || originalEntry.matter_code,
+      notes: editedData.notes || '',
+      status: 'submitted',
+      source_hash: originalEntry.source_hash
+    }
+  }
+
+  function setLocalStatus(entryIds, status) {
+    const ids = new Set(entryIds)
+    timeEntries.value.forEach(entry => {
+      if (ids.has(entry.entry_id)) {
+        entry.status = status
+      }
+    })
+  }
+
+  function mergeProcessedEntries(entries) {
+    entries.forEach(result => {
+      const existingIndex = processedEntries.value.findIndex(e => e.id === result.id)
+      if (existingIndex >= 0) {
+        processedEntries.value[existingIndex] = result
+      } else {
+        processedEntries.value.push(result)
+      }
+    })
+  }
+
   async function confirmTimeEntry(entryId, editedData) {
     loading.value = true
     error.value = null
     
     try {
-      const originalEntry = timeEntries.value.find(e => e.entry_id === entryId)
-      if (!originalEntry) {
-        throw new Error('Original entry not found')
-      }
-
-      const processedEntry = {
-        original_entry_id: entryId,
-        entry_date: currentDate.value,
-        application: originalEntry.application,
-        task_description: editedData.task_description || originalEntry.task_description,
-        time_units: editedData.time_units || originalEntry.time_units,
-        matter_code: editedData.matter_code || originalEntry.matter_code,
-        notes: editedData.notes || '',
-        status: 'submitted',
-        source_hash: originalEntry.source_hash
-      }
-
-      const result = await apiClient.createProcessedTimeEntry(processedEntry)
+      const result = await apiClient.createProcessedTimeEntry(buildProcessedEntry(entryId, editedData))
       
       // Add to processed entries
-      processedEntries.value.push(result)
+      mergeProcessedEntries([result])
       
       // Mark the original entry as submitted (don't remove it)
-      const entryIndex = timeEntries.value.findIndex(e => e.entry_id === entryId)
-      if (entryIndex >= 0) {
-        timeEntries.value[entryIndex].status = 'submitted'
-      }
+      setLocalStatus([entryId], 'submitted')
       
     } catch (err) {
       error.value = `Failed to confirm entry: ${err.message}`
@@ -111,6 +130,30 @@ export const useTimeEntriesStore = defineStore('timeEntries', () => {
     }
   }
 
+  // Confirms many entries in one request/transaction.
+  // editedDataById optionally maps entry_id -> edited fields, as for confirmTimeEntry.
+  async function confirmTimeEntries(entryIds, editedDataById = {}) {
+    if (!entryIds.length) return []
+    loading.value = true
+    error.value = null
+    
+    try {
+      const payload = entryIds.map(id => buildProcessedEntry(id, editedDataById[id]))
+      const results = await apiClient.confirmTimeEntries(payload)
+      
+      mergeProcessedEntries(results)
+      setLocalStatus(entryIds, 'submitted')
+      return results
+      
+    } catch (err) {
+      error.value = `Failed to confirm entries: ${err.message}`
+      console.error('Bulk confirm error:', err)
+      throw err
+    } finally {
+      loading.value = false
+    }
+  }
+
   async function ignoreTimeEntry(entryId) {
     loading.value = true
     error.value = null
@@ -133,6 +176,24 @@ export const useTimeEntriesStore = defineStore('timeEntries', () => {
     }
   }
 
+  async function ignoreTimeEntries(entryIds) {
+    if (!entryIds.length) return
+    loading.value = true
+    error.value = null
+    
+    try {
+      await apiClient.ignoreTimeEntries(entryIds)
+      setLocalStatus(entryIds, 'ignored')
+      
+    } catch (err) {
+      error.value = `Failed to ignore entries: ${err.message}`
+      console.error('Bulk ignore error:', err)
+      throw err
+    } finally {
+      loading.value = false
+    }
+  }
+
   async function revertTimeEntry(entryId) {
     loading.value = true
     error.value = null
@@ -155,6 +216,28 @@ export const useTimeEntriesStore = defineStore('timeEntries', () => {
     }
   }
 
+  async function revertTimeEntries(processedEntryIds) {
+    if (!processedEntryIds.length) return
+    loading.value = true
+    error.value = null
+    
+    try {
+      const result = await apiClient.revertTimeEntries(processedEntryIds)
+      
+      // Apply the revert locally instead of refetching the day
+      const reverted = new Set(processedEntryIds)
+      processedEntries.value = processedEntries.value.filter(e => !reverted.has(e.id))
+      setLocalStatus(result.entry_ids, 'pending')
+      
+    } catch (err) {
+      error.value = `Failed to revert entries: ${err.message}`
+      console.error('Bulk revert error:', err)
+      throw err
+    } finally {
+      loading.value = false
+    }
+  }
+
   async function fetchRescueTimeData(days = 4, targetDate = null) {
     loading.value = true
     error.value = null
@@ -240,8 +323,11 @@ export const useTimeEntriesStore = defineStore('timeEntries', () => {
     fetchTimeEntries,
     fetchProcessedTimeEntries,
     confirmTimeEntry,
+    confirmTimeEntries,
     ignoreTimeEntry,
+    ignoreTimeEntries,
     revertTimeEntry,
+    revertTimeEntries,
     fetchRescueTimeData,
     processRescueTimeData,
     setCurrentDate,
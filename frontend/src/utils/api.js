@@ -54,6 +54,27 @@ class ApiClient {
     })
   }
 
+  async confirmTimeEntries(entries) {
+    return this.request('/processed_time_entries/bulk', {
+      method: 'POST',
+      body: JSON.stringify({ entries }),
+    })
+  }
+
+  async ignoreTimeEntries(entryIds) {
+    return this.request('/time_entries/bulk/ignore', {
+      method: 'PUT',
+      body: JSON.stringify({ entry_ids: entryIds }),
+    })
+  }
+
+  async revertTimeEntries(processedEntryIds) {
+    return this.request('/processed_time_entries/bulk/revert', {
+      method: 'PUT',
+      body: JSON.stringify({ entry_ids: processedEntryIds }),
+    })
+  }
+
   // Jobs
   async fetchData(days = 4, targetDate = null) {
     const payload = { days }
@@ -90,12 +111,17 @@ class ApiClient {
     return this.request('/settings')
   }
 
-  async submitToAlp(processedEntries) {
-    return this.request('/time_entries', {
+  async submitToAlp(alpEntries) {
+    // Queued server-side and posted to ALP by the background outbox worker
+    return this.request('/alp/outbox', {
       method: 'POST',
-      body: JSON.stringify(processedEntries),
+      body: JSON.stringify(alpEntries),
     })
   }
+
+  async getAlpOutbox() {
+    return this.request('/alp/outbox')
+  }
 }
 
 export const apiClient = new ApiClient()
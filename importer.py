@@ -0,0 +1,264 @@
+"""
+Offline import of RescueTime data exports (CSV, JSON or JSON Lines, optionally gzipped).
+
+Backfilling history through the API costs one call per day; a full export holds years of it.
+The file is streamed, never loaded whole: rows are read one at a time, normalized into the
+(log_date, seconds, activity, category, productivity, document) tuples upsert_activity_data
+takes, and staged in batches of IMPORT_BATCH_ROWS, one transaction each. A final transaction
+merges the staged rows into activity_log (see database.merge_activity_import), summing rows
+of the same day, activity and document (exports can have one row per hour), and marks them
+for processing.
+
+Columns are found by their header, so both the analytic API's column names ("Date",
+"Time Spent (seconds)", "Activity", "Document", "Category", "Productivity") and plain ones
+("date", "seconds", ...) work. JSON may be the API's {"row_headers": [...], "rows": [[...]]}
+shape or an array of objects; JSON Lines holds one object per line. Dates may carry a time
+("2025-06-02T10:00:00"); rows without a document are stored under "No Details", as the API
+reports them.
+"""
+import csv
+import gzip
+import json
+import os
+import re
+import time
+from datetime import date
+from itertools import chain
+
+import database
+import jobs
+from instrumentation import get_logger, stage
+from storage import get_storage
+
+logger = get_logger(__name__)
+
+IMPORT_BATCH_ROWS = int(os.getenv("IMPORT_BATCH_ROWS", "200000"))
+IMPORT_FORMATS = ("csv", "json", "jsonl")
+JSON_CHUNK_CHARS = 1 << 20
+
+NO_DOCUMENT = "No Details"
+
+# Lower-cased header -> field
+HEADER_FIELDS = {
+    "date": "log_date", "day": "log_date", "log_date": "log_date", "time": "log_date", "timestamp": "log_date",
+    "time spent (seconds)": "seconds", "seconds": "seconds", "time_spent_seconds": "seconds", "duration": "seconds",
+    "activity": "activity", "application": "activity",
+    "document": "document", "title": "document",
+    "category": "category",
+    "productivity": "productivity",
+}
+REQUIRED_FIELDS = ("log_date", "seconds", "activity")
+
+def detect_format(path):
+    name = path.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    for fmt, extensions in (("csv", (".csv",)), ("json", (".json",)), ("jsonl", (".jsonl", ".ndjson"))):
+        if name.endswith(extensions):
+            return fmt
+    raise ValueError(f"Cannot tell the format of {path}; pass one of: {', '.join(IMPORT_FORMATS)}")
+
+def _open_text(path):
+    if path.lower().endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8-sig", newline="")
+    return open(path, "r", encoding="utf-8-sig", newline="")
+
+def _int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return int(float(value))
+
+def row_parser(headers):
+    """A function turning one export row (a sequence in header order) into an activity_log tuple."""
+    index = {}
+    for i, header in enumerate(headers):
+        field = HEADER_FIELDS.get(str(header).strip().lower())
+        if field and field not in index:
+            index[field] = i
+    missing = [field for field in REQUIRED_FIELDS if field not in index]
+    if missing:
+        raise ValueError(f"Export has no {', '.join(missing)} column (columns: {', '.join(map(str, headers))})")
+    date_i, seconds_i, activity_i = index["log_date"], index["seconds"], index["activity"]
+    category_i, productivity_i, document_i = index.get("category"), index.get("productivity"), index.get("document")
+
+    def parse(row):
+        log_date = str(row[date_i])[:10]
+        date.fromisoformat(log_date)  # rejects anything that is not a YYYY-MM-DD date
+        activity = row[activity_i]
+        if not activity:
+            raise ValueError("no activity")
+        category = row[category_i] or None if category_i is not None else None
+        productivity = row[productivity_i] if productivity_i is not None else None
+        document = row[document_i] if document_i is not None else None
+        return (
+            log_date,
+            _int(row[seconds_i]),
+            activity,
+            category,
+            _int(productivity) if productivity not in (None, "") else None,
+            document or NO_DOCUMENT,
+        )
+    return parse
+
+# --- Readers: each returns (headers, iterator of rows in header order) ---
+
+def _csv_rows(f):
+    reader = csv.reader(f)
+    headers = next(reader, None)
+    if headers is None:
+        return [], iter(())
+    return headers, reader
+
+def _object_rows(items):
+    """Rows of a stream of JSON objects, in the key order of the first one."""
+    first = next(items, None)
+    if first is None:
+        return [], iter(())
+    if not isinstance(first, dict):
+        raise ValueError("JSON rows without row_headers must be objects")
+    headers = list(first)
+    return headers, (tuple(item.get(header) for header in headers) for item in chain([first], items))
+
+class _JsonStream:
+    """Incremental reader of one JSON document, for walking large arrays element by element."""
+
+    _WHITESPACE = re.compile(r"\s*")
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = self.f.read(JSON_CHUNK_CHARS)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+        return bool(chunk)
+
+    def peek(self):
+        """The next non-whitespace character, without consuming it ("" at the end)."""
+        while True:
+            self.pos = self._WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def take(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Invalid JSON export: expected {char!r}, found {self.peek()!r}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def array(self):
+        """Yields the elements of the array starting here."""
+        self.take("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            char = self.peek()
+            self.pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError(f"Invalid JSON export: expected ',' or ']', found {char!r}")
+
+def _json_rows(f):
+    stream = _JsonStream(f)
+    if stream.peek() == "[":
+        return _object_rows(stream.array())
+
+    # {"row_headers": [...], "rows": [[...], ...], ...}: stream "rows", read anything before it
+    stream.take("{")
+    headers = None
+    while stream.peek() != "}":
+        key = stream.value()
+        stream.take(":")
+        if key == "rows":
+            if headers is None:
+                return _object_rows(stream.array())
+            return headers, stream.array()
+        value = stream.value()
+        if key == "row_headers":
+            headers = value
+        if stream.peek() == ",":
+            stream.pos += 1
+    return headers or [], iter(())
+
+def _jsonl_rows(f):
+    return _object_rows(json.loads(line) for line in f if line.strip())
+
+READERS = {"csv": _csv_rows, "json": _json_rows, "jsonl": _jsonl_rows}
+
+def run_import(path, fmt=None, process=False, batch_rows=None, defer_indexes=None):
+    """
+    Imports a RescueTime export file into activity_log. Rows that cannot be parsed are
+    skipped (the first few are logged). With process, the processing job runs afterwards.
+    Returns a summary dict.
+    """
+    if get_storage().name != "sqlite":
+        raise RuntimeError("Import loads the SQLite database; use STORAGE_BACKEND=sqlite.")
+    fmt = fmt or detect_format(path)
+    if fmt not in READERS:
+        raise ValueError(f"Unknown import format '{fmt}'. Choose from: {', '.join(IMPORT_FORMATS)}")
+    batch_rows = batch_rows or IMPORT_BATCH_ROWS
+
+    started = time.perf_counter()
+    read = skipped = 0
+    database.begin_activity_import()
+    with _open_text(path) as f, stage("import_read"):
+        headers, rows = READERS[fmt](f)
+        parse = row_parser(headers) if headers else None
+        batch = []
+        for row in rows:
+            read += 1
+            try:
+                batch.append(parse(row))
+            except (ValueError, TypeError, IndexError) as e:
+                skipped += 1
+                if skipped <= 5:
+                    logger.warning("Skipped row %d of %s (%s): %r", read, path, e, row)
+                continue
+            if len(batch) >= batch_rows:
+                database.stage_activity_rows(batch)
+                batch = []
+                logger.info("Staged %d rows...", read - skipped)
+        if batch:
+            database.stage_activity_rows(batch)
+
+    merged, dates = database.merge_activity_import(defer_indexes)
+    elapsed = time.perf_counter() - started
+    summary = {
+        "rows_read": read,
+        "rows_skipped": skipped,
+        "records": merged,
+        "dates": len(dates),
+        "first_date": dates[0] if dates else None,
+        "last_date": dates[-1] if dates else None,
+        "seconds": round(elapsed, 2),
+    }
+    logger.info("Imported %d rows from %s as %d records over %d day(s) in %.1fs (%.0f rows/s).",
+                read - skipped, path, merged, len(dates), elapsed, read / elapsed if elapsed else 0, extra=summary)
+    if process:
+        jobs.run_process_job()
+    return summary
@@ -0,0 +1,227 @@
+"""
+Lightweight in-process instrumentation: counters, gauges and latency histograms for the
+fetch/process pipeline and the API, rendered in the Prometheus text format at /api/metrics,
+plus the logging setup shared by the CLI and the API.
+
+Pipeline code wraps each stage in `stage("name")`; metrics are plain dicts guarded by one
+lock, so recording costs a perf_counter() call and a dict update. Hot-path messages go
+through `get_logger(__name__)` with %-style arguments, so nothing is formatted when the
+level is disabled.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # "text" or "logfmt"
+
+# Upper bounds (seconds) for latency histograms: 1 ms .. 5 min
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_lock = threading.Lock()
+_metrics = {}  # name -> metric, in registration order
+
+def _label_key(label_names, labels):
+    return tuple(str(labels.get(name, "")) for name in label_names)
+
+def _format_labels(label_names, key, extra=None):
+    pairs = list(zip(label_names, key)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonically increasing count, optionally split by labels."""
+    type_name = "counter"
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.label_names, labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(self.label_names, labels), 0)
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_number(value)}"
+
+class Gauge(Counter):
+    """A value that can go up and down (e.g. queue length), optionally split by labels."""
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = _label_key(self.label_names, labels)
+        with _lock:
+            self._values[key] = value
+
+class Histogram:
+    """Cumulative-bucket histogram of observed durations, optionally split by labels."""
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = _label_key(self.label_names, labels)
+        with _lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels):
+        series = self._values.get(_label_key(self.label_names, labels))
+        return series[-1] if series else 0
+
+    def samples(self):
+        for key, series in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(self.label_names, key, [('le', _format_number(bound))])} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.label_names, key, [('le', '+Inf')])} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_number(series[-2])}"
+            yield f"{self.name}_count{_format_labels(self.label_names, key)} {series[-1]}"
+
+def _register(metric):
+    with _lock:
+        return _metrics.setdefault(metric.name, metric)
+
+def counter(name, help_text, label_names=()):
+    """Returns the counter registered under name, creating it on first use."""
+    return _register(Counter(name, help_text, label_names))
+
+def gauge(name, help_text, label_names=()):
+    """Returns the gauge registered under name, creating it on first use."""
+    return _register(Gauge(name, help_text, label_names))
+
+def histogram(name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+    """Returns the histogram registered under name, creating it on first use."""
+    return _register(Histogram(name, help_text, label_names, buckets))
+
+STAGE_SECONDS = histogram(
+    "rescuetime_stage_duration_seconds", "Time spent in each fetch/process pipeline stage.", ("stage",)
+)
+STAGE_ITEMS = counter(
+    "rescuetime_stage_items_total", "Rows or entries handled by each pipeline stage.", ("stage",)
+)
+STAGE_ERRORS = counter(
+    "rescuetime_stage_errors_total", "Pipeline stages that raised an exception.", ("stage",)
+)
+HTTP_REQUEST_SECONDS = histogram(
+    "rescuetime_http_request_duration_seconds", "API request latency by route.", ("method", "route", "status")
+)
+
+@contextmanager
+def stage(name, items=None):
+    """
+    Times a pipeline stage (fetch, upsert, canonicalize, aggregate, upsert_entries, commit,
+    mark_processed, ...). items, if given, is added to the stage's item counter.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+        if items:
+            STAGE_ITEMS.inc(items, stage=name)
+
+def count(stage_name, items):
+    """Adds items to a stage's counter when the count is only known after the stage ran."""
+    if items:
+        STAGE_ITEMS.inc(items, stage=stage_name)
+
+def render_prometheus():
+    """All registered metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    with _lock:
+        metrics = list(_metrics.values())
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        with _lock:
+            lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+def reset():
+    """Clears every recorded value (metrics stay registered)."""
+    with _lock:
+        for metric in _metrics.values():
+            metric._values.clear()
+
+# --- Logging ---
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class LogfmtFormatter(logging.Formatter):
+    """Formats records as logfmt (key=value) lines, including any `extra=` fields."""
+
+    def format(self, record):
+        fields = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            fields["exc"] = self.formatException(record.exc_info)
+        return " ".join(f"{key}={self._quote(value)}" for key, value in fields.items())
+
+    @staticmethod
+    def _quote(value):
+        text = str(value)
+        if not text or any(ch in text for ch in ' "=\n'):
+            return '"' + text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        return text
+
+def get_logger(module_name):
+    """Logger for a project module; all of them live under the 'rescuetime' namespace."""
+    return logging.getLogger(f"rescuetime.{module_name}")
+
+def configure_logging(level=None, fmt=None):
+    """
+    Sends the project's log records to stderr. Text format prints just the message (the CLI's
+    usual progress output); logfmt adds timestamps, levels and structured fields.
+    Safe to call more than once.
+    """
+    logger = logging.getLogger("rescuetime")
+    logger.setLevel((level or LOG_LEVEL).upper())
+    fmt = fmt or LOG_FORMAT
+    handler = next((h for h in logger.handlers if getattr(h, "_rescuetime", False)), None)
+    if handler is None:
+        handler = logging.StreamHandler(sys.stderr)
+        handler._rescuetime = True
+        logger.addHandler(handler)
+        logger.propagate = False
+    handler.setFormatter(LogfmtFormatter() if fmt == "logfmt" else logging.Formatter("%(message)s"))
+    return logger
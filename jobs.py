@@ -1,16 +1,45 @@
 from datetime import date, timedelta
 import fetcher
-import database
+from storage import get_storage
 import processor
+import raw_store
+import tenants
+from instrumentation import get_logger, stage
 
-def run_fetch_job(days: int = 4, target_date: str = None):
+logger = get_logger(__name__)
+
+# Stored rows upserted per transaction by run_replay_job
+REPLAY_BATCH_ROWS = 50000
+
+def activity_rows_from_response(date_str, data):
+    """
+    Converts a RescueTime API response into activity_log rows for upsert_activity_data.
+    """
+    processed_data = []
+    for row in data['rows']:
+        if len(row) >= 7:  # Ensure we have all required fields
+            # RescueTime API returns: [rank, time_spent_seconds, number_of_people, activity, document, category, productivity]
+            processed_data.append((
+                date_str,           # log_date
+                row[1],             # time_spent_seconds
+                row[3],             # activity
+                row[5],             # category
+                row[6],             # productivity
+                row[4]              # document
+            ))
+    return processed_data
+
+def run_fetch_job(days: int = 4, target_date: str = None, refetch: bool = False):
     """
     Runs the data fetching job for the last N days from a target date.
     This function is designed to be called from the CLI or as a background task from the API.
+    Every response is kept in the raw store; closed past days already stored there are
+    skipped unless refetch is set.
     
     Args:
         days: Number of days to fetch (default 4 for target date + 3 days before)
         target_date: Target date in YYYY-MM-DD format. If None, uses today.
+        refetch: Call the API even for days whose final data is already stored.
     """
     if target_date:
         try:
@@ -18,54 +47,108 @@ def run_fetch_job(days: int = 4, target_date: str = None):
             from datetime import datetime
             target = datetime.strptime(target_date, "%Y-%m-%d").date()
         except ValueError:
-            print(f"Invalid target_date format: {target_date}. Using today instead.")
+            logger.warning("Invalid target_date format: %s. Using today instead.", target_date)
             target = date.today()
     else:
         target = date.today()
     
-    print(f"Starting fetch job for {days} day(s) from {target.strftime('%Y-%m-%d')}...")
+    logger.info("Starting fetch job for %d day(s) from %s...", days, target.strftime('%Y-%m-%d'))
     
     # Fetch for the number of days specified, starting from target date and going backwards
     dates_to_fetch = [(target - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
     
     for date_str in dates_to_fetch:
-        print(f"--> Processing {date_str}")
+        logger.info("--> Processing %s", date_str)
+        stored = None if refetch else raw_store.closed_fetch(date_str)
+        if stored:
+            logger.info("    Skipping %s: final data already stored (fetched %s). Use replay to reload it.",
+                        date_str, stored["fetched_at"])
+            continue
         # Mark existing raw data for this date for reprocessing to ensure full aggregation
-        database.mark_date_for_reprocessing(date_str)
+        get_storage().mark_date_for_reprocessing(date_str)
         
         # Fetch new data from the RescueTime API
         data = fetcher.fetch_data_for_date(date_str)
         
         if data and 'rows' in data:
-            # Process the RescueTime API response into the expected format
-            processed_data = []
-            for row in data['rows']:
-                if len(row) >= 7:  # Ensure we have all required fields
-                    # RescueTime API returns: [rank, time_spent_seconds, number_of_people, activity, document, category, productivity]
-                    processed_data.append((
-                        date_str,           # log_date
-                        row[1],             # time_spent_seconds
-                        row[3],             # activity
-                        row[5],             # category
-                        row[6],             # productivity
-                        row[4]              # document
-                    ))
+            raw_store.save_response(date_str, data)
+            processed_data = activity_rows_from_response(date_str, data)
             
             if processed_data:
-                database.upsert_activity_data(processed_data)
-                print(f"    Successfully fetched and upserted {len(processed_data)} records for {date_str}.")
+                get_storage().upsert_activity_data(processed_data)
+                logger.info("    Successfully fetched and upserted %d records for %s.", len(processed_data), date_str)
             else:
-                print(f"    No valid data found for {date_str}.")
+                logger.info("    No valid data found for %s.", date_str)
         else:
-            print(f"    No new data found for {date_str}.")
+            logger.info("    No new data found for %s.", date_str)
             
-    print("Fetch job completed successfully.")
+    logger.info("Fetch job completed successfully.")
+
+def run_replay_job(start_date: str = None, end_date: str = None, process: bool = False):
+    """
+    Rebuilds activity_log from the raw store instead of the RescueTime API: the latest stored
+    response of every stored date (optionally limited to a range) is upserted again and its
+    date marked for reprocessing. With process, the processing job runs afterwards.
+    Returns the number of rows replayed.
+    """
+    dates = raw_store.stored_dates(start_date, end_date)
+    if not dates:
+        logger.info("No stored responses to replay.")
+        return 0
+    logger.info("Replaying stored responses for %d day(s) (%s to %s)...", len(dates), dates[0], dates[-1])
+
+    storage = get_storage()
+    replayed = 0
+    pending_dates, pending_rows = [], []
+
+    def flush_pending():
+        for date_str in pending_dates:
+            storage.mark_date_for_reprocessing(date_str)
+        if pending_rows:
+            storage.upsert_activity_data(pending_rows)
+        pending_dates.clear()
+        pending_rows.clear()
+
+    with stage("replay", items=len(dates)):
+        for date_str in dates:
+            fetch = raw_store.latest_fetch(date_str)
+            if fetch is None:
+                logger.warning("    No readable fetch recorded for %s; skipped.", date_str)
+                continue
+            data = raw_store.load_payload(fetch["sha256"])
+            if data is None:
+                logger.warning("    Stored response for %s is missing (%s); skipped.", date_str, fetch["sha256"])
+                continue
+            rows = activity_rows_from_response(date_str, data)
+            pending_dates.append(date_str)
+            pending_rows.extend(rows)
+            replayed += len(rows)
+            # Upsert in large batches: one transaction per REPLAY_BATCH_ROWS rows, not one per day
+            if len(pending_rows) >= REPLAY_BATCH_ROWS:
+                flush_pending()
+        flush_pending()
+    logger.info("Replayed %d records from %d stored day(s).", replayed, len(dates), extra={"records": replayed})
+
+    if process:
+        run_process_job()
+    return replayed
 
 def run_process_job():
     """
     Runs the data processing job for all unprocessed entries.
     This can be called from the CLI or as a background task.
     """
-    print("Starting data processing job...")
+    logger.info("Starting data processing job...")
     processor.process_all_data(debug=False) # Assuming debug=False for automated runs
-    print("Processing job completed successfully.") 
\ No newline at end of file
+    logger.info("Processing job completed successfully.") 
+
+def run_fetch_job_all_users(days: int = 4, target_date: str = None, refetch: bool = False, user_ids=None):
+    """
+    Runs the fetch job for every registered user (or user_ids) concurrently, each into
+    their own database shard. See tenants.run_for_tenants.
+    """
+    return tenants.run_for_tenants(run_fetch_job, days=days, target_date=target_date, refetch=refetch, user_ids=user_ids)
+
+def run_process_job_all_users(user_ids=None):
+    """Runs the processing job for every registered user (or user_ids) concurrently."""
+    return tenants.run_for_tenants(run_process_job, user_ids=user_ids)
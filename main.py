@@ -2,12 +2,22 @@ import argparse
 import os
 from datetime import datetime, timedelta
 import database
+from storage import get_storage
 import fetcher
 import processor
 import reporter
 import uvicorn
 from api import app as fastapi_app
+import importer
 import jobs
+import migrations
+import retention
+import alp_api
+import alp_outbox
+import instrumentation
+import profiling
+import replication
+import tenants
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -16,7 +26,7 @@ load_dotenv()
 def handle_fetch(args):
     """Handles the fetch command."""
     print("Received fetch command via CLI.")
-    jobs.run_fetch_job(days=args.days)
+    jobs.run_fetch_job(days=args.days, refetch=args.refetch)
 
 def handle_process(args):
     """Handles the process command."""
@@ -39,8 +49,24 @@ def handle_process_all(args):
     print(f"Processing raw data{date_msg}...")
     processor.process_all_data(args.debug, args.start_date, args.end_date)
 
+def handle_reprocess(args):
+    """Handles the 'reprocess' command."""
+    if args.changed_rules:
+        print(f"Reprocessing documents whose canonical name changed under rules {processor.RULES_VERSION}...")
+        processor.reprocess_changed_rules(dry_run=args.dry_run)
+    else:
+        print(f"Reprocessing all raw data for {args.date}...")
+        get_storage().mark_date_for_reprocessing(args.date)
+        processor.process_all_data(start_date=args.date, end_date=args.date)
+
 def handle_report(args):
     """Handles the 'report' command."""
+    if args.start_date or args.end_date or args.group_by or args.format != "csv" or args.output:
+        start_date = args.start_date or args.date
+        end_date = args.end_date or start_date
+        print(f"Exporting report for {start_date} to {end_date}...")
+        reporter.export_report(start_date, end_date, args.group_by, args.format, args.output)
+        return
     print(f"Generating report for date: {args.date}")
     reporter.generate_report(args.date, args.export)
 
@@ -76,6 +102,8 @@ def handle_auto_update(args):
             def __init__(self):
                 self.current = True
                 self.force = args.force
+                self.days = 1
+                self.refetch = False
         
         mock_args = MockArgs()
         handle_fetch(mock_args)
@@ -102,19 +130,146 @@ def handle_update(args):
     print(f"Updating time entry {args.id}...")
     database.update_time_entry(args.id, status=args.status, notes=args.notes)
 
+def handle_sources(args):
+    """Handles the 'sources' command."""
+    reporter.print_entry_sources(args.id)
+
 def handle_clear(args):
     """Handles the 'clear' command."""
     print("Clearing all processed time entries...")
     database.clear_time_entries()
 
+def handle_submit_alp(args):
+    """Handles the 'submit-alp' command: posts every due outbox entry to ALP now."""
+    if not alp_api.ALP_API_URL:
+        print("ALP_API_URL is not set; queued entries stay pending until ALP is configured.")
+        return
+    print("Flushing the ALP submission outbox...")
+    try:
+        stats = alp_outbox.flush(batch_size=args.batch_size)
+    except RuntimeError as e:
+        print(f"Submission failed: {e}")
+        return
+    print(f"Sent {stats['sent']}, retrying {stats['retrying']}, dead {stats['dead']}.")
+
+def handle_add_user(args):
+    """Handles the 'add-user' command: registers a user and creates their database shard."""
+    tenant = tenants.add_tenant(args.user_id, args.name, args.api_key)
+    print(f"User {tenant['user_id']} registered; database: {tenants.shard_path(tenant['user_id'])}")
+
+def handle_list_users(args):
+    """Handles the 'list-users' command."""
+    users = database.list_tenants()
+    if not users:
+        print("No users registered. Add one with: python main.py add-user <user_id> --api-key <key>")
+        return
+    print(f"{'User':<20} {'Name':<30} {'API key':<8} Database")
+    for user in users:
+        has_key = "yes" if user["rescuetime_api_key"] else "no"
+        print(f"{user['user_id']:<20} {(user['display_name'] or ''):<30} {has_key:<8} {tenants.shard_path(user['user_id'])}")
+
+def handle_rollup(args):
+    """Handles the 'rollup' command: time totals per user across every user's database."""
+    start_date = args.start_date
+    end_date = args.end_date or start_date
+    rows = tenants.rollup(start_date, end_date, args.group_by)
+    group_by = reporter.parse_group_by(args.group_by)
+    print(f"\n--- Rollup for {start_date} to {end_date} ---")
+    print(" | ".join([f"{'User':<20}"] + [f"{col:<20}" for col in group_by] + [f"{'Entries':>7}", f"{'Units':>8}", "Time"]))
+    for row in rows:
+        cells = [f"{row['user_id']:<20}"] + [f"{(row[col] or '-')[:20]:<20}" for col in group_by]
+        cells += [f"{row['entry_count']:>7}", f"{reporter.format_time_units(row['time_units']):>8}",
+                  reporter.format_seconds_to_hhmmss(row['total_seconds'])]
+        print(" | ".join(cells))
+
+def handle_replay(args):
+    """Handles the 'replay' command: reloads raw data from stored API responses."""
+    jobs.run_replay_job(args.start_date, args.end_date, process=args.process)
+
+def handle_import(args):
+    """Handles the 'import' command: loads a RescueTime export file into the raw activity log."""
+    try:
+        summary = importer.run_import(args.file, args.format, process=args.process,
+                                      batch_rows=args.batch_rows, defer_indexes=args.defer_indexes)
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f"Import failed: {e}")
+        return
+    print(f"Imported {summary['rows_read'] - summary['rows_skipped']} rows ({summary['rows_skipped']} skipped) "
+          f"as {summary['records']} records for {summary['dates']} day(s)"
+          + (f", {summary['first_date']} to {summary['last_date']}" if summary['dates'] else "")
+          + f" in {summary['seconds']}s.")
+
+def handle_replicate(args):
+    """Handles the 'replicate' command: copies the local databases to their synced location now."""
+    if not replication.enabled():
+        print("Local-first mode is off (set LOCAL_DB_DIR); the database is used in place.")
+        return
+    for user_id in tenants.tenant_ids():
+        database.live_db_file(tenants.shard_path(user_id))
+    copied = replication.replicate_all(force=args.force)
+    print(f"Replicated {copied} database(s) to {os.path.dirname(os.path.abspath(database.DB_FILE))}.")
+
+def handle_compact(args):
+    """Handles the 'compact' command: folds processed raw rows older than the retention window into daily summaries."""
+    if get_storage().name != "sqlite":
+        print("Compaction applies to SQLite databases; the Postgres activity_log is left as it is.")
+        return
+    try:
+        summary = retention.compact(args.older_than, archive=args.archive, dry_run=args.dry_run,
+                                    vacuum_after=args.vacuum, convert=args.convert, pause=args.pause)
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f"Compaction failed: {e}")
+        return
+    span = f" ({summary['first_date']} to {summary['last_date']})" if summary["dates"] else ""
+    if args.dry_run:
+        print(f"Would compact {summary['rows_removed']} raw rows and {summary['sources_folded']} lineage rows "
+              f"of {summary['dates']} day(s) before {summary['cutoff_date']}{span}.")
+    else:
+        print(f"Compacted {summary['rows_removed']} raw rows of {summary['dates']} day(s) before {summary['cutoff_date']}{span} "
+              f"into {summary['summary_rows']} summary rows, folded {summary['sources_folded']} lineage rows"
+              + (f", archived {summary['rows_archived']} raw and {summary['sources_archived']} lineage rows to {args.archive}"
+                 if args.archive else "")
+              + f"; released {summary['bytes_released'] / 2**20:.1f} MiB in {summary['seconds']}s.")
+    if summary["skipped_pending_dates"]:
+        print(f"Kept {summary['skipped_pending_dates']} day(s) with unprocessed rows; process them first.")
+
 def handle_init_db(args):
     """Handles the 'initdb' command."""
     print("Initializing the database...")
-    database.initialize_database()
+    get_storage().initialize()
+
+def handle_migrate(args):
+    """Handles the 'migrate' command: applies pending schema migrations in short chunks."""
+    if get_storage().name != "sqlite":
+        print("Migrations apply to SQLite databases; the Postgres schema is created by initdb.")
+        return
+    current = migrations.schema_version()
+    pending = migrations.pending_migrations()
+    print(f"Schema version {current} of {migrations.LATEST_VERSION} ({database.current_db_file()}).")
+    for migration in pending:
+        print(f"  pending: {migration.version} {migration.description}")
+    if args.status or not pending:
+        return
+    applied = migrations.migrate(chunk_rows=args.chunk_rows, pause=args.pause)
+    print(f"Applied migrations {', '.join(map(str, applied))}.")
+
+def run_command(args):
+    """Runs the chosen command for the main database, one user, or every user."""
+    if args.all_users:
+        tenants.run_for_tenants(args.func, args)
+    elif args.user:
+        with tenants.tenant_context(args.user):
+            args.func(args)
+    else:
+        args.func(args)
 
 def main():
     """Main entry point for the application."""
     parser = argparse.ArgumentParser(description="RescueTime Data Fetcher and Reporter.")
+    parser.add_argument("--log-level", type=str, default=None, help="Log level for progress output (default: LOG_LEVEL or INFO).")
+    parser.add_argument("--log-format", type=str, default=None, choices=["text", "logfmt"], help="Log format (default: LOG_FORMAT or text).")
+    parser.add_argument("--user", type=str, default=None, help="Run the command as this registered user (their database shard and RescueTime key).")
+    parser.add_argument("--all-users", action="store_true", help="Run the command once for every registered user, concurrently (e.g. fetch, process --all).")
     subparsers = parser.add_subparsers(dest="command", required=True)
     
     # Common date argument
@@ -125,6 +280,7 @@ def main():
     parser_fetch.add_argument("--days", type=int, default=1, help="Number of past days to fetch data for (default: 1).")
     parser_fetch.add_argument("--current", action="store_true", help="Fetch only the current day's data.")
     parser_fetch.add_argument("--force", action="store_true", help="Force update even if interval is not met.")
+    parser_fetch.add_argument("--refetch", action="store_true", help="Call the API even for past days whose final data is already stored.")
     parser_fetch.set_defaults(func=handle_fetch)
 
     # --- Process Command ---
@@ -141,12 +297,42 @@ def main():
     parser_process_all.add_argument("--end-date", type=str, help="End date for process-all in YYYY-MM-DD format.")
     parser_process_all.set_defaults(func=handle_process_all)
 
+    # --- Reprocess Command ---
+    parser_reprocess = subparsers.add_parser("reprocess", help="Re-aggregate existing raw data (after a rule change).")
+    reprocess_scope = parser_reprocess.add_mutually_exclusive_group(required=True)
+    reprocess_scope.add_argument("--changed-rules", action="store_true", help="Only re-aggregate documents whose canonical name changed under the current rules.")
+    reprocess_scope.add_argument("--date", type=str, help="Re-aggregate every raw record of one date (YYYY-MM-DD).")
+    parser_reprocess.add_argument("--dry-run", action="store_true", help="With --changed-rules: list the changed documents without writing anything.")
+    parser_reprocess.set_defaults(func=handle_reprocess)
+
     # --- Report Command ---
     parser_report = subparsers.add_parser("report", help="Generate a report from local data.")
     parser_report.add_argument("--date", type=str, default=yesterday, help=f"Date for the report in YYYY-MM-DD format (default: {yesterday}).")
     parser_report.add_argument("--export", action="store_true", help="Export the report to a CSV file.")
+    parser_report.add_argument("--start-date", type=str, help="Start of a date range to export in YYYY-MM-DD format.")
+    parser_report.add_argument("--end-date", type=str, help="End of a date range to export in YYYY-MM-DD format (default: start date).")
+    parser_report.add_argument("--group-by", type=str, help="Comma-separated columns to group by: matter_code, application, status.")
+    parser_report.add_argument("--format", type=str, default="csv", choices=sorted(reporter.REPORT_FORMATS), help="Export format (default: csv).")
+    parser_report.add_argument("--output", type=str, help="Output file path (default: report-<dates>.<format>).")
     parser_report.set_defaults(func=handle_report)
 
+    # --- Replay Command ---
+    parser_replay = subparsers.add_parser("replay", help="Rebuild raw data from stored API responses instead of refetching.")
+    parser_replay.add_argument("--start-date", type=str, help="First date to replay in YYYY-MM-DD format (default: all stored dates).")
+    parser_replay.add_argument("--end-date", type=str, help="Last date to replay in YYYY-MM-DD format.")
+    parser_replay.add_argument("--process", action="store_true", help="Process the replayed data afterwards.")
+    parser_replay.set_defaults(func=handle_replay)
+
+    # --- Import Command ---
+    parser_import = subparsers.add_parser("import", help="Bulk-load a RescueTime data export (CSV, JSON or JSON Lines, optionally .gz).")
+    parser_import.add_argument("file", type=str, help="Path to the export file.")
+    parser_import.add_argument("--format", type=str, choices=importer.IMPORT_FORMATS, help="File format (default: from the file extension).")
+    parser_import.add_argument("--batch-rows", type=int, default=None, help=f"Rows staged per transaction (default: IMPORT_BATCH_ROWS or {importer.IMPORT_BATCH_ROWS}).")
+    parser_import.add_argument("--defer-indexes", action=argparse.BooleanOptionalAction, default=None,
+                               help="Drop and rebuild activity_log's indexes around the load (default: when the import is large relative to the table).")
+    parser_import.add_argument("--process", action="store_true", help="Process the imported data afterwards.")
+    parser_import.set_defaults(func=handle_import)
+
     # --- Update Command ---
     parser_update = subparsers.add_parser("update", help="Update a time entry.")
     parser_update.add_argument("--id", type=int, required=True, help="The ID of the time entry to update.")
@@ -154,6 +340,11 @@ def main():
     parser_update.add_argument("--notes", type=str, help="Add or update notes for the entry.")
     parser_update.set_defaults(func=handle_update)
 
+    # --- Sources Command ---
+    parser_sources = subparsers.add_parser("sources", help="Show the raw activity a time entry was aggregated from.")
+    parser_sources.add_argument("--id", type=int, required=True, help="The ID of the time entry.")
+    parser_sources.set_defaults(func=handle_sources)
+
     # --- Auto-Update Command ---
     parser_auto_update = subparsers.add_parser("auto-update", help="Periodically update current day data with smart timing.")
     parser_auto_update.add_argument("--interval", type=int, default=15, help="Minimum interval in minutes between updates (default: 15).")
@@ -166,16 +357,75 @@ def main():
     run_api_parser.add_argument("--port", type=int, default=int(os.getenv('BACKEND_PORT', 8000)), help="Port for the API server.")
     run_api_parser.set_defaults(func=lambda args: uvicorn.run(fastapi_app, host=args.host, port=args.port))
 
+    # --- Submit ALP Command ---
+    parser_submit_alp = subparsers.add_parser("submit-alp", help="Post queued time entries to ALP now.")
+    parser_submit_alp.add_argument("--batch-size", type=int, default=None, help="Entries claimed per batch (default: ALP_OUTBOX_BATCH_SIZE).")
+    parser_submit_alp.set_defaults(func=handle_submit_alp)
+
     # --- Clear Command ---
     parser_clear = subparsers.add_parser("clear", help="Clear all processed time entries.")
     parser_clear.set_defaults(func=handle_clear)
 
+    # --- Multi-user Commands ---
+    parser_add_user = subparsers.add_parser("add-user", help="Register a user with their own RescueTime API key and database shard.")
+    parser_add_user.add_argument("user_id", type=str, help="Short id for the user (letters, digits, '.', '_', '-').")
+    parser_add_user.add_argument("--api-key", type=str, help="The user's RescueTime API key.")
+    parser_add_user.add_argument("--name", type=str, help="Display name.")
+    parser_add_user.set_defaults(func=handle_add_user)
+
+    parser_list_users = subparsers.add_parser("list-users", help="List registered users.")
+    parser_list_users.set_defaults(func=handle_list_users)
+
+    parser_rollup = subparsers.add_parser("rollup", help="Time totals per user across every user's database.")
+    parser_rollup.add_argument("--start-date", type=str, default=yesterday, help=f"Start date in YYYY-MM-DD format (default: {yesterday}).")
+    parser_rollup.add_argument("--end-date", type=str, help="End date in YYYY-MM-DD format (default: start date).")
+    parser_rollup.add_argument("--group-by", type=str, help="Comma-separated columns to group by: matter_code, application, status.")
+    parser_rollup.set_defaults(func=handle_rollup)
+
+    # --- Replicate Command ---
+    parser_replicate = subparsers.add_parser("replicate", help="Copy the local databases to the synced DB_FILE location now (local-first mode).")
+    parser_replicate.add_argument("--force", action="store_true", help="Copy even databases that have not changed.")
+    parser_replicate.set_defaults(func=handle_replicate)
+
     # --- Init DB Command ---
     parser_init_db = subparsers.add_parser("initdb", help="Initialize the database.")
     parser_init_db.set_defaults(func=handle_init_db)
 
+    # --- Migrate Command ---
+    parser_migrate = subparsers.add_parser("migrate", help="Apply pending schema migrations (resumable; safe while the API is running).")
+    parser_migrate.add_argument("--status", action="store_true", help="Only show the schema version and pending migrations.")
+    parser_migrate.add_argument("--chunk-rows", type=int, default=None, help=f"Rows per backfill transaction (default: MIGRATION_CHUNK_ROWS or {migrations.MIGRATION_CHUNK_ROWS}).")
+    parser_migrate.add_argument("--pause", type=float, default=None, help="Seconds to pause between chunks (default: MIGRATION_CHUNK_PAUSE_SECONDS).")
+    parser_migrate.set_defaults(func=handle_migrate)
+
+    # --- Compact Command ---
+    parser_compact = subparsers.add_parser("compact", help="Fold old processed raw activity into daily summaries and vacuum the database.")
+    parser_compact.add_argument("--older-than", type=int, default=None, help=f"Compact days older than this many days (default: RETENTION_DAYS or {retention.RETENTION_DAYS}).")
+    parser_compact.add_argument("--archive", type=str, default=None, help="Copy the raw rows and their lineage to this SQLite file before removing them.")
+    parser_compact.add_argument("--dry-run", action="store_true", help="Only report what would be compacted.")
+    parser_compact.add_argument("--vacuum", action=argparse.BooleanOptionalAction, default=True, help="Return the freed pages to the file system afterwards (default: on).")
+    parser_compact.add_argument("--convert", action="store_true", help="Switch an older database to auto_vacuum=INCREMENTAL (one full VACUUM; blocks writers while it runs).")
+    parser_compact.add_argument("--pause", type=float, default=None, help="Seconds to pause between chunks (default: COMPACT_PAUSE_SECONDS).")
+    parser_compact.set_defaults(func=handle_compact)
+
+    # Every subcommand can be profiled
+    for subparser in subparsers.choices.values():
+        subparser.add_argument(
+            "--profile", nargs="?", const="sample", choices=profiling.PROFILE_MODES, default=None,
+            help="Profile this command (sampling profiler by default, or cprofile) and write the results next to the database.",
+        )
+
     args = parser.parse_args()
-    args.func(args)
+    instrumentation.configure_logging(args.log_level, args.log_format)
+    local_first = replication.enable()
+    if args.profile:
+        with profiling.profile(args.command, mode=args.profile):
+            run_command(args)
+    else:
+        run_command(args)
+    # Hand whatever the command wrote to the synced location before exiting
+    if local_first and args.command != "replicate":
+        replication.replicate_all()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
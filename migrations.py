@@ -0,0 +1,282 @@
+"""
+Versioned schema migrations for the SQLite databases.
+
+initialize_database() creates the current schema with CREATE ... IF NOT EXISTS, which cannot
+change a table that already exists. Changes to existing databases are migrations, listed in
+MIGRATIONS in version order. A migration has two parts:
+
+  - schema(cursor): the DDL (ALTER TABLE, CREATE INDEX), run as one write. It must be a no-op
+    on databases that already have the change, since initialize_database() runs every
+    migration on new databases too.
+  - backfills: Backfill steps that compute values for existing rows. They run in chunks of
+    MIGRATION_CHUNK_ROWS rows by rowid range, each chunk its own short write that also
+    records how far it got in update_metadata, so an interrupted migration resumes where
+    it stopped, and other writers (the API) get the lock between chunks.
+
+Once a migration has finished its version is stored as 'schema_version' in update_metadata.
+Run pending migrations with `python main.py migrate` (or initdb, which runs them as well).
+"""
+import os
+import time
+
+import database
+from instrumentation import get_logger
+
+logger = get_logger(__name__)
+
+MIGRATION_CHUNK_ROWS = int(os.getenv("MIGRATION_CHUNK_ROWS", "5000"))
+# Pause between chunks, so a migration never takes the write lock back to back
+MIGRATION_CHUNK_PAUSE_SECONDS = float(os.getenv("MIGRATION_CHUNK_PAUSE_SECONDS", "0.05"))
+
+SCHEMA_VERSION_KEY = "schema_version"
+
+class Backfill:
+    """
+    Sets values on existing rows of table: for each row matching `where`, compute(row) gives
+    the parameters of update_sql, where row is (rowid, *columns). chunk_rows, if given, is
+    the chunk size for this backfill when none is passed to migrate() (for costly computes).
+    """
+
+    def __init__(self, table, columns, where, update_sql, compute, chunk_rows=None):
+        self.table = table
+        self.columns = columns
+        self.where = where
+        self.update_sql = update_sql
+        self.compute = compute
+        self.chunk_rows = chunk_rows
+
+    def apply(self, cursor, rows):
+        cursor.executemany(self.update_sql, [self.compute(row) for row in rows])
+
+class DateRebuild(Backfill):
+    """
+    Fills a derived per-date table: rebuild(cursor, dates) recomputes it for the dates of
+    each chunk's rows of table. A date whose rows span chunks is rebuilt more than once,
+    which is harmless, since every rebuild starts from the current data. That also makes it
+    safe against the triggers or writes that maintain the table while the backfill runs.
+    """
+
+    def __init__(self, table, date_column, rebuild):
+        super().__init__(table, (date_column,), "1 = 1", None, None)
+        self.rebuild = rebuild
+
+    def apply(self, cursor, rows):
+        self.rebuild(cursor, sorted({row[1] for row in rows}))
+
+class Migration:
+    def __init__(self, version, description, schema=None, backfills=()):
+        self.version = version
+        self.description = description
+        self.schema = schema
+        self.backfills = list(backfills)
+
+def _columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in cursor.fetchall()}
+
+# --- Migrations ---
+
+def _add_rule_version(cursor):
+    if "rule_version" not in _columns(cursor, "time_entries"):
+        cursor.execute("ALTER TABLE time_entries ADD COLUMN rule_version TEXT")
+
+def _add_source_keys(cursor):
+    # The unique indexes are created right away: rows still waiting for the backfill have a
+    # NULL key, which the index allows, and writes give the legacy rows they touch their key
+    # first (database._fill_source_keys).
+    for table in ("time_entries", "processed_time_entries"):
+        if "source_key" not in _columns(cursor, table):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN source_key INTEGER")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_time_entries_source_key ON time_entries(source_key)")
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_processed_time_entries_source_key ON processed_time_entries(source_key, entry_date)"
+    )
+
+def _source_key_params(row):
+    return database.source_key(row[1]), row[0]
+
+def _time_units_params(row):
+    import processor
+    return processor.seconds_to_units(row[1]), row[0]
+
+# database.py imports this module, so its functions are looked up when the migration runs
+def _create_analytics_tables(cursor):
+    database.create_analytics_tables(cursor)
+
+def _rebuild_activity_rollup(cursor, dates):
+    database.rebuild_activity_rollup(cursor, dates)
+
+def _refresh_matter_rollup(cursor, dates):
+    database.refresh_matter_rollup(cursor, dates)
+
+def _create_similarity_tables(cursor):
+    database.create_similarity_tables(cursor)
+
+def _add_retention(cursor):
+    database.create_retention_tables(cursor)
+    # Recreated with the WHEN clause that keeps compacted days in the rollup
+    cursor.execute("DROP TRIGGER IF EXISTS activity_rollup_delete")
+    database.create_analytics_tables(cursor)
+
+def _create_retention_tables(cursor):
+    database.create_retention_tables(cursor)
+
+def _task_signature_params(row):
+    import similarity
+    return row[1], similarity.signature(row[1])
+
+TIME_UNITS_BACKFILL = Backfill(
+    "time_entries", ("total_seconds",), "time_units IS NULL",
+    "UPDATE time_entries SET time_units = ?, updated_at = CURRENT_TIMESTAMP WHERE rowid = ?",
+    _time_units_params,
+)
+
+MIGRATIONS = [
+    Migration(1, "time_entries.rule_version", schema=_add_rule_version),
+    Migration(2, "integer source keys", schema=_add_source_keys, backfills=[
+        # Fails (IntegrityError) if two existing source hashes map to the same key
+        Backfill("time_entries", ("source_hash",), "source_key IS NULL",
+                 "UPDATE time_entries SET source_key = ? WHERE rowid = ?", _source_key_params),
+        Backfill("processed_time_entries", ("source_hash",), "source_key IS NULL",
+                 "UPDATE processed_time_entries SET source_key = ? WHERE rowid = ?", _source_key_params),
+    ]),
+    Migration(3, "time_entries.time_units for old entries", backfills=[TIME_UNITS_BACKFILL]),
+    Migration(4, "daily analytics rollups", schema=_create_analytics_tables, backfills=[
+        DateRebuild("activity_log", "log_date", _rebuild_activity_rollup),
+        DateRebuild("time_entries", "entry_date", _refresh_matter_rollup),
+    ]),
+    # Hashing a new description takes a fraction of a millisecond, so chunks are kept small
+    Migration(5, "task description signatures", schema=_create_similarity_tables, backfills=[
+        Backfill("time_entries", ("task_description",), "1 = 1",
+                 "INSERT OR IGNORE INTO task_signatures (task_description, signature) VALUES (?, ?)",
+                 _task_signature_params, chunk_rows=500),
+    ]),
+    Migration(6, "compacted activity summaries", schema=_add_retention),
+    Migration(7, "compacted entry lineage", schema=_create_retention_tables),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+# --- Runner ---
+
+def _get_metadata(cursor, key):
+    cursor.execute("SELECT value FROM update_metadata WHERE key = ?", (key,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def _set_metadata(cursor, key, value):
+    cursor.execute("""
+        INSERT INTO update_metadata (key, value, updated_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(key) DO UPDATE SET
+            value = excluded.value,
+            updated_at = CURRENT_TIMESTAMP
+    """, (key, str(value)))
+
+def _progress_key(version, index):
+    return f"migration.{version}.{index}.rowid"
+
+def schema_version():
+    """The version of the last migration applied to the current context's database (0 if none)."""
+    conn = database.get_db_connection()
+    try:
+        value = _get_metadata(conn.cursor(), SCHEMA_VERSION_KEY)
+    finally:
+        conn.close()
+    return int(value) if value else 0
+
+def pending_migrations():
+    current = schema_version()
+    return [migration for migration in MIGRATIONS if migration.version > current]
+
+def _backfill_chunk(cursor, backfill, progress_key, chunk_rows, max_rowid):
+    # The progress row is read and written in the chunk's own transaction, so a chunk is
+    # either fully applied and recorded or not at all
+    start = int(_get_metadata(cursor, progress_key) or 0)
+    end = min(start + chunk_rows, max_rowid)
+    cursor.execute(
+        f"SELECT rowid, {', '.join(backfill.columns)} FROM {backfill.table} "
+        f"WHERE rowid > ? AND rowid <= ? AND ({backfill.where})",
+        (start, end),
+    )
+    rows = cursor.fetchall()
+    if rows:
+        backfill.apply(cursor, rows)
+    _set_metadata(cursor, progress_key, end)
+    return len(rows), end
+
+def run_backfill(backfill, progress_key, chunk_rows=None, pause=None):
+    """
+    Runs a backfill to completion in rowid-ranged chunks, resuming after the last chunk
+    recorded under progress_key. Rows added after it started are not visited (their writers
+    set the value themselves). Returns the number of rows updated.
+    """
+    chunk_rows = chunk_rows or backfill.chunk_rows or MIGRATION_CHUNK_ROWS
+    pause = MIGRATION_CHUNK_PAUSE_SECONDS if pause is None else pause
+
+    conn = database.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT MAX(rowid) FROM {backfill.table}")
+        max_rowid = cursor.fetchone()[0] or 0
+        start = int(_get_metadata(cursor, progress_key) or 0)
+    finally:
+        conn.close()
+    if start:
+        logger.info("%s: resuming %s backfill after rowid %d.", progress_key, backfill.table, start)
+
+    updated = 0
+    position = start
+    next_report = time.monotonic() + 10
+    while position < max_rowid:
+        count, position = database._write(_backfill_chunk, backfill, progress_key, chunk_rows, max_rowid)
+        updated += count
+        if time.monotonic() >= next_report:
+            logger.info("%s: %s backfill at rowid %d of %d (%d rows updated).",
+                        progress_key, backfill.table, position, max_rowid, updated)
+            next_report = time.monotonic() + 10
+        if pause and position < max_rowid:
+            time.sleep(pause)
+    return updated
+
+def _finish(cursor, migration):
+    _set_metadata(cursor, SCHEMA_VERSION_KEY, migration.version)
+    cursor.executemany(
+        "DELETE FROM update_metadata WHERE key = ?",
+        [(_progress_key(migration.version, index),) for index in range(len(migration.backfills))],
+    )
+
+def migrate(chunk_rows=None, pause=None):
+    """
+    Applies the pending migrations to the current context's database, in order.
+    Returns the versions applied.
+    """
+    applied = []
+    for migration in pending_migrations():
+        started = time.perf_counter()
+        logger.info("Applying migration %d (%s).", migration.version, migration.description)
+        if migration.schema:
+            database._write(migration.schema)
+        updated = 0
+        for index, backfill in enumerate(migration.backfills):
+            updated += run_backfill(backfill, _progress_key(migration.version, index), chunk_rows, pause)
+        database._write(_finish, migration)
+        if updated:
+            # Backfills bypass database.py's write functions, so the API's cached lists are stale
+            database.entries_rewritten()
+        logger.info("Migration %d done in %.1fs (%d rows backfilled).",
+                    migration.version, time.perf_counter() - started, updated)
+        applied.append(migration.version)
+    return applied
+
+def fill_missing_time_units(chunk_rows=None, pause=None):
+    """
+    Sets time_units on every time entry that has none, in chunks like a migration backfill.
+    Returns the number of entries updated.
+    """
+    progress_key = "backfill.time_units.rowid"
+    updated = run_backfill(TIME_UNITS_BACKFILL, progress_key, chunk_rows, pause)
+    database._write(lambda cursor: cursor.execute("DELETE FROM update_metadata WHERE key = ?", (progress_key,)))
+    if updated:
+        database.entries_rewritten()
+    return updated
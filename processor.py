@@ -1,10 +1,14 @@
-import sqlite3
 import re
 import hashlib
+import inspect
 import math
+from array import array
 from collections import defaultdict
 from datetime import timedelta
-from database import get_db_connection
+from storage import get_storage
+from instrumentation import count, get_logger, stage
+
+logger = get_logger(__name__)
 
 def seconds_to_units(seconds):
     """
@@ -145,6 +149,52 @@ def is_vague_name(doc_name):
         
     return False
 
+# General noise reduction applied to every canonical name (browser suffixes, unread counters)
+NOISE_PATTERNS = [re.compile(pattern) for pattern in (
+    r' - Google Chrome – .+$', r' - Google Chrome$',
+    r' - Microsoft​ Edge$', r' — Mozilla Firefox$',
+    r' \(\d+ unread\)$',
+)]
+
+def canonicalize(document, activity):
+    """
+    The full rule pipeline for one raw (activity, document) pair: canonical name, noise
+    reduction and vague-name filtering. Returns the task description, or None when the
+    document is filtered out.
+    """
+    canonical_name = get_canonical_name(document, activity)
+    if canonical_name:
+        for pattern in NOISE_PATTERNS:
+            canonical_name = pattern.sub('', canonical_name)
+    if canonical_name and not is_vague_name(canonical_name):
+        return canonical_name
+    return None
+
+def _rules_fingerprint():
+    # The rule set's version is a hash of the rule code itself, so it changes whenever a
+    # rule is edited; a no-op edit only costs a reprocess run that finds nothing to do
+    sources = [inspect.getsource(fn) for fn in (get_canonical_name, is_vague_name, canonicalize)]
+    sources += [pattern.pattern for pattern in NOISE_PATTERNS]
+    return hashlib.sha256("\n".join(sources).encode("utf-8")).hexdigest()[:12]
+
+# Recorded on every time entry and canonical_names row; see reprocess_changed_rules
+RULES_VERSION = _rules_fingerprint()
+
+# All five matter-code patterns in one compiled regex. Each alternative is a lookahead
+# anchored at the start of the description and tried in order, so the first *pattern*
+# that matches anywhere wins (the same precedence as trying the patterns one by one),
+# and within a pattern the leftmost occurrence is returned.
+MATTER_CODE_PATTERN = re.compile(
+    r'^(?:'
+    r'(?=.*?\[(\d{5})\])'                  # 1: square brackets [12345]
+    r'|(?=.*?_(\d{5})_)'                   # 2: surrounded by underscores _12345_
+    r'|(?=.*?_(\d{5})(?=[_\s]|$))'         # 3: underscore before, underscore/space/end after
+    r'|(?=.*?(?:^|[_\s])(\d{5})_)'         # 4: start/underscore/space before, underscore after
+    r'|(?=.*?(?:^|\s)(\d{5})(?:\s|$))'     # 5: space delimited
+    r')',
+    re.DOTALL,
+)
+
 def extract_matter_code(task_description):
     """
     Extracts 5-digit matter codes from task descriptions.
@@ -153,32 +203,14 @@ def extract_matter_code(task_description):
     """
     if not task_description:
         return None
-    
-    # Pattern 1: Square brackets [12345] - surrounded by brackets
-    bracket_match = re.search(r'\[(\d{5})\]', task_description)
-    if bracket_match:
-        return bracket_match.group(1)
-    
-    # Pattern 2: Underscores _12345_ - surrounded by underscores
-    underscore_surrounded = re.search(r'_(\d{5})_', task_description)
-    if underscore_surrounded:
-        return underscore_surrounded.group(1)
-    
-    # Pattern 3: Underscore before, non-digit after: _12345 (space, underscore, or end)
-    underscore_before = re.search(r'_(\d{5})(?=[_\s]|$)', task_description)
-    if underscore_before:
-        return underscore_before.group(1)
-    
-    # Pattern 4: Non-digit before, underscore after: (space or start) 12345_
-    underscore_after = re.search(r'(?:^|[_\s])(\d{5})_', task_description)
-    if underscore_after:
-        return underscore_after.group(1)
-    
-    # Pattern 5: Space delimited: (space or start) 12345 (space or end)
-    space_delimited = re.search(r'(?:^|\s)(\d{5})(?:\s|$)', task_description)
-    if space_delimited:
-        return space_delimited.group(1)
-    
+
+    match = MATTER_CODE_PATTERN.match(task_description)
+    if not match:
+        return None
+    # Exactly one alternative matched; its group is the only one set
+    for code in match.groups():
+        if code:
+            return code
     return None
 
 def get_source_hash(date_str, application, task_description):
@@ -186,293 +218,367 @@ def get_source_hash(date_str, application, task_description):
     hash_input = f"{date_str}-{application}-{task_description}".encode('utf-8')
     return hashlib.md5(hash_input).hexdigest()
 
-def process_all_data(debug=False, start_date=None, end_date=None):
+def get_cross_date_source_hash(application, task_description):
+    """Creates a unique hash for a task across all dates (no date component)."""
+    hash_input = f"{application}-{task_description}".encode('utf-8')
+    return hashlib.md5(hash_input).hexdigest()
+
+# --- Processing Engine ---
+#
+# Every way of processing raw activity is one ProcessingEngine run: a row source picks the
+# activity_log rows, the engine canonicalizes and aggregates them in a single streaming
+# pass, and a sink decides what happens to the result (save it, or report on it).
+
+# Rows streamed from the storage backend per fetch
+PROCESS_CHUNK_ROWS = 5000
+
+ACTIVITY_ROW_SQL = "SELECT log_date, activity, document, time_spent_seconds FROM activity_log"
+
+def _date_filter(start_date, end_date):
+    if start_date and end_date:
+        return f" for date range {start_date} to {end_date}"
+    if start_date:
+        return f" from {start_date}"
+    if end_date:
+        return f" until {end_date}"
+    return ""
+
+class UnprocessedRows:
+    """Rows not yet processed, optionally limited to an inclusive date range."""
+
+    def __init__(self, start_date=None, end_date=None):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.description = f"unprocessed data{_date_filter(start_date, end_date)}"
+
+    def query(self):
+        conditions, params = ["processed = 0"], []
+        if self.start_date:
+            conditions.append("log_date >= ?")
+            params.append(self.start_date)
+        if self.end_date:
+            conditions.append("log_date <= ?")
+            params.append(self.end_date)
+        return f"{ACTIVITY_ROW_SQL} WHERE {' AND '.join(conditions)} ORDER BY log_date, activity, document", params
+
+class DateRangeRows:
+    """Every row of an inclusive date range, processed or not."""
+
+    def __init__(self, start_date, end_date=None):
+        self.start_date = start_date
+        self.end_date = end_date or start_date
+        if self.end_date == self.start_date:
+            self.description = f"raw data for {self.start_date}"
+        else:
+            self.description = f"raw data{_date_filter(self.start_date, self.end_date)}"
+
+    def query(self):
+        return (f"{ACTIVITY_ROW_SQL} WHERE log_date BETWEEN ? AND ? ORDER BY log_date, activity, document",
+                [self.start_date, self.end_date])
+
+class DatesRows:
+    """Every row of the given dates, processed or not."""
+
+    def __init__(self, dates):
+        self.dates = sorted(dates)
+        self.description = f"raw data for {len(self.dates)} date(s)"
+
+    def query(self):
+        placeholders = ", ".join("?" for _ in self.dates)
+        return (f"{ACTIVITY_ROW_SQL} WHERE log_date IN ({placeholders}) ORDER BY log_date, activity, document",
+                list(self.dates))
+
+_MISSING = object()
+
+class TaskGroup:
     """
-    Processes unprocessed raw data (or date range), aggregating per day.
-    Since fetch now clears data before insertion, unprocessed records represent
-    complete data for their respective dates, ensuring proper aggregation.
-    Groups by (date, application, canonical_name) so each day gets separate entries.
+    One (date, application, task) group: its running total and the documents and durations
+    of the raw rows aggregated into it (the rows' date and application are the group's own).
     """
-    conn = get_db_connection()
-    
-    # Get only unprocessed data
-    from database import get_unprocessed_data, mark_records_as_processed
-    rows = get_unprocessed_data(start_date, end_date)
-    
-    if not rows:
-        date_filter_msg = ""
-        if start_date and end_date:
-            date_filter_msg = f" for date range {start_date} to {end_date}"
-        elif start_date:
-            date_filter_msg = f" from {start_date}"
-        elif end_date:
-            date_filter_msg = f" until {end_date}"
-        print(f"No unprocessed data found{date_filter_msg}.")
-        return
-
-    # --- Data Aggregation Per Day ---
-    grouped_tasks = defaultdict(list)
-    processed_record_ids = []  # Track records we successfully process
-    
-    for row in rows:
-        canonical_name = get_canonical_name(row['document'], row['activity'])
-        
-        # Apply general noise reduction after getting the canonical name
-        if canonical_name:
-            noise_patterns = [
-                r' - Google Chrome – .+$', r' - Google Chrome$',
-                r' - Microsoft​ Edge$', r' — Mozilla Firefox$',
-                r' \(\d+ unread\)$',
-            ]
-            for pattern in noise_patterns:
-                canonical_name = re.sub(pattern, '', canonical_name)
-
-        if canonical_name and not is_vague_name(canonical_name):
-            # Key includes date - this creates separate entries per day
-            key = (row['log_date'], row['activity'], canonical_name)
-            grouped_tasks[key].append(row)
-            # Track this record for marking as processed later
-            processed_record_ids.append((row['log_date'], row['activity'], row['document']))
-
-    if debug:
-        # --- Debug Mode: Print Analysis and Exit ---
-        date_filter_msg = ""
-        if start_date and end_date:
-            date_filter_msg = f" (dates {start_date} to {end_date})"
-        elif start_date:
-            date_filter_msg = f" (from {start_date})"
-        elif end_date:
-            date_filter_msg = f" (until {end_date})"
-            
-        print(f"\n--- Processing Analysis{date_filter_msg} ---")
+    __slots__ = ("total_seconds", "documents", "durations")
+
+    def __init__(self):
+        self.total_seconds = 0
+        self.documents = []
+        self.durations = array("q")
+
+class Aggregation:
+    """
+    The result of one engine pass: TaskGroups keyed by (date, application, task description),
+    the canonical name of every distinct (activity, document) pair read (None when the document
+    was filtered out) and the totals sinks report on, all collected in the same single pass.
+    """
+
+    def __init__(self):
+        self.groups = {}
+        self.canonical_names = {}
+        self.dates = set()
+        self.row_count = 0
+        self.raw_seconds = 0
+        self.processed_rows = 0
+        self.processed_seconds = 0
+
+    def record_ids(self):
+        """(log_date, activity, document) of every row that went into an entry."""
+        return [(date, application, document)
+                for (date, application, _), group in self.groups.items()
+                for document in group.documents]
+
+    def entries(self):
+        """The time entry rows and entry_sources rows for storage.upsert_time_entries."""
+        entries, sources = [], []
+        for (date, application, task_description), group in self.groups.items():
+            source_hash = get_source_hash(date, application, task_description)
+            entries.append((date, application, task_description, group.total_seconds, seconds_to_units(group.total_seconds),
+                            source_hash, extract_matter_code(task_description), RULES_VERSION))
+            sources.extend((source_hash, date, application, document, seconds)
+                           for document, seconds in zip(group.documents, group.durations))
+        return entries, sources
+
+class ProcessingEngine:
+    """
+    Streams a row source through the rule pipeline into per (date, application, task) groups
+    and hands the Aggregation to a sink. canonical_names optionally supplies already computed
+    names ((activity, document) -> name); keep optionally restricts which groups are built.
+    """
+
+    def __init__(self, source, sink, canonical_names=None, keep=None):
+        self.source = source
+        self.sink = sink
+        self.canonical_names = canonical_names if canonical_names is not None else {}
+        self.keep = keep
+
+    def aggregate(self):
+        sql, params = self.source.query()
+        aggregation = Aggregation()
+        groups = aggregation.groups
+        seen = aggregation.canonical_names
+        known = self.canonical_names
+        keep = self.keep
+        skipped = set()  # keys rejected by keep
+        dates = aggregation.dates
+        row_count = raw_seconds = processed_rows = processed_seconds = 0
+        with stage("aggregate"):
+            for log_date, activity, document, seconds in get_storage().iter_rows(sql, params, chunk_rows=PROCESS_CHUNK_ROWS):
+                row_count += 1
+                raw_seconds += seconds
+                dates.add(log_date)
+                pair = (activity, document)
+                name = seen.get(pair, _MISSING)
+                if name is _MISSING:
+                    name = known.get(pair, _MISSING)
+                    if name is _MISSING:
+                        name = canonicalize(document, activity)
+                    seen[pair] = name
+                if name is None:
+                    continue
+                key = (log_date, activity, name)
+                group = groups.get(key)
+                if group is None:
+                    if keep is not None and (key in skipped or not keep(key)):
+                        skipped.add(key)
+                        continue
+                    group = groups[key] = TaskGroup()
+                group.total_seconds += seconds
+                group.documents.append(document)
+                group.durations.append(seconds)
+                processed_rows += 1
+                processed_seconds += seconds
+        count("aggregate", row_count)
+        aggregation.row_count = row_count
+        aggregation.raw_seconds = raw_seconds
+        aggregation.processed_rows = processed_rows
+        aggregation.processed_seconds = processed_seconds
+        return aggregation
+
+    def run(self):
+        """Aggregates the source and passes the result to the sink. Returns the sink's result."""
+        aggregation = self.aggregate()
+        if not aggregation.row_count:
+            logger.info("No %s found.", self.source.description)
+            return None
+        return self.sink.write(aggregation, self.source)
+
+class DatabaseSink:
+    """
+    Saves an aggregation: upserts the time entries with their lineage, records the canonical
+    names and marks the aggregated rows processed, then prints the processing summary.
+    """
+
+    def __init__(self, record_canonical_names=True):
+        self.record_canonical_names = record_canonical_names
+
+    def save(self, aggregation):
+        """Writes the aggregation (raising the backend's errors). Returns the number of entries upserted."""
+        storage = get_storage()
+        entries, sources = aggregation.entries()
+        upserted = storage.upsert_time_entries(entries, sources) if entries else 0
+        if self.record_canonical_names:
+            storage.record_canonical_names(
+                [(activity, document, name, RULES_VERSION) for (activity, document), name in aggregation.canonical_names.items()]
+            )
+        storage.mark_records_as_processed(aggregation.record_ids())
+        return upserted
+
+    def write(self, aggregation, source):
+        if not aggregation.groups:
+            logger.info("No valid tasks found in %s after cleaning.", source.description)
+            return 0
+        logger.info(
+            "Processing %d unique task-day combinations from %d records...",
+            len(aggregation.groups), aggregation.row_count,
+            extra={"tasks": len(aggregation.groups), "records": aggregation.row_count},
+        )
+        storage = get_storage()
+        upserted = 0
+        try:
+            upserted = self.save(aggregation)
+            logger.info("Successfully processed and saved %d time entries.", len(aggregation.groups),
+                        extra={"entries": len(aggregation.groups)})
+        except storage.errors as e:
+            logger.error("Database error during processing: %s", e)
+
+        # --- Summary Report ---
+        dates = sorted(aggregation.dates)
+        date_range = f"{dates[0]} to {dates[-1]}" if len(dates) > 1 else dates[0]
+        processed_seconds = aggregation.processed_seconds
+        leakage_seconds = aggregation.raw_seconds - processed_seconds
+        leakage_percentage = (leakage_seconds / aggregation.raw_seconds * 100) if aggregation.raw_seconds > 0 else 0
+
+        print("\n--- Processing Summary ---")
+        print(f"Date range processed:      {date_range}")
+        print(f"Records read:              {aggregation.row_count}")
+        print(f"Records marked processed:  {aggregation.processed_rows}")
+        print(f"Total time in processed:   {timedelta(seconds=processed_seconds)}")
+        print(f"Filtered time (leakage):   {timedelta(seconds=leakage_seconds)} ({leakage_percentage:.2f}%)")
+        print("-" * 45)
+        return upserted
+
+class DryRunSink:
+    """Prints the task-day totals that would be saved, without writing anything."""
+
+    def write(self, aggregation, source):
+        print(f"\n--- Processing Analysis ({source.description}) ---")
         print(f"{'Date':<12} | {'Task Description':<45} | {'Time':<8}")
         print("-" * 70)
-        for (date, application, canonical_name), task_rows in sorted(grouped_tasks.items()):
-            total_time = sum(r['time_spent_seconds'] for r in task_rows)
+        for (date, application, canonical_name), group in sorted(aggregation.groups.items(), key=lambda item: item[0]):
+            total_time = group.total_seconds
             hours_mins = f"{total_time//3600}h {(total_time%3600)//60}m"
             print(f"{date:<12} | {canonical_name[:43]:<45} | {hours_mins:<8}")
-        
-        print(f"\nTotal unprocessed records: {len(rows)}")
-        print(f"Records that would be processed: {len(processed_record_ids)}")
-        print(f"Unique task-day combinations: {len(grouped_tasks)}")
-        return
-
-    if not grouped_tasks:
-        print("No valid tasks found in unprocessed data after cleaning.")
-        return
-
-    total_raw_seconds = sum(row['time_spent_seconds'] for row in rows)
-    dates = sorted(set(row['log_date'] for row in rows))
-    print(f"Processing {len(grouped_tasks)} unique task-day combinations from {len(rows)} unprocessed records...")
-
-    # --- Prepare for Upsert ---
-    entries_to_upsert = []
-    total_processed_seconds = 0
-    for (date, application, canonical_name), task_rows in grouped_tasks.items():
-        # Sum the time for all entries for this task on this specific date
-        # Since fetch clears data before insertion, this represents complete aggregation
-        total_seconds = sum(r['time_spent_seconds'] for r in task_rows)
-        task_description = canonical_name
-        
-        # Extract matter code from task description
-        matter_code = extract_matter_code(task_description)
-        
-        # Use the original per-date source hash
-        source_hash = get_source_hash(date, application, canonical_name)
-        time_units = seconds_to_units(total_seconds)
-        entries_to_upsert.append((date, application, task_description, total_seconds, time_units, source_hash, matter_code))
-        total_processed_seconds += total_seconds
-
-    # --- Database Upsert ---
-    cursor = conn.cursor()
-    upsert_sql = """
-    INSERT INTO time_entries (entry_date, application, task_description, total_seconds, time_units, source_hash, matter_code)
-    VALUES (?, ?, ?, ?, ?, ?, ?)
-    ON CONFLICT(source_hash) DO UPDATE SET
-        total_seconds = excluded.total_seconds,
-        time_units = excluded.time_units,
-        task_description = excluded.task_description,
-        matter_code = excluded.matter_code,
-        updated_at = CURRENT_TIMESTAMP;
-    """
 
-    try:
-        cursor.executemany(upsert_sql, entries_to_upsert)
-        conn.commit()
-        
-        # Mark processed records as processed
-        mark_records_as_processed(processed_record_ids)
-        
-        print(f"Successfully processed and saved {len(entries_to_upsert)} time entries.")
-    except sqlite3.Error as e:
-        print(f"Database error during processing: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
-
-    # --- Summary Report ---
-    date_range = f"{dates[0]} to {dates[-1]}" if len(dates) > 1 else dates[0]
-    leakage_seconds = total_raw_seconds - total_processed_seconds
-    leakage_percentage = (leakage_seconds / total_raw_seconds * 100) if total_raw_seconds > 0 else 0
-    
-    print("\n--- Processing Summary ---")
-    print(f"Date range processed:      {date_range}")
-    print(f"Unprocessed records:       {len(rows)}")
-    print(f"Records marked processed:  {len(processed_record_ids)}")
-    print(f"Total time in processed:   {timedelta(seconds=total_processed_seconds)}")
-    print(f"Filtered time (leakage):   {timedelta(seconds=leakage_seconds)} ({leakage_percentage:.2f}%)")
-    print("-" * 45)
+        print(f"\nTotal records read: {aggregation.row_count}")
+        print(f"Records that would be processed: {aggregation.processed_rows}")
+        print(f"Unique task-day combinations: {len(aggregation.groups)}")
+        return None
 
-def get_cross_date_source_hash(application, task_description):
-    """Creates a unique hash for a task across all dates (no date component)."""
-    hash_input = f"{application}-{task_description}".encode('utf-8')
-    return hashlib.md5(hash_input).hexdigest()
+class CleaningReportSink:
+    """Prints how each distinct document was canonicalized (or filtered out), without writing anything."""
 
-def process_data_for_date(date_str, debug=False):
-    """
-    Processes raw data for a date, aggregates it, and upserts it into the time_entries table.
-    Includes a debug mode to analyze the cleaning process.
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM activity_log WHERE log_date = ?", (date_str,))
-    rows = cursor.fetchall()
-    
-    if not rows:
-        print(f"No raw data found for {date_str}. Run the 'fetch' command first.")
-        conn.close()
-        return
-
-    # --- Data Aggregation ---
-    # We now group raw entries by a canonical name, but store the originals.
-    grouped_tasks = defaultdict(list)
-    for row in rows:
-        canonical_name = get_canonical_name(row['document'], row['activity'])
-        
-        # Apply general noise reduction after getting the canonical name
-        # Only apply if canonical_name is not None
-        if canonical_name:
-            noise_patterns = [
-                r' - Google Chrome – .+$', r' - Google Chrome$',
-                r' - Microsoft​ Edge$', r' — Mozilla Firefox$',
-                r' \(\d+ unread\)$',
-            ]
-            for pattern in noise_patterns:
-                canonical_name = re.sub(pattern, '', canonical_name)
-
-        if canonical_name and not is_vague_name(canonical_name):
-            key = (row['activity'], canonical_name)
-            grouped_tasks[key].append(row)
-
-    if debug:
-        # --- Debug Mode: Print Analysis and Exit ---
-        print("\n--- Cleaning Analysis Report ---")
+    def write(self, aggregation, source):
+        print(f"\n--- Cleaning Analysis Report ({source.description}) ---")
         print(f"{'Original Document':<60} | {'Canonical Name':<60} | {'Status'}")
         print("-" * 140)
-        for row in rows:
-            original_doc = row['document']
-            canonical_name = get_canonical_name(original_doc, row['activity'])
-            
-            # Replicate the full cleaning logic for accurate debugging
-            # Only apply noise reduction if canonical_name is not None
-            if canonical_name:
-                noise_patterns = [
-                    r' - Google Chrome – .+$', r' - Google Chrome$',
-                    r' - Microsoft​ Edge$', r' — Mozilla Firefox$',
-                    r' \(\d+ unread\)$',
-                ]
-                for pattern in noise_patterns:
-                    canonical_name = re.sub(pattern, '', canonical_name)
-
-            status = "Kept" if canonical_name and not is_vague_name(canonical_name) else "Filtered Out"
-            print(f"{original_doc[:58]:<60} | {(canonical_name or 'N/A')[:58]:<60} | {status}")
-        conn.close()
-        return
-
-    total_raw_seconds = sum(row['time_spent_seconds'] for row in rows)
-    
-    print(f"Processing {len(grouped_tasks)} unique tasks for {date_str}...")
-
-    # --- Prepare for Upsert ---
-    entries_to_upsert = []
-    total_processed_seconds = 0
-    for (application, canonical_name), task_rows in grouped_tasks.items():
-        # Sum the time for all entries in the group
-        total_seconds = sum(r['time_spent_seconds'] for r in task_rows)
-        # The final description should be the clean, canonical name itself.
-        task_description = canonical_name
-        
-        # Extract matter code from task description
-        matter_code = extract_matter_code(task_description)
-        
-        source_hash = get_source_hash(date_str, application, canonical_name)
-        time_units = seconds_to_units(total_seconds)
-        entries_to_upsert.append((date_str, application, task_description, total_seconds, time_units, source_hash, matter_code))
-        total_processed_seconds += total_seconds
-
-    # --- Database Upsert ---
-    upsert_sql = """
-    INSERT INTO time_entries (entry_date, application, task_description, total_seconds, time_units, source_hash, matter_code)
-    VALUES (?, ?, ?, ?, ?, ?, ?)
-    ON CONFLICT(source_hash) DO UPDATE SET
-        total_seconds = excluded.total_seconds,
-        time_units = excluded.time_units,
-        task_description = excluded.task_description,
-        matter_code = excluded.matter_code,
-        updated_at = CURRENT_TIMESTAMP;
-    """
+        for (activity, original_doc), canonical_name in aggregation.canonical_names.items():
+            status = "Kept" if canonical_name else "Filtered Out"
+            print(f"{(original_doc or '')[:58]:<60} | {(canonical_name or 'N/A')[:58]:<60} | {status}")
+        return None
 
-    try:
-        cursor.executemany(upsert_sql, entries_to_upsert)
-        conn.commit()
-        print(f"Successfully processed and saved {len(entries_to_upsert)} time entries.")
-    except sqlite3.Error as e:
-        print(f"Database error during processing: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
-
-    # --- Leakage Report ---
-    leakage_seconds = total_raw_seconds - total_processed_seconds
-    leakage_percentage = (leakage_seconds / total_raw_seconds * 100) if total_raw_seconds > 0 else 0
-    
-    print("\n--- Data Processing Summary ---")
-    print(f"Total time in raw logs:    {timedelta(seconds=total_raw_seconds)}")
-    print(f"Total time in time entries: {timedelta(seconds=total_processed_seconds)}")
-    print(f"Unaccounted time (leakage): {timedelta(seconds=leakage_seconds)} ({leakage_percentage:.2f}%)")
-    print("---------------------------------")
+def process_all_data(debug=False, start_date=None, end_date=None):
+    """
+    Processes unprocessed raw data (or date range), aggregating per day.
+    Since fetch now clears data before insertion, unprocessed records represent
+    complete data for their respective dates, ensuring proper aggregation.
+    Groups by (date, application, canonical_name) so each day gets separate entries.
+    With debug, prints the task-day totals instead of saving them.
+    """
+    sink = DryRunSink() if debug else DatabaseSink()
+    return ProcessingEngine(UnprocessedRows(start_date, end_date), sink).run()
 
+def process_data_for_date(date_str, debug=False):
+    """
+    Re-aggregates every raw row of a date (processed or not), upserts its time entries and
+    marks the rows processed. With debug, prints how each document was cleaned instead.
+    """
+    sink = CleaningReportSink() if debug else DatabaseSink()
+    return ProcessingEngine(DateRangeRows(date_str), sink).run()
 
-def update_time_entry(entry_id, status=None, notes=None):
-    """Updates the status or notes of a time entry."""
-    if not status and not notes:
-        print("No update provided. Please specify a status or notes.")
-        return
+def reprocess_changed_rules(dry_run=False):
+    """
+    Re-aggregates only what a change to the canonicalization rules affects.
+
+    The current rules are evaluated once per distinct (activity, document) pair and compared
+    with the canonical_names snapshot recorded when each pair was last processed. Only the
+    dates and applications in which a changed pair occurs are re-aggregated, and only the
+    groups named by its old or new canonical name: new groups are upserted, totals of groups
+    that lost or gained documents are corrected, and pending entries whose group no longer
+    exists are deleted. Confirmed, ignored or submitted entries are never deleted.
+    Pairs missing from the snapshot (e.g. processed before rule versioning) count as changed.
+    Returns a summary dict.
+    """
+    storage = get_storage()
+    with stage("load_snapshot"):
+        pairs = storage.get_distinct_documents()
+        previous = storage.get_canonical_names()
+
+    with stage("canonicalize", items=len(pairs)):
+        current = {(activity, document): canonicalize(document, activity) for activity, document in pairs}
+    changed = [
+        pair for pair, name in current.items()
+        if pair not in previous or previous[pair] != name
+    ]
+    summary = {"rules_version": RULES_VERSION, "pairs": len(pairs), "changed_pairs": len(changed),
+               "dates": 0, "upserted": 0, "deleted": 0}
+    logger.info("Rules %s: %d of %d distinct documents changed canonical name.",
+                RULES_VERSION, len(changed), len(pairs), extra=summary)
+    if dry_run:
+        print(f"\n--- Changed Canonical Names (rules {RULES_VERSION}) ---")
+        print(f"{'Application':<20} | {'Document':<45} | {'Before':<30} | {'After':<30}")
+        print("-" * 135)
+        for activity, document in sorted(changed):
+            before = previous.get((activity, document), "(not recorded)")
+            after = current[(activity, document)]
+            print(f"{activity[:20]:<20} | {document[:45]:<45} | {(before or 'Filtered Out')[:30]:<30} | {(after or 'Filtered Out')[:30]:<30}")
+        return summary
+    if not changed:
+        return summary
+
+    # Names whose groups can change, per application: every old and new name of a changed pair
+    affected_names = defaultdict(set)
+    for activity, document in changed:
+        for name in (previous.get((activity, document)), current[(activity, document)]):
+            if name:
+                affected_names[activity].add(name)
+    affected = storage.get_activity_dates_for_pairs(changed)
+    dates = sorted({log_date for log_date, _ in affected})
+    summary["dates"] = len(dates)
+
+    # Re-aggregate the affected dates, building only the groups an affected name can change
+    engine = ProcessingEngine(
+        DatesRows(dates), DatabaseSink(record_canonical_names=False), canonical_names=current,
+        keep=lambda key: (key[0], key[1]) in affected and key[2] in affected_names[key[1]],
+    )
+    aggregation = engine.aggregate()
+    kept_hashes = {get_source_hash(*key) for key in aggregation.groups}
+    stale_hashes = {
+        get_source_hash(date_str, activity, name)
+        for date_str, activity in affected
+        for name in affected_names[activity]
+    } - kept_hashes
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    updates = []
-    params = []
-    if status:
-        updates.append("status = ?")
-        params.append(status)
-    if notes:
-        updates.append("notes = ?")
-        params.append(notes)
-    
-    params.append(entry_id)
-    
-    update_sql = f"UPDATE time_entries SET {', '.join(updates)} WHERE entry_id = ?"
-    
     try:
-        cursor.execute(update_sql, params)
-        if cursor.rowcount == 0:
-            print(f"Error: No time entry found with ID {entry_id}.")
-        else:
-            conn.commit()
-            print(f"Successfully updated time entry {entry_id}.")
-    except sqlite3.Error as e:
-        print(f"Database error during update: {e}")
-    finally:
-        conn.close() 
\ No newline at end of file
+        summary["upserted"] = engine.sink.save(aggregation)
+        summary["deleted"] = storage.delete_pending_time_entries(stale_hashes)
+        storage.record_canonical_names([(activity, document, current[(activity, document)], RULES_VERSION)
+                                        for activity, document in changed])
+    except storage.errors as e:
+        logger.error("Database error during reprocessing: %s", e)
+        raise
+
+    print("\n--- Rule Reprocessing Summary ---")
+    print(f"Rules version:             {RULES_VERSION}")
+    print(f"Changed documents:         {len(changed)} of {len(pairs)}")
+    print(f"Dates re-aggregated:       {len(dates)}")
+    print(f"Time entries upserted:     {summary['upserted']}")
+    print(f"Stale entries deleted:     {summary['deleted']}")
+    print("-" * 45)
+    return summary
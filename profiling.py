@@ -0,0 +1,209 @@
+"""
+Opt-in profiling for CLI jobs and API requests.
+
+`profile(label, mode)` wraps a block of work and writes its results to a `profiles/`
+folder next to the database:
+
+  - mode "sample" (default): a sampling profiler records every PROFILE_INTERVAL_SECONDS
+    the call stacks of threads running project code, written as <label>-<ts>.folded
+    (collapsed stacks, one "frame;frame;frame count" line each) for flamegraph.pl,
+    speedscope or inferno.
+  - mode "cprofile": deterministic cProfile of the calling thread, written as
+    <label>-<ts>.prof for snakeviz / gprof2dot / flameprof.
+
+Both modes trace allocations with tracemalloc and write a <label>-<ts>.txt summary with
+wall time, peak traced memory, the hottest functions and the top allocation sites.
+Only one profile runs at a time; overlapping requests run unprofiled.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+import database
+from instrumentation import get_logger
+
+logger = get_logger(__name__)
+
+PROFILE_MODES = ("sample", "cprofile")
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.005"))
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "10"))
+# API requests are only profiled when this is enabled (profiling adds noticeable overhead)
+PROFILE_API_ENABLED = os.getenv("PROFILE_API_ENABLED", "false").lower() in ("1", "true", "yes")
+
+_REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+# Leaf frames of threads parked waiting for work (e.g. the ALP outbox worker); not samples of real work
+_IDLE_LEAVES = {"threading:wait", "threading:_wait_for_tstate_lock", "queue:get", "selectors:select"}
+_active = threading.Lock()
+
+def profile_dir():
+    """Profiles are written next to the database, so they stay with the data they describe."""
+    return os.getenv("PROFILE_DIR") or os.path.join(os.path.dirname(os.path.abspath(database.DB_FILE)), "profiles")
+
+def _frame_label(frame):
+    code = frame.f_code
+    module = frame.f_globals.get("__name__") or os.path.basename(code.co_filename)
+    return f"{module}:{code.co_name}"
+
+class SamplingProfiler(threading.Thread):
+    """
+    Samples the stacks of the given threads (or, when thread_ids is None, of every thread
+    currently executing a frame from this project) and counts collapsed stacks. Threads
+    idling in a wait are skipped.
+    """
+
+    def __init__(self, thread_ids=None, interval=PROFILE_INTERVAL_SECONDS):
+        super().__init__(name="profiler-sampler", daemon=True)
+        self.thread_ids = set(thread_ids) if thread_ids else None
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stopping = threading.Event()
+
+    def _collapse(self, frame):
+        if _frame_label(frame) in _IDLE_LEAVES:
+            return None
+        labels = []
+        in_project = False
+        while frame is not None:
+            labels.append(_frame_label(frame))
+            in_project = in_project or frame.f_code.co_filename.startswith(_REPO_ROOT)
+            frame = frame.f_back
+        return ";".join(reversed(labels)) if in_project else None
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self._stopping.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                stack = self._collapse(frame)
+                if stack:
+                    self.stacks[stack] += 1
+
+    def stop(self):
+        self._stopping.set()
+        self.join()
+
+    def write_folded(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top_functions(self, limit=25):
+        """Leaf frames by sample count (where time was actually spent)."""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(limit)
+
+class ProfileResult:
+    """Where a profile was written and what it measured; filled in when the block exits."""
+
+    def __init__(self, label, mode):
+        self.label = label
+        self.mode = mode
+        self.paths = []
+        self.wall_seconds = None
+        self.peak_memory_bytes = None
+
+    @property
+    def summary_path(self):
+        return next((path for path in self.paths if path.endswith(".txt")), None)
+
+def _safe_label(label):
+    return "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in label).strip("_") or "profile"
+
+@contextmanager
+def profile(label, mode="sample", thread_ids=None):
+    """
+    Profiles the enclosed block. Yields a ProfileResult (paths are set once the block exits),
+    or None when another profile is already running.
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode '{mode}'. Choose from: {', '.join(PROFILE_MODES)}")
+    if not _active.acquire(blocking=False):
+        logger.warning("Profiler busy; running %s without profiling.", label)
+        yield None
+        return
+
+    result = ProfileResult(label, mode)
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+    tracemalloc.reset_peak()
+
+    profiler = sampler = None
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+    else:
+        sampler = SamplingProfiler(thread_ids)
+        sampler.start()
+
+    started = time.perf_counter()
+    try:
+        if profiler:
+            profiler.enable()
+        yield result
+    finally:
+        if profiler:
+            profiler.disable()
+        if sampler:
+            sampler.stop()
+        result.wall_seconds = time.perf_counter() - started
+        result.peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+        snapshot = tracemalloc.take_snapshot()
+        if started_tracing:
+            tracemalloc.stop()
+        try:
+            _write_results(result, profiler, sampler, snapshot)
+        except OSError as e:
+            logger.error("Could not write profile for %s: %s", label, e)
+        finally:
+            _active.release()
+
+def _write_results(result, profiler, sampler, snapshot):
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"{_safe_label(result.label)}-{datetime.now():%Y%m%d-%H%M%S-%f}")
+
+    lines = [
+        f"Profile:      {result.label}",
+        f"Mode:         {result.mode}",
+        f"Wall time:    {result.wall_seconds:.3f}s",
+        f"Peak memory:  {result.peak_memory_bytes / 1024 / 1024:.1f} MiB (tracemalloc)",
+        "",
+    ]
+    if profiler:
+        profiler.dump_stats(base + ".prof")
+        result.paths.append(base + ".prof")
+        stats_text = io.StringIO()
+        pstats.Stats(profiler, stream=stats_text).sort_stats("cumulative").print_stats(25)
+        lines += ["Top functions by cumulative time:", stats_text.getvalue()]
+    if sampler:
+        sampler.write_folded(base + ".folded")
+        result.paths.append(base + ".folded")
+        lines.append(f"Top functions by samples ({sampler.samples} samples every {sampler.interval * 1000:.0f} ms):")
+        lines += [f"  {count:>7}  {name}" for name, count in sampler.top_functions()]
+        lines.append("")
+
+    lines.append("Top allocation sites (still allocated at exit):")
+    for stat in snapshot.statistics("lineno")[:10]:
+        lines.append(f"  {stat.size / 1024:10.1f} KiB  {stat.count:>8} blocks  {stat.traceback[0]}")
+
+    with open(base + ".txt", "w") as f:
+        f.write("\n".join(lines) + "\n")
+    result.paths.append(base + ".txt")
+    logger.info(
+        "Profile for %s written to %s (%.3fs, peak %.1f MiB)",
+        result.label, base, result.wall_seconds, result.peak_memory_bytes / 1024 / 1024,
+        extra={"paths": ",".join(result.paths)},
+    )
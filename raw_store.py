@@ -0,0 +1,131 @@
+"""
+On-disk store of raw RescueTime API responses, so data can be reprocessed without refetching.
+
+Every successful fetch is saved as gzip-compressed JSON under its SHA-256 (content
+addressed, so refetching an unchanged day stores nothing new) and recorded in a per-date
+index of fetches:
+
+    <store>/objects/ab/ab12...ef.json.gz     one file per distinct payload
+    <store>/dates/2025-06-30.jsonl           {"fetched_at": ..., "sha256": ..., "rows": ...} per fetch
+
+The store lives in RAW_STORE_DIR (default: raw_responses/ next to the main database);
+each registered user (see tenants.py) gets a users/<user_id>/ store inside it.
+
+A day is "closed" once it was fetched at least RAW_STORE_CLOSED_AFTER_HOURS after it
+ended; RescueTime will not change it any more, so run_fetch_job skips it. `replay`
+rebuilds activity_log from the latest stored payload of each day.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import database
+import tenants
+from instrumentation import get_logger, stage
+
+logger = get_logger(__name__)
+
+# Hours after midnight at the end of a day before a fetch of it counts as final
+# (RescueTime keeps syncing late data from devices that were offline)
+RAW_STORE_CLOSED_AFTER_HOURS = float(os.getenv("RAW_STORE_CLOSED_AFTER_HOURS", "24"))
+RAW_STORE_COMPRESSLEVEL = int(os.getenv("RAW_STORE_COMPRESSLEVEL", "6"))
+
+def store_dir():
+    """The current user's store (see tenants.tenant_context), or the main one."""
+    base = os.getenv("RAW_STORE_DIR") or os.path.join(os.path.dirname(os.path.abspath(database.DB_FILE)), "raw_responses")
+    tenant = tenants.current_tenant()
+    return os.path.join(base, "users", tenant["user_id"]) if tenant else base
+
+def _object_path(root, digest):
+    return os.path.join(root, "objects", digest[:2], f"{digest}.json.gz")
+
+def _index_path(root, date_str):
+    return os.path.join(root, "dates", f"{date_str}.jsonl")
+
+def save_response(date_str, data, fetched_at=None):
+    """
+    Stores one API response for date_str and records the fetch. Returns the payload's SHA-256.
+    """
+    root = store_dir()
+    fetched_at = fetched_at or datetime.now()
+    payload = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    digest = hashlib.sha256(payload).hexdigest()
+    with stage("raw_store_save"):
+        path = _object_path(root, digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Per thread too: fetch jobs of one API process may store the same payload at once
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp_path, "wb", compresslevel=RAW_STORE_COMPRESSLEVEL) as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+
+        index_path = _index_path(root, date_str)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        record = {"fetched_at": fetched_at.isoformat(timespec="seconds"), "sha256": digest, "rows": len(data.get("rows", []))}
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        # One short O_APPEND write per fetch, so concurrent fetches cannot interleave lines
+        with open(index_path, "a+b") as f:
+            # After a line cut off by a crash, start a new one rather than extend it
+            if f.seek(0, os.SEEK_END) and (f.seek(-1, os.SEEK_END), f.read(1))[1] != b"\n":
+                line = b"\n" + line
+            f.write(line)
+    return digest
+
+def fetches_for_date(date_str):
+    """
+    Every recorded fetch of date_str, oldest first. Lines that do not parse (one cut off by a
+    crash during its append) are skipped with a warning.
+    """
+    index_path = _index_path(store_dir(), date_str)
+    fetches = []
+    try:
+        with open(index_path, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    fetch = json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.warning("Skipping unreadable line %d of %s: %s", number, index_path, e)
+                    continue
+                fetches.append(fetch)
+    except FileNotFoundError:
+        pass
+    return fetches
+
+def load_payload(digest):
+    """The stored response with this SHA-256, or None if it is missing."""
+    try:
+        with gzip.open(_object_path(store_dir(), digest), "rb") as f:
+            return json.loads(f.read())
+    except FileNotFoundError:
+        return None
+
+def latest_fetch(date_str):
+    fetches = fetches_for_date(date_str)
+    return fetches[-1] if fetches else None
+
+def is_closed(date_str, fetch):
+    """Whether a fetch of date_str happened late enough that the day can no longer change."""
+    day_end = datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=1)
+    return datetime.fromisoformat(fetch["fetched_at"]) >= day_end + timedelta(hours=RAW_STORE_CLOSED_AFTER_HOURS)
+
+def closed_fetch(date_str):
+    """The latest fetch of date_str if it is final and its payload is on disk, else None."""
+    fetch = latest_fetch(date_str)
+    if fetch and is_closed(date_str, fetch) and os.path.exists(_object_path(store_dir(), fetch["sha256"])):
+        return fetch
+    return None
+
+def stored_dates(start_date=None, end_date=None):
+    """Dates with at least one stored fetch, in order, optionally limited to an inclusive range."""
+    try:
+        names = os.listdir(os.path.join(store_dir(), "dates"))
+    except FileNotFoundError:
+        return []
+    dates = sorted(name[:-len(".jsonl")] for name in names if name.endswith(".jsonl"))
+    return [d for d in dates if (not start_date or d >= start_date) and (not end_date or d <= end_date)]
@@ -0,0 +1,158 @@
+"""
+In-process LRU cache of the API's serialized per-date entry lists.
+
+The frontend requests /api/time_entries?date= and /api/processed_time_entries?date=
+together on every navigation and after every action. With the cache, the JSON body of
+each response is kept in memory, keyed by (database file, endpoint, date), so moving back
+and forth between recent days does not query SQLite or run Pydantic again.
+
+Entries are invalidated precisely: every database.py function that changes time_entries or
+processed_time_entries reports the entry_date values it touched, and once its write has
+committed those dates (and the undated lists, which span all dates) are dropped. Each date
+carries a generation number that invalidation bumps, so a response built from a read that
+raced with a write is never stored.
+
+Writes made by other processes (a CLI fetch or process-all job against the same file) are
+caught through the entry write counter that every such write bumps in update_metadata
+(database.get_entry_write_count()). Each lookup passes the current value; when it differs
+from the last one this process accounted for, every list of that file is dropped before
+anything is served. The process's own writes advance the known value as they invalidate,
+so they keep the precise per-date invalidation. READ_CACHE_TTL_SECONDS remains a backstop:
+no list is served longer than that after it was built.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from instrumentation import counter
+
+READ_CACHE_ENABLED = os.getenv("READ_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+READ_CACHE_MAX_ENTRIES = int(os.getenv("READ_CACHE_MAX_ENTRIES", "256"))
+READ_CACHE_TTL_SECONDS = float(os.getenv("READ_CACHE_TTL_SECONDS", "60"))
+
+READ_CACHE_REQUESTS = counter(
+    "rescuetime_read_cache_requests_total", "Cached entry-list lookups by endpoint and result.", ("endpoint", "result")
+)
+READ_CACHE_INVALIDATIONS = counter(
+    "rescuetime_read_cache_invalidations_total", "Cached entry lists dropped because a write touched their date."
+)
+
+class ReadCache:
+    """LRU cache of response bodies keyed by (db_file, endpoint, date), with per-date generations."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (db_file, endpoint, date) -> (body, stored_at)
+        self._generations = {}         # (db_file, date) -> number of invalidations of that date
+        self._epochs = {}              # db_file -> number of full invalidations
+        self._write_counts = {}        # db_file -> entry write counter the cached lists reflect
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def _generation(self, db_file, date):
+        # Undated lists (date None) change whenever any date does
+        return self._epochs.get(db_file, 0), self._generations.get((db_file, date), 0)
+
+    def _drop_all(self, db_file):
+        self._epochs[db_file] = self._epochs.get(db_file, 0) + 1
+        stale = [key for key in self._entries if key[0] == db_file]
+        for key in stale:
+            del self._entries[key]
+        self.stats["invalidations"] += len(stale)
+        return stale
+
+    def get(self, db_file, endpoint, date, build, write_count):
+        """
+        Returns the cached body, or build()'s result, storing it unless a write intervened.
+        write_count is db_file's current entry write counter; a value this process has not
+        accounted for means another process wrote, and drops all of db_file's lists first.
+        """
+        key = (db_file, endpoint, date)
+        stale = ()
+        with self._lock:
+            if self._write_counts.get(db_file) != write_count:
+                stale = self._drop_all(db_file)
+                self._write_counts[db_file] = write_count
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                READ_CACHE_REQUESTS.inc(endpoint=endpoint, result="hit")
+                return entry[0]
+            generation = self._generation(db_file, date)
+            self.stats["misses"] += 1
+        if stale:
+            READ_CACHE_INVALIDATIONS.inc(len(stale))
+        READ_CACHE_REQUESTS.inc(endpoint=endpoint, result="miss")
+
+        body = build()
+        with self._lock:
+            if self._generation(db_file, date) == generation:
+                self._entries[key] = (body, time.monotonic())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return body
+
+    def invalidate(self, db_file, dates=None, write_count=None):
+        """
+        Drops db_file's lists for dates (and its undated lists), or all of its lists when dates
+        is None. write_count is the counter value the write committed with: when it directly
+        follows the known one, no other write came in between and it becomes the known value.
+        Otherwise the next lookup sees the gap and drops everything.
+        """
+        with self._lock:
+            if dates is None:
+                stale = self._drop_all(db_file)
+            else:
+                dates = set(dates) | {None}
+                for date in dates:
+                    self._generations[(db_file, date)] = self._generations.get((db_file, date), 0) + 1
+                stale = [key for key in self._entries if key[0] == db_file and key[2] in dates]
+                for key in stale:
+                    del self._entries[key]
+                self.stats["invalidations"] += len(stale)
+            known = self._write_counts.get(db_file)
+            if write_count is not None and known is not None and write_count == known + 1:
+                self._write_counts[db_file] = write_count
+        if stale:
+            READ_CACHE_INVALIDATIONS.inc(len(stale))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._write_counts.clear()
+
+_cache = ReadCache(READ_CACHE_MAX_ENTRIES, READ_CACHE_TTL_SECONDS)
+
+def get(db_file, endpoint, date, build, write_count):
+    """
+    The cached response body for endpoint and date in db_file, built (and cached) on a miss.
+    write_count is db_file's entry write counter, read just before the lookup.
+    """
+    return _cache.get(db_file, endpoint, date, build, write_count)
+
+def invalidate(db_file, dates=None, write_count=None):
+    """
+    Drops the cached lists of db_file for the given entry dates; None drops all of them.
+    Called by database.py after a write to time_entries or processed_time_entries commits,
+    with the entry write counter value that write committed.
+    """
+    if dates is not None and not dates:
+        return
+    if dates is not None and None in dates:
+        dates = None
+    _cache.invalidate(db_file, dates, write_count)
+
+def clear():
+    _cache.clear()
+
+def cache_stats():
+    """Hit/miss/invalidation counters, the hit ratio and the number of lists held."""
+    stats = dict(_cache.stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    stats["entries"] = len(_cache._entries)
+    return stats
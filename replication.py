@@ -0,0 +1,213 @@
+"""
+Local-first mode: the live SQLite databases run on local disk and are replicated in the
+background to their usual location (DB_FILE and the tenant shards next to it), which is
+typically a cloud-synced folder.
+
+Without it every commit and lock goes through a file the sync client is watching and
+rewriting. With LOCAL_DB_DIR set, each database path the app opens is mapped to a copy
+under LOCAL_DB_DIR (database.live_db_file); the synced file becomes a replica that is
+only ever replaced whole:
+
+    LOCAL_DB_DIR/rescuetime.db        <- every connection
+    LOCAL_DB_DIR/tenants/jsmith.db
+    <DB_FILE folder>/rescuetime.db    <- replica, refreshed every REPLICATION_INTERVAL_SECONDS
+
+Local copies use WAL journaling. Replication uses the SQLite online backup API,
+REPLICATION_PAGES_PER_STEP pages at a time with a short pause between steps, inside one
+read transaction: the copy is a consistent snapshot, and WAL lets writers keep committing
+while it runs. A write would otherwise restart the copy, which livelocks under steady
+writes. The backup goes to a temporary file beside the replica, is switched back to a
+rollback journal (no -wal/-shm files in the synced folder) and is then renamed over the
+replica, so the sync client never sees a half-written database. Databases whose local
+files have not changed since the last copy are skipped. When a local copy is missing (a
+new machine, a wiped cache) it is restored from the replica the first time it is opened.
+
+Replicas are snapshots: open them elsewhere read-only, never write to them directly.
+"""
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import database
+from instrumentation import counter, get_logger, stage
+
+logger = get_logger(__name__)
+
+REPLICATION_INTERVAL_SECONDS = float(os.getenv("REPLICATION_INTERVAL_SECONDS", "60"))
+REPLICATION_PAGES_PER_STEP = int(os.getenv("REPLICATION_PAGES_PER_STEP", "1024"))
+# Pause after each backup step, to spread the copy's disk I/O out
+REPLICATION_STEP_PAUSE_SECONDS = float(os.getenv("REPLICATION_STEP_PAUSE_SECONDS", "0.005"))
+
+REPLICATIONS = counter("rescuetime_replications_total", "Local-first database replications by result.", ("result",))
+
+_live_paths = {}    # replica path -> live local path
+_signatures = {}    # live path -> file state at the last completed copy
+_resolve_lock = threading.Lock()
+_replicate_lock = threading.Lock()
+
+def local_db_dir():
+    return os.getenv("LOCAL_DB_DIR")
+
+def enabled():
+    return database._live_path_resolver is live_path
+
+def _local_path(replica):
+    # Keep the layout relative to DB_FILE's folder (so tenants/<id>.db stays tenants/<id>.db)
+    base = os.path.dirname(os.path.abspath(database.DB_FILE))
+    relative = os.path.relpath(replica, base)
+    if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+        relative = os.path.join("external", relative.replace(os.sep, "_").lstrip("._"))
+    return os.path.join(os.path.abspath(local_db_dir()), relative)
+
+def _signature(path):
+    # mtime and size of the database and its journal files; any commit changes at least one
+    state = []
+    for suffix in ("", "-wal", "-journal"):
+        try:
+            stat = os.stat(path + suffix)
+            state.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            state.append(None)
+    return tuple(state)
+
+def _backup(source_path, target_path, journal_mode):
+    """
+    Copies a consistent snapshot of source_path over target_path (via a temp file and rename),
+    leaving the copy in journal_mode.
+    """
+    tmp_path = f"{target_path}.{os.getpid()}.tmp"
+    source = sqlite3.connect(Path(source_path).resolve().as_uri() + "?mode=ro", uri=True, timeout=10.0)
+    try:
+        # Hold one read transaction for the whole copy: every step then reads the same snapshot
+        # instead of restarting when another connection commits
+        source.execute("BEGIN")
+        source.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.backup(target, pages=REPLICATION_PAGES_PER_STEP,
+                          progress=lambda status, remaining, total: time.sleep(REPLICATION_STEP_PAUSE_SECONDS))
+            target.execute(f"PRAGMA journal_mode={journal_mode}").fetchall()
+        finally:
+            target.close()
+        os.replace(tmp_path, target_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        source.close()
+
+def live_path(path):
+    """
+    The local copy of the database whose replica is path, restoring it from the replica the
+    first time if it is missing. Installed as database.live_db_file's resolver by enable().
+    """
+    path = os.path.abspath(path)
+    live = _live_paths.get(path)
+    if live:
+        return live
+    local_dir = os.path.abspath(local_db_dir())
+    if path.startswith(local_dir + os.sep):
+        return path
+    with _resolve_lock:
+        if path not in _live_paths:
+            live = _local_path(path)
+            os.makedirs(os.path.dirname(live), exist_ok=True)
+            if not os.path.exists(live) and os.path.exists(path):
+                logger.info("Restoring local database %s from replica %s...", live, path)
+                with stage("restore"):
+                    _backup(path, live, "WAL")
+                _signatures[live] = _signature(live)
+            else:
+                conn = sqlite3.connect(live, timeout=10.0)
+                try:
+                    conn.execute("PRAGMA journal_mode=WAL").fetchall()
+                finally:
+                    conn.close()
+            _live_paths[path] = live
+    return _live_paths[path]
+
+def enable():
+    """
+    Switches to local-first mode if LOCAL_DB_DIR is set (restoring the main database from
+    its replica if needed). Returns whether local-first mode is on.
+    """
+    if not local_db_dir():
+        return False
+    if not enabled():
+        database._live_path_resolver = live_path
+        live = live_path(database.DB_FILE)
+        logger.info("Local-first mode: live database %s, replicated to %s.", live, database.DB_FILE)
+    return True
+
+def replica_path():
+    """The replica of the current context's database, or None outside local-first mode."""
+    if not enabled():
+        return None
+    return os.path.abspath(database._db_file_override.get() or database.DB_FILE)
+
+def replicate(replica, live, force=False):
+    """Copies live over replica unless it is unchanged since the last copy. Returns whether it copied."""
+    with _replicate_lock:
+        signature = _signature(live)
+        if not force and _signatures.get(live) == signature:
+            REPLICATIONS.inc(result="unchanged")
+            return False
+        if not os.path.exists(live):
+            return False
+        os.makedirs(os.path.dirname(replica), exist_ok=True)
+        started = time.perf_counter()
+        with stage("replicate"):
+            _backup(live, replica, "DELETE")
+        _signatures[live] = signature
+        REPLICATIONS.inc(result="copied")
+        logger.info("Replicated %s to %s in %.2fs.", live, replica, time.perf_counter() - started)
+        return True
+
+def replicate_all(force=False):
+    """Replicates every database opened in this process. Returns the number copied."""
+    copied = 0
+    for replica, live in list(_live_paths.items()):
+        try:
+            copied += replicate(replica, live, force)
+        except (sqlite3.Error, OSError) as e:
+            REPLICATIONS.inc(result="failed")
+            logger.error("Replication of %s to %s failed: %s", live, replica, e)
+    return copied
+
+class ReplicationWorker(threading.Thread):
+    """Replicates changed databases every REPLICATION_INTERVAL_SECONDS, and once more on stop."""
+
+    def __init__(self, interval=REPLICATION_INTERVAL_SECONDS):
+        super().__init__(name="replication-worker", daemon=True)
+        self.interval = interval
+        self._stopping = threading.Event()
+
+    def stop(self, timeout=30):
+        self._stopping.set()
+        self.join(timeout)
+
+    def run(self):
+        while not self._stopping.wait(self.interval):
+            replicate_all()
+        replicate_all()
+
+_worker = None
+
+def start_worker(interval=REPLICATION_INTERVAL_SECONDS):
+    """Starts the background replication worker (once per process) if local-first mode is on."""
+    global _worker
+    if not enable():
+        return None
+    if _worker is None or not _worker.is_alive():
+        _worker = ReplicationWorker(interval)
+        _worker.start()
+    return _worker
+
+def stop_worker():
+    global _worker
+    if _worker is not None:
+        _worker.stop()
+        _worker = None
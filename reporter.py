@@ -1,5 +1,28 @@
 import csv
-from database import get_db_connection
+import io
+import json
+import os
+import tempfile
+from storage import get_storage
+
+# Columns written for an ungrouped (one row per time entry) report.
+REPORT_COLUMNS = [
+    "entry_id", "entry_date", "application", "task_description", "matter_code",
+    "total_seconds", "time_units", "status", "notes", "source_hash",
+]
+
+# Columns a report may be grouped by, and the aggregates written per group.
+REPORT_GROUP_BY_COLUMNS = ("matter_code", "application", "status")
+REPORT_AGGREGATE_COLUMNS = ["entry_count", "total_seconds", "time_units", "first_date", "last_date"]
+
+REPORT_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# Rows pulled from the cursor per fetchmany() call; also the flush size for text formats.
+REPORT_CHUNK_ROWS = 500
 
 def format_seconds_to_hhmmss(seconds):
     """Formats seconds into hh:mm:ss."""
@@ -16,27 +39,207 @@ def format_time_units(units):
         return "0.0"
     return f"{units:.1f}"
 
+def parse_group_by(group_by):
+    """
+    Normalizes a group-by option (comma-separated string or list) into a list of columns.
+    Raises ValueError for columns that cannot be grouped on.
+    """
+    if not group_by:
+        return []
+    if isinstance(group_by, str):
+        group_by = [col.strip() for col in group_by.split(",") if col.strip()]
+    invalid = [col for col in group_by if col not in REPORT_GROUP_BY_COLUMNS]
+    if invalid:
+        raise ValueError(
+            f"Cannot group by {', '.join(invalid)}. Choose from: {', '.join(REPORT_GROUP_BY_COLUMNS)}"
+        )
+    # Preserve the requested order but drop duplicates
+    return list(dict.fromkeys(group_by))
+
+def build_report_query(start_date, end_date=None, group_by=None):
+    """
+    Builds the SQL, parameters and output columns for a report over an inclusive date range.
+    When group_by columns are given, one aggregated row is produced per group.
+    """
+    end_date = end_date or start_date
+    if end_date < start_date:
+        raise ValueError(f"end_date {end_date} is before start_date {start_date}")
+
+    group_by = parse_group_by(group_by)
+    if group_by:
+        group_cols = ", ".join(group_by)
+        sql = f"""
+            SELECT {group_cols},
+                   COUNT(*) AS entry_count,
+                   SUM(total_seconds) AS total_seconds,
+                   ROUND(CAST(SUM(time_units) AS NUMERIC), 1) AS time_units,
+                   MIN(entry_date) AS first_date,
+                   MAX(entry_date) AS last_date
+            FROM time_entries
+            WHERE entry_date BETWEEN ? AND ?
+            GROUP BY {group_cols}
+            ORDER BY {group_cols}
+        """
+        columns = group_by + REPORT_AGGREGATE_COLUMNS
+    else:
+        sql = f"""
+            SELECT {', '.join(REPORT_COLUMNS)}
+            FROM time_entries
+            WHERE entry_date BETWEEN ? AND ?
+            ORDER BY entry_date, total_seconds DESC
+        """
+        columns = list(REPORT_COLUMNS)
+    return sql, (start_date, end_date), columns
+
+def iter_report_rows(sql, params):
+    """
+    Yields report rows as plain tuples straight from the storage backend's cursor,
+    REPORT_CHUNK_ROWS at a time, so the full result set is never held in memory.
+    """
+    return get_storage().iter_rows(sql, params, chunk_rows=REPORT_CHUNK_ROWS)
+
+def _stream_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= REPORT_CHUNK_ROWS:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+    yield buffer.getvalue().encode("utf-8")
+
+def _stream_jsonl(columns, rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+        if len(lines) >= REPORT_CHUNK_ROWS:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+def _load_openpyxl_workbook():
+    # openpyxl is optional; it is only needed for spreadsheet exports.
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError("XLSX export requires openpyxl. Install it with: pip install openpyxl")
+    return Workbook
+
+def _stream_xlsx(columns, rows, Workbook):
+    # Write-only workbooks spool rows to disk as they are appended, so memory stays flat.
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Time Entries")
+    sheet.append(columns)
+    for row in rows:
+        sheet.append(list(row))
+
+    with tempfile.TemporaryFile() as spool:
+        workbook.save(spool)
+        spool.seek(0)
+        while True:
+            chunk = spool.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
+
+def stream_report(start_date, end_date=None, group_by=None, fmt="csv"):
+    """
+    Returns an iterator of encoded byte chunks for a report over a date range.
+    Arguments are validated eagerly (raising ValueError) so callers can reject bad
+    requests before any output is produced; rows are only read as the iterator is consumed.
+    """
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"Unsupported report format '{fmt}'. Choose from: {', '.join(REPORT_FORMATS)}")
+    sql, params, columns = build_report_query(start_date, end_date, group_by)
+    if fmt == "xlsx":
+        Workbook = _load_openpyxl_workbook()
+    rows = iter_report_rows(sql, params)
+    if fmt == "csv":
+        return _stream_csv(columns, rows)
+    if fmt == "jsonl":
+        return _stream_jsonl(columns, rows)
+    return _stream_xlsx(columns, rows, Workbook)
+
+def report_filename(start_date, end_date=None, group_by=None, fmt="csv"):
+    """Builds a default file name for an exported report."""
+    end_date = end_date or start_date
+    name = f"report-{start_date}" if end_date == start_date else f"report-{start_date}_to_{end_date}"
+    group_by = parse_group_by(group_by)
+    if group_by:
+        name += "-by-" + "-".join(group_by)
+    return f"{name}.{fmt}"
+
+def _write_chunks(output_path, chunks):
+    """Writes byte chunks to output_path through a .part file, removed again if writing fails."""
+    tmp_path = f"{output_path}.part"
+    try:
+        with open(tmp_path, "wb") as out:
+            for chunk in chunks:
+                out.write(chunk)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def export_report(start_date, end_date=None, group_by=None, fmt="csv", output_path=None):
+    """
+    Streams a report for a date range to a file (CSV, JSONL or XLSX).
+    Returns the path written, or None if the export failed.
+    """
+    output_path = output_path or report_filename(start_date, end_date, group_by, fmt)
+    print(f"\nExporting report to {output_path}...")
+    try:
+        _write_chunks(output_path, stream_report(start_date, end_date, group_by, fmt))
+        print("Export successful.")
+        return output_path
+    except (IOError, ValueError, RuntimeError, *get_storage().errors) as e:
+        print(f"Error exporting report: {e}")
+        return None
+
+def export_entries_csv(entries, output_path):
+    """
+    Writes time entry dicts to a CSV file with every time_entries column, in table order
+    (the format of `report --export`). Returns the path written, or None if the export failed.
+    """
+    print(f"\nExporting report to {output_path}...")
+    columns = list(entries[0].keys()) if entries else []
+    def chunks():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        writer.writerows([entry[column] for column in columns] for entry in entries)
+        yield buffer.getvalue().encode("utf-8")
+    try:
+        _write_chunks(output_path, chunks())
+        print("Export successful.")
+        return output_path
+    except IOError as e:
+        print(f"Error exporting to CSV: {e}")
+        return None
+
 def generate_report(date_str, export_to_csv=False):
     """
     Generates and displays a report from the time_entries table.
     Optionally exports the report to a CSV file.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM time_entries WHERE entry_date = ? ORDER BY total_seconds DESC", (date_str,))
-    rows = cursor.fetchall()
-    
-
-    if not rows:
-        print(f"No processed time entries found for {date_str}. Run the 'process' command first.")
-        conn.close()
-        return
+    entries = get_storage().get_time_entries_by_date(date_str)
+    entries.sort(key=lambda row: row['total_seconds'], reverse=True)
 
     # Display console report
-    print(f"\n--- Time Entry Report for {date_str} ---")
-    print(f"{'ID':<5} {'Application':<20} {'Task Description':<50} {'Units':<8} {'Time':<12} {'Status':<12} {'Notes'}")
-    print("-" * 128)
-    for row in rows:
+    header_printed = False
+    for row in entries:
+        if not header_printed:
+            print(f"\n--- Time Entry Report for {date_str} ---")
+            print(f"{'ID':<5} {'Application':<20} {'Task Description':<50} {'Units':<8} {'Time':<12} {'Status':<12} {'Notes'}")
+            print("-" * 128)
+            header_printed = True
         time_formatted = format_seconds_to_hhmmss(row['total_seconds'])
         units_formatted = format_time_units(row['time_units'] if 'time_units' in row.keys() else None)
         app = (row['application'] or '')[:20]
@@ -45,19 +248,34 @@ def generate_report(date_str, export_to_csv=False):
         notes = row['notes'] or ''
         print(f"{row['entry_id']:<5} {app:<20} {task:<50} {units_formatted:<8} {time_formatted:<12} {status:<12} {notes}")
 
-    # Export to CSV if requested
+    if not header_printed:
+        print(f"No processed time entries found for {date_str}. Run the 'process' command first.")
+        return
+
+    # Export to CSV if requested (all columns, unlike the streamed reports' REPORT_COLUMNS)
     if export_to_csv:
-        csv_filename = f"report-{date_str}.csv"
-        print(f"\nExporting report to {csv_filename}...")
-        try:
-            with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                # Write header
-                writer.writerow([h[0] for h in cursor.description])
-                # Write data rows
-                writer.writerows(rows)
-            print("Export successful.")
-        except IOError as e:
-            print(f"Error exporting to CSV: {e}")
-    
-    conn.close() 
\ No newline at end of file
+        export_entries_csv(entries, f"report-{date_str}.csv")
+
+def print_entry_sources(entry_id):
+    """Prints the raw activity rows a time entry was aggregated from (its lineage)."""
+    entry = get_storage().get_entry_sources(entry_id)
+    if not entry:
+        print(f"Error: No time entry found with ID {entry_id}.")
+        return
+
+    print(f"\n--- Sources of Time Entry {entry_id} ---")
+    print(f"{entry['entry_date']}  {entry['application']}  {entry['task_description']}")
+    print(f"Total: {format_seconds_to_hhmmss(entry['total_seconds'])}  (rules {entry['rule_version'] or 'unknown'})")
+    print(f"{'Date':<12} {'Application':<20} {'Document':<70} {'Time':<10}")
+    print("-" * 115)
+    for source in entry['sources']:
+        document = source['document']
+        if source.get('compacted_documents'):
+            count = source['compacted_documents']
+            document = f"({count} document{'s' if count != 1 else ''}, compacted)"
+        print(f"{source['log_date']:<12} {source['activity'][:20]:<20} {document[:70]:<70} "
+              f"{format_seconds_to_hhmmss(source['time_spent_seconds']):<10}")
+    if not entry['sources']:
+        print("No lineage recorded; this entry predates lineage tracking. Run 'reprocess --date' for its date.")
+    elif entry['sources_total_seconds'] != entry['total_seconds']:
+        print(f"Warning: sources add up to {format_seconds_to_hhmmss(entry['sources_total_seconds'])}.")
@@ -0,0 +1,139 @@
+"""
+Retention of raw activity_log rows.
+
+Once processed, a day's raw rows are only needed to process that day again (after a rule
+change, or an entry deleted by mistake), and RescueTime keeps them for refetching anyway.
+Kept forever they grow the database, and with it every backup, replica and index scan; so
+do their document titles in the time entries' lineage (entry_sources).
+
+compact() applies the retention policy: every day older than RETENTION_DAYS with no rows
+waiting to be processed is folded into activity_log_compacted (seconds and row counts per
+activity, category and productivity; see database.compact_activity_dates), and its lineage
+rows into entry_sources_compacted (seconds and document counts per time entry, activity and
+productivity), optionally after copying both kinds of rows to an archive SQLite file. Each
+chunk of COMPACT_CHUNK_DAYS days is one transaction, with a pause between chunks, so the API
+and the jobs get the write lock in between. Days with unprocessed rows (other than those
+the rules filtered out) are left alone, and so is everything inside the retention window,
+which can be reprocessed as before. Time entries and the analytics rollups keep their
+totals, and every entry's sources still add up to its time.
+
+Deleted rows leave free pages in the file. compact() then returns them to the file system
+with incremental vacuum, VACUUM_CHUNK_PAGES pages per write. That needs
+auto_vacuum=INCREMENTAL, which new databases get; an older database is converted once with
+a full VACUUM (enable_incremental_vacuum), which rewrites the file and blocks writers while
+it runs. Run compaction with `python main.py compact`.
+"""
+import os
+import time
+from datetime import date, timedelta
+
+import database
+from instrumentation import get_logger, stage
+from storage import get_storage
+
+logger = get_logger(__name__)
+
+# Processed raw rows older than this many days are compacted
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "365"))
+COMPACT_CHUNK_DAYS = int(os.getenv("COMPACT_CHUNK_DAYS", "7"))
+# Pause between chunks (compaction and vacuum), so compaction never takes the write lock back to back
+COMPACT_PAUSE_SECONDS = float(os.getenv("COMPACT_PAUSE_SECONDS", "0.05"))
+VACUUM_CHUNK_PAGES = int(os.getenv("VACUUM_CHUNK_PAGES", "2000"))
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+def cutoff_date(older_than_days=None, today=None):
+    """The first day kept raw: days before it are compacted."""
+    days = RETENTION_DAYS if older_than_days is None else older_than_days
+    if days < 1:
+        raise ValueError("The retention window must be at least one day")
+    return ((today or date.today()) - timedelta(days=days)).isoformat()
+
+def vacuum(pause=None, convert=False):
+    """
+    Returns the database's free pages to the file system, in writes of VACUUM_CHUNK_PAGES pages.
+    A database without auto_vacuum=INCREMENTAL is converted first if convert is set (a full
+    VACUUM) and otherwise left as it is. Returns the bytes released.
+    """
+    pause = COMPACT_PAUSE_SECONDS if pause is None else pause
+    mode, free_pages, page_size = database.get_vacuum_state()
+    if mode != AUTO_VACUUM_INCREMENTAL:
+        if not convert:
+            logger.warning("auto_vacuum is not INCREMENTAL; %d free pages stay in the file.", free_pages)
+            return 0
+        size = os.path.getsize(database.current_db_file())
+        with stage("vacuum_convert"):
+            database.enable_incremental_vacuum()
+        logger.info("Converted the database to auto_vacuum=INCREMENTAL.")
+        return size - os.path.getsize(database.current_db_file())
+
+    released = 0
+    with stage("vacuum", items=free_pages):
+        while free_pages:
+            left = database.incremental_vacuum(VACUUM_CHUNK_PAGES)
+            released += (free_pages - left) * page_size
+            if left >= free_pages:
+                break
+            free_pages = left
+            if free_pages and pause:
+                time.sleep(pause)
+    return released
+
+def compact(older_than_days=None, archive=None, dry_run=False, vacuum_after=True, convert=False, pause=None):
+    """
+    Compacts the processed raw rows of days before the retention window (see above), copying
+    them to the archive SQLite file first if one is given, then vacuums. With dry_run only
+    counts what would be compacted. Returns a summary dict.
+    """
+    if get_storage().name != "sqlite":
+        raise RuntimeError("Compaction applies to SQLite databases; use STORAGE_BACKEND=sqlite.")
+    pause = COMPACT_PAUSE_SECONDS if pause is None else pause
+    cutoff = cutoff_date(older_than_days)
+    dates, pending = database.get_compaction_candidates(cutoff)
+    summary = {
+        "cutoff_date": cutoff,
+        "dates": len(dates),
+        "first_date": dates[0] if dates else None,
+        "last_date": dates[-1] if dates else None,
+        "skipped_pending_dates": len(pending),
+        "rows_archived": 0,
+        "sources_archived": 0,
+        "rows_removed": 0,
+        "summary_rows": 0,
+        "sources_folded": 0,
+        "bytes_released": 0,
+    }
+    if pending:
+        logger.warning("%d day(s) before %s have unprocessed rows and are kept raw (first: %s).",
+                       len(pending), cutoff, pending[0])
+    if dry_run:
+        summary["rows_removed"], summary["sources_folded"] = database.count_compactable_rows(dates)
+        return summary
+
+    started = time.perf_counter()
+    compacted = []
+    with stage("compact", items=len(dates)):
+        for start in range(0, len(dates), COMPACT_CHUNK_DAYS):
+            chunk = dates[start:start + COMPACT_CHUNK_DAYS]
+            if archive:
+                rows, sources = database.archive_activity_rows(archive, chunk)
+                summary["rows_archived"] += rows
+                summary["sources_archived"] += sources
+            done, removed, summaries, folded = database.compact_activity_dates(chunk)
+            compacted.extend(done)
+            summary["rows_removed"] += removed
+            summary["summary_rows"] += summaries
+            summary["sources_folded"] += folded
+            logger.info("Compacted %d of %d days (%d raw rows removed)...", len(compacted), len(dates), summary["rows_removed"])
+            if pause and start + COMPACT_CHUNK_DAYS < len(dates):
+                time.sleep(pause)
+    # Days that gained pending rows since they were listed are skipped by compact_activity_dates
+    summary.update(dates=len(compacted), first_date=compacted[0] if compacted else None,
+                   last_date=compacted[-1] if compacted else None)
+    if vacuum_after:
+        summary["bytes_released"] = vacuum(pause, convert)
+    summary["seconds"] = round(time.perf_counter() - started, 2)
+    logger.info("Compaction done: %d days, %d raw rows -> %d summary rows, %d lineage rows folded, %d bytes released in %.1fs.",
+                len(compacted), summary["rows_removed"], summary["summary_rows"], summary["sources_folded"],
+                summary["bytes_released"], summary["seconds"])
+    return summary
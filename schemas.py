@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Union
+from typing import List, Optional, Union
 from datetime import date
 
 class TimeEntryBase(BaseModel):
@@ -31,6 +31,8 @@ class FetchJobRequest(BaseModel):
     """
     days: int = Field(default=4, ge=1, le=30, description="Number of past days to fetch data for (e.g., 4 for selected date plus 3 days before).")
     target_date: Optional[str] = Field(default=None, description="Target date in YYYY-MM-DD format. If provided, fetches data for this date and the specified number of days before it.")
+    all_users: bool = Field(default=False, description="Fetch for every registered user concurrently instead of the current one.")
+    refetch: bool = Field(default=False, description="Call the API even for past days whose final data is already stored.")
 
 class AlpTimeEntryCreate(BaseModel):
     """
@@ -46,7 +48,22 @@ class AlpTimeEntryCreate(BaseModel):
     billable_type: int
     gst_type: int
     discriminator: str = "MatterComponentTimeEntry"
-    notes: Optional[str] = None 
+    notes: Optional[str] = None
+    # Link back to the local entry; used for the idempotency key and to record the submission
+    processed_entry_id: Optional[int] = None
+    source_hash: Optional[str] = None
+
+class AlpOutboxEntry(BaseModel):
+    """
+    A time entry queued in the ALP submission outbox.
+    """
+    id: int
+    idempotency_key: str
+    processed_entry_id: Optional[int] = None
+    status: str
+    attempts: int
+    last_error: Optional[str] = None
+    alp_entry_id: Optional[str] = None
 
 class ProcessedTimeEntryCreate(BaseModel):
     """
@@ -73,4 +90,207 @@ class ProcessedTimeEntry(ProcessedTimeEntryCreate):
     alp_entry_id: Optional[str] = None
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class BulkConfirmRequest(BaseModel):
+    """
+    A batch of processed time entries to confirm in one transaction.
+    """
+    entries: List[ProcessedTimeEntryCreate]
+
+class BulkEntryIds(BaseModel):
+    """
+    A batch of entry ids to ignore or revert in one transaction.
+    """
+    entry_ids: List[int]
+
+class BulkUpdateResult(BaseModel):
+    """
+    Outcome of a bulk ignore or revert.
+    """
+    status: str
+    updated: int
+    entry_ids: List[int]
+
+class MatterIndexEntry(BaseModel):
+    """
+    Per-matter rollup of time entries maintained by the processor.
+    """
+    matter_code: str
+    first_date: date
+    last_date: date
+    total_seconds: int
+    entry_count: int
+
+class MatterEntryRef(BaseModel):
+    """
+    A single time entry contributing to a matter.
+    """
+    entry_id: int
+    entry_date: date
+    total_seconds: int
+
+class MatterSummary(MatterIndexEntry):
+    """
+    Matter rollup plus the contributing entries for a (optionally date-bounded) billing query.
+    """
+    entries: List[MatterEntryRef]
+    range_total_seconds: int
+
+class EntrySource(BaseModel):
+    """
+    A raw activity row that was aggregated into a time entry. For a compacted day (see
+    retention.py) one row per activity, with an empty document and compacted_documents set.
+    """
+    log_date: date
+    activity: str
+    document: str
+    time_spent_seconds: int
+    compacted_documents: Optional[int] = None
+
+class EntrySources(BaseModel):
+    """
+    A time entry with its lineage: the raw activity rows it was aggregated from.
+    sources_total_seconds equals total_seconds unless the entry predates lineage tracking.
+    """
+    entry_id: int
+    entry_date: date
+    application: str
+    task_description: str
+    total_seconds: int
+    source_hash: str
+    rule_version: Optional[str] = None
+    sources: List[EntrySource]
+    sources_total_seconds: int
+
+class TimeEntrySearchHit(BaseModel):
+    """
+    A time entry matching a full-text search, with a highlighted snippet.
+    Lower rank is a better match.
+    """
+    entry_id: int
+    entry_date: date
+    application: str
+    task_description: str
+    notes: Optional[str] = None
+    matter_code: Optional[str] = None
+    total_seconds: int
+    time_units: Optional[float] = None
+    status: str
+    snippet: str
+    rank: float
+
+class DocumentSearchHit(BaseModel):
+    """
+    A raw RescueTime document matching a full-text search, aggregated across the date range.
+    """
+    activity: str
+    document: Optional[str] = None
+    total_seconds: int
+    days: int
+    first_date: date
+    last_date: date
+    rank: float
+
+class SearchResults(BaseModel):
+    """
+    Results of a full-text search over time entries and raw documents.
+    """
+    query: str
+    time_entries: List[TimeEntrySearchHit]
+    documents: List[DocumentSearchHit]
+
+class Tenant(BaseModel):
+    """
+    A user of a multi-tenant deployment. The RescueTime API key itself is never returned.
+    """
+    user_id: str
+    display_name: Optional[str] = None
+    has_api_key: bool
+
+class TenantRollupRow(BaseModel):
+    """
+    Time entry totals for one user (and group, when grouped) across a date range.
+    """
+    user_id: str
+    matter_code: Optional[str] = None
+    application: Optional[str] = None
+    status: Optional[str] = None
+    entry_count: int
+    total_seconds: int
+    time_units: Optional[float] = None
+    first_date: date
+    last_date: date
+
+class AnalyticsGroup(BaseModel):
+    """
+    Time in one category, productivity level or matter over a date range.
+    """
+    key: str
+    label: str
+    total_seconds: int
+    share: float
+
+class AnalyticsSummary(BaseModel):
+    """
+    Time per category, productivity level or matter over a date range, largest first.
+    """
+    start_date: date
+    end_date: date
+    group_by: str
+    total_seconds: int
+    groups: List[AnalyticsGroup]
+
+class AnalyticsSeries(BaseModel):
+    """
+    One group's seconds per period of an analytics trend.
+    """
+    key: str
+    label: str
+    total_seconds: int
+    seconds: List[int]
+
+class AnalyticsTrend(BaseModel):
+    """
+    Time per group bucketed by day, week, month or year; periods are the buckets' first days.
+    """
+    start_date: date
+    end_date: date
+    group_by: str
+    bucket: str
+    periods: List[date]
+    total_seconds: int
+    series: List[AnalyticsSeries]
+
+class SimilarTask(BaseModel):
+    """
+    One task description of a near-duplicate cluster, with its time entries in the range.
+    """
+    task_description: str
+    applications: List[str]
+    entry_count: int
+    total_seconds: int
+    first_date: date
+    last_date: date
+    entry_ids: List[int]
+
+class SimilarTaskCluster(BaseModel):
+    """
+    Task descriptions similar enough to be one piece of work; similarity is the weakest
+    estimated Jaccard similarity linking them.
+    """
+    suggested_description: str
+    similarity: float
+    entry_count: int
+    total_seconds: int
+    members: List[SimilarTask]
+
+class SimilarTaskClusters(BaseModel):
+    """
+    Merge-candidate clusters among the time entries of a date range, largest first.
+    """
+    start_date: date
+    end_date: date
+    min_similarity: float
+    descriptions: int
+    clusters: List[SimilarTaskCluster]
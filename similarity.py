@@ -0,0 +1,192 @@
+"""
+Near-duplicate task descriptions: merge candidates among time entries whose titles differ
+only slightly (portal variants, version suffixes, "Copy of" prefixes) and so were not
+folded together by processor.get_canonical_name.
+
+Every distinct task_description gets a MinHash signature when its entries are written
+(database.upsert_time_entries stores it in task_signatures): SIGNATURE_SIZE 32-bit minimums,
+one per hash function, over the description's character trigrams. Two signatures agree in a
+position with probability equal to the Jaccard similarity of the trigram sets, so the share
+of equal positions estimates it without comparing the texts.
+
+clusters() finds similar descriptions among the entries of a date range by locality-sensitive
+hashing: a signature is cut into SIGNATURE_BANDS bands, and descriptions sharing any whole
+band are candidates, so similar pairs (Jaccard above about 0.5) almost always meet while
+unrelated ones almost never do, and no other pair is ever compared. Candidates must also
+carry the same matter numbers (titles differing only in the matter are different work);
+they are checked against min_similarity and joined into clusters.
+"""
+import hashlib
+import operator
+import re
+from array import array
+from datetime import date
+from functools import lru_cache
+
+import database
+import storage
+
+SIGNATURE_SIZE = 64
+SIGNATURE_BANDS = 16
+BAND_BYTES = SIGNATURE_SIZE // SIGNATURE_BANDS * 4
+SHINGLE_CHARS = 3
+DEFAULT_MIN_SIMILARITY = 0.6
+
+_SEPARATORS = re.compile(r"[\W_]+")
+# Matter-code-like numbers: titles that differ in them are different work however alike they are
+_MATTER_NUMBERS = re.compile(r"(?<!\d)\d{5}(?!\d)")
+
+def shingles(text):
+    """The description's character trigrams, case and punctuation ignored."""
+    text = f" {_SEPARATORS.sub(' ', text.lower()).strip()} "
+    return {text[i:i + SHINGLE_CHARS] for i in range(len(text) - SHINGLE_CHARS + 1)} or {text}
+
+@lru_cache(maxsize=16384)
+def signature(text):
+    """
+    The MinHash signature of a description, as SIGNATURE_SIZE unsigned 32-bit integers in bytes.
+    SHAKE-128 gives each trigram SIGNATURE_SIZE independent hash values at once.
+    """
+    values = [array("I", hashlib.shake_128(shingle.encode("utf-8")).digest(SIGNATURE_SIZE * 4))
+              for shingle in shingles(text)]
+    return array("I", map(min, zip(*values))).tobytes()
+
+def partition(text):
+    """The 5-digit numbers in a description; only descriptions with the same ones can be clustered."""
+    return tuple(sorted(set(_MATTER_NUMBERS.findall(text))))
+
+def signature_rows(descriptions):
+    """(task_description, signature) rows for database.task_signatures."""
+    return [(text, signature(text)) for text in set(descriptions)]
+
+class _Components:
+    """Union-find over member indexes."""
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        i, j = self.find(i), self.find(j)
+        if i != j:
+            self.parent[j] = i
+
+def _similar_pairs(signatures, partitions, min_similarity):
+    """
+    {(i, j): similarity} for the signatures that share a band and a partition and pass
+    min_similarity. Within a bucket each signature is compared with the bucket's anchors
+    (the first member and any member that matched none of them) rather than with every
+    other member, so a large bucket of near-identical titles costs linear time.
+    """
+    groups = {}
+    for i, key in enumerate(partitions):
+        groups.setdefault(key, []).append(i)
+    # Only partitions of two or more descriptions can hold a pair
+    candidates = [(i, partitions[i], signatures[i]) for members in groups.values() if len(members) > 1 for i in members]
+    values = {i: array("I", sig) for i, _, sig in candidates}
+
+    pairs, compared = {}, set()
+    for band in range(SIGNATURE_BANDS):
+        start, end = band * BAND_BYTES, (band + 1) * BAND_BYTES
+        buckets = {}
+        for i, key, sig in candidates:
+            buckets.setdefault((key, sig[start:end]), []).append(i)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            anchors = [members[0]]
+            for i in members[1:]:
+                for anchor in anchors:
+                    pair = (anchor, i)
+                    if pair in pairs:
+                        break
+                    if pair in compared:
+                        continue
+                    compared.add(pair)
+                    similarity = sum(map(operator.eq, values[anchor], values[i])) / SIGNATURE_SIZE
+                    if similarity >= min_similarity:
+                        pairs[pair] = similarity
+                        break
+                else:
+                    anchors.append(i)
+    return pairs
+
+def clusters(start_date, end_date=None, min_similarity=DEFAULT_MIN_SIMILARITY, limit=100):
+    """
+    Clusters of two or more distinct task descriptions with the same matter numbers among
+    the time entries of the range whose estimated similarity is at least min_similarity
+    (directly or through other members), largest first. Each cluster lists its members
+    (description, applications, entries, time) and suggests the description with the most
+    time as the one to merge into.
+    """
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date or start_date)
+    if end < start:
+        raise ValueError("end_date is before start_date")
+    if not 0 < min_similarity <= 1:
+        raise ValueError("min_similarity must be greater than 0 and at most 1")
+    storage.require_sqlite("Similar-task clustering")
+
+    rows = database.get_task_signature_rows(start.isoformat(), end.isoformat())
+    # Descriptions whose signature is not stored yet (a migration still backfilling) are hashed here
+    signatures = [row[-1] or signature(row[0]) for row in rows]
+    pairs = _similar_pairs(signatures, [partition(row[0]) for row in rows], min_similarity)
+
+    components = _Components(len(rows))
+    for i, j in pairs:
+        components.union(i, j)
+    members, weakest = {}, {}
+    for (i, j), similarity in pairs.items():
+        root = components.find(i)
+        members.setdefault(root, set()).update((i, j))
+        weakest[root] = min(similarity, weakest.get(root, 1.0))
+
+    found = []
+    for root, indexes in members.items():
+        group = sorted(indexes, key=lambda i: (-rows[i][2], rows[i][0]))
+        found.append((sum(rows[i][2] for i in group), rows[group[0]][0], root, group))
+    found.sort(key=lambda cluster: (-cluster[0], cluster[1]))
+    found = found[:limit]
+
+    # Applications and entry ids only for the descriptions shown
+    entries = {}
+    shown = [rows[i][0] for _, _, _, group in found for i in group]
+    for description, application, entry_id in database.get_task_entries(start.isoformat(), end.isoformat(), shown):
+        applications, entry_ids = entries.setdefault(description, (set(), []))
+        applications.add(application)
+        entry_ids.append(entry_id)
+
+    results = []
+    for total_seconds, suggested, root, group in found:
+        cluster_members = []
+        for i in group:
+            description, entry_count, seconds, first_date, last_date, _ = rows[i]
+            applications, entry_ids = entries.get(description, ((), []))
+            cluster_members.append({
+                "task_description": description,
+                "applications": sorted(applications),
+                "entry_count": entry_count,
+                "total_seconds": seconds,
+                "first_date": first_date,
+                "last_date": last_date,
+                "entry_ids": sorted(entry_ids),
+            })
+        results.append({
+            "suggested_description": suggested,
+            "similarity": round(weakest[root], 4),
+            "entry_count": sum(member["entry_count"] for member in cluster_members),
+            "total_seconds": total_seconds,
+            "members": cluster_members,
+        })
+    return {
+        "start_date": start,
+        "end_date": end,
+        "min_similarity": min_similarity,
+        "descriptions": len(rows),
+        "clusters": results,
+    }
@@ -0,0 +1,252 @@
+"""
+Pluggable storage backends.
+
+The fetch/process pipeline, reports and the API's time-entry endpoints go through
+get_storage() instead of importing SQLite helpers directly. STORAGE_BACKEND selects the
+implementation:
+
+  - "sqlite" (default): the local database in database.py.
+  - "postgres": storage_postgres.PostgresBackend, for a shared team database
+    (needs psycopg and psycopg_pool; see that module for connection settings).
+
+Features built on SQLite-specific machinery (FTS5 search, the ALP cache and outbox tables,
+the analytics rollups and the task signature index) still talk to database.py directly and
+are only available with the SQLite backend: they call require_sqlite(), and the API answers
+501 for them on any other backend.
+"""
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+
+import database
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite").lower()
+
+class StorageBackend(ABC):
+    """
+    Operations the pipeline, reports and API need from a database.
+
+    Rows returned by the get_* methods are mappings keyed by column name; report
+    queries (iter_rows) are written with ? placeholders and portable SQL.
+    Transactional methods raise ValueError, and change nothing, when an id is unknown.
+    Every method but close() is abstract, so a backend that misses one fails when it is
+    instantiated.
+    """
+    name = None
+    # Exception types a caller can catch for database failures
+    errors = ()
+
+    @abstractmethod
+    def initialize(self):
+        """Creates the schema if needed."""
+
+    # --- Raw activity ---
+    @abstractmethod
+    def upsert_activity_data(self, rows):
+        """Upserts (log_date, seconds, activity, category, productivity, document) rows, marking them unprocessed."""
+
+    @abstractmethod
+    def mark_date_for_reprocessing(self, date_str):
+        ...
+
+    @abstractmethod
+    def get_unprocessed_data(self, start_date=None, end_date=None):
+        ...
+
+    @abstractmethod
+    def get_activity_for_date(self, date_str):
+        ...
+
+    @abstractmethod
+    def mark_records_as_processed(self, record_ids):
+        """record_ids are (log_date, activity, document) tuples. Returns the number of rows updated."""
+
+    # --- Time entries ---
+    @abstractmethod
+    def upsert_time_entries(self, entries, sources=None):
+        """
+        Upserts aggregated entries and refreshes the matter index in one transaction. sources,
+        if given, are (source_hash, log_date, activity, document, seconds) lineage rows that
+        replace the recorded sources of the upserted entries.
+        """
+
+    @abstractmethod
+    def delete_pending_time_entries(self, source_hashes):
+        """Deletes pending entries with these source hashes; returns the number deleted."""
+
+    @abstractmethod
+    def get_entry_sources(self, entry_id):
+        """A time entry with the raw activity rows it was aggregated from, or None if unknown."""
+
+    @abstractmethod
+    def get_time_entries_by_date(self, date):
+        ...
+
+    @abstractmethod
+    def get_pending_time_entries(self):
+        ...
+
+    @abstractmethod
+    def get_processed_time_entries(self, date=None):
+        ...
+
+    @abstractmethod
+    def confirm_time_entries(self, entries):
+        ...
+
+    @abstractmethod
+    def set_time_entries_status(self, entry_ids, status):
+        ...
+
+    @abstractmethod
+    def update_time_entry_status(self, entry_id, status):
+        ...
+
+    @abstractmethod
+    def revert_processed_time_entries(self, processed_entry_ids):
+        ...
+
+    # --- Canonicalization rule snapshots ---
+    @abstractmethod
+    def get_distinct_documents(self):
+        ...
+
+    @abstractmethod
+    def get_canonical_names(self):
+        """{(activity, document): canonical_name} as recorded when each pair was last processed."""
+
+    @abstractmethod
+    def record_canonical_names(self, rows):
+        """Records (activity, document, canonical_name, rule_version) rows."""
+
+    @abstractmethod
+    def get_activity_dates_for_pairs(self, pairs):
+        """The (log_date, activity) combinations in which any of the (activity, document) pairs occur."""
+
+    # --- Matters and reports ---
+    @abstractmethod
+    def get_matter_index(self, matter_codes=None):
+        ...
+
+    @abstractmethod
+    def get_matter_summary(self, matter_code, start_date=None, end_date=None):
+        ...
+
+    @abstractmethod
+    def iter_rows(self, sql, params=(), chunk_rows=500):
+        """Streams the rows of a read-only query as tuples without loading them all."""
+
+    def close(self):
+        """Releases pooled connections, if any."""
+
+class SqliteBackend(StorageBackend):
+    """The local SQLite database (database.py)."""
+    name = "sqlite"
+    errors = (sqlite3.Error,)
+
+    def initialize(self):
+        database.initialize_database()
+
+    def upsert_activity_data(self, rows):
+        return database.upsert_activity_data(rows)
+
+    def mark_date_for_reprocessing(self, date_str):
+        database.mark_date_for_reprocessing(date_str)
+
+    def get_unprocessed_data(self, start_date=None, end_date=None):
+        return database.get_unprocessed_data(start_date, end_date)
+
+    def get_activity_for_date(self, date_str):
+        return database.get_activity_for_date(date_str)
+
+    def mark_records_as_processed(self, record_ids):
+        return database.mark_records_as_processed(record_ids)
+
+    def upsert_time_entries(self, entries, sources=None):
+        return database.upsert_time_entries(entries, sources)
+
+    def delete_pending_time_entries(self, source_hashes):
+        return database.delete_pending_time_entries(source_hashes)
+
+    def get_entry_sources(self, entry_id):
+        return database.get_entry_sources(entry_id)
+
+    def get_time_entries_by_date(self, date):
+        return database.get_time_entries_by_date(date)
+
+    def get_pending_time_entries(self):
+        return database.get_pending_time_entries()
+
+    def get_processed_time_entries(self, date=None):
+        return database.get_processed_time_entries(date)
+
+    def confirm_time_entries(self, entries):
+        return database.confirm_time_entries(entries)
+
+    def set_time_entries_status(self, entry_ids, status):
+        return database.set_time_entries_status(entry_ids, status)
+
+    def update_time_entry_status(self, entry_id, status):
+        return database.update_time_entry_status(entry_id, status)
+
+    def revert_processed_time_entries(self, processed_entry_ids):
+        return database.revert_processed_time_entries(processed_entry_ids)
+
+    def get_distinct_documents(self):
+        return database.get_distinct_documents()
+
+    def get_canonical_names(self):
+        return database.get_canonical_names()
+
+    def record_canonical_names(self, rows):
+        return database.record_canonical_names(rows)
+
+    def get_activity_dates_for_pairs(self, pairs):
+        return database.get_activity_dates_for_pairs(pairs)
+
+    def get_matter_index(self, matter_codes=None):
+        return database.get_matter_index(matter_codes)
+
+    def get_matter_summary(self, matter_code, start_date=None, end_date=None):
+        return database.get_matter_summary(matter_code, start_date, end_date)
+
+    def iter_rows(self, sql, params=(), chunk_rows=500):
+        return database.iter_rows(sql, params, chunk_rows)
+
+def _load_postgres_backend():
+    # psycopg is optional; it is only needed for the PostgreSQL backend.
+    try:
+        from storage_postgres import PostgresBackend
+    except ImportError as e:
+        raise RuntimeError(
+            f"STORAGE_BACKEND=postgres requires psycopg and psycopg_pool ({e}). "
+            "Install them with: pip install 'psycopg[binary]' psycopg_pool"
+        )
+    return PostgresBackend
+
+BACKENDS = {
+    "sqlite": lambda: SqliteBackend,
+    "postgres": _load_postgres_backend,
+}
+
+_storage = None
+
+def get_storage():
+    """Returns the process-wide storage backend selected by STORAGE_BACKEND."""
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND not in BACKENDS:
+            raise RuntimeError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}'. Choose from: {', '.join(BACKENDS)}")
+        _storage = BACKENDS[STORAGE_BACKEND]()()
+    return _storage
+
+def require_sqlite(feature):
+    """Raises RuntimeError unless the SQLite backend is in use; feature names what needs it."""
+    if get_storage().name != "sqlite":
+        raise RuntimeError(f"{feature} needs the SQLite backend; use STORAGE_BACKEND=sqlite.")
+
+def set_storage(backend):
+    """Replaces the process-wide backend (e.g. with one built from explicit settings); returns the old one."""
+    global _storage
+    previous, _storage = _storage, backend
+    return previous
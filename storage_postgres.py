@@ -0,0 +1,525 @@
+"""
+PostgreSQL storage backend for team deployments (STORAGE_BACKEND=postgres).
+
+Connections come from a psycopg_pool.ConnectionPool. Bulk paths avoid per-row round trips:
+raw activity is loaded with COPY into a temporary staging table and merged with one
+INSERT ... ON CONFLICT; aggregated time entries are upserted in batches of
+PG_UPSERT_BATCH_ROWS with unnest() arrays; report rows stream through server-side
+(named) cursors.
+
+Connection settings: DATABASE_URL, or DB_HOST / DB_PORT / DB_NAME / DB_USER / DB_PASSWORD
+(the same variables as database/database_postgres.py). Pool size: PG_POOL_MIN_SIZE /
+PG_POOL_MAX_SIZE.
+"""
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+import psycopg
+from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
+
+from instrumentation import get_logger, stage
+from storage import StorageBackend
+
+logger = get_logger(__name__)
+
+PG_POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", "1"))
+PG_POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", "10"))
+PG_UPSERT_BATCH_ROWS = int(os.getenv("PG_UPSERT_BATCH_ROWS", "5000"))
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS activity_log (
+        log_date DATE NOT NULL,
+        time_spent_seconds INTEGER NOT NULL,
+        activity TEXT NOT NULL,
+        category TEXT,
+        productivity INTEGER,
+        document TEXT NOT NULL DEFAULT '',
+        processed INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (log_date, activity, document)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS time_entries (
+        entry_id SERIAL PRIMARY KEY,
+        entry_date DATE NOT NULL,
+        application TEXT NOT NULL,
+        task_description TEXT NOT NULL,
+        total_seconds INTEGER NOT NULL,
+        time_units REAL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        notes TEXT,
+        matter_code TEXT,
+        source_hash TEXT NOT NULL UNIQUE,
+        rule_version TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "ALTER TABLE time_entries ADD COLUMN IF NOT EXISTS rule_version TEXT",
+    """
+    CREATE TABLE IF NOT EXISTS canonical_names (
+        activity TEXT NOT NULL,
+        document TEXT NOT NULL,
+        canonical_name TEXT,
+        rule_version TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (activity, document)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS entry_sources (
+        source_hash TEXT NOT NULL,
+        log_date DATE NOT NULL,
+        activity TEXT NOT NULL,
+        document TEXT NOT NULL,
+        time_spent_seconds INTEGER NOT NULL,
+        PRIMARY KEY (source_hash, log_date, activity, document)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS processed_time_entries (
+        id SERIAL PRIMARY KEY,
+        original_entry_id INTEGER NOT NULL REFERENCES time_entries (entry_id),
+        entry_date DATE NOT NULL,
+        application TEXT NOT NULL,
+        task_description TEXT NOT NULL,
+        time_units REAL NOT NULL,
+        matter_code TEXT,
+        status TEXT NOT NULL DEFAULT 'submitted',
+        notes TEXT,
+        source_hash TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        submitted_to_alp_at TIMESTAMP,
+        alp_entry_id TEXT,
+        UNIQUE (source_hash, entry_date)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS update_metadata (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS matter_index (
+        matter_code TEXT PRIMARY KEY,
+        first_date DATE NOT NULL,
+        last_date DATE NOT NULL,
+        total_seconds BIGINT NOT NULL,
+        entry_count INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_activity_log_processed ON activity_log(processed)",
+    "CREATE INDEX IF NOT EXISTS idx_activity_log_date ON activity_log(log_date)",
+    "CREATE INDEX IF NOT EXISTS idx_time_entries_date ON time_entries(entry_date)",
+    "CREATE INDEX IF NOT EXISTS idx_time_entries_matter_date ON time_entries(matter_code, entry_date) INCLUDE (total_seconds)",
+    "CREATE INDEX IF NOT EXISTS idx_processed_time_entries_date ON processed_time_entries(entry_date)",
+    "CREATE INDEX IF NOT EXISTS idx_processed_time_entries_matter ON processed_time_entries(matter_code)",
+]
+
+ACTIVITY_MERGE_SQL = """
+INSERT INTO activity_log (log_date, time_spent_seconds, activity, category, productivity, document, processed)
+SELECT DISTINCT ON (log_date, activity, document)
+       log_date, time_spent_seconds, activity, category, productivity, document, 0
+FROM activity_staging
+ORDER BY log_date, activity, document, seq DESC
+ON CONFLICT (log_date, activity, document) DO UPDATE SET
+    time_spent_seconds = excluded.time_spent_seconds,
+    category = excluded.category,
+    productivity = excluded.productivity,
+    processed = 0,
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+TIME_ENTRY_UPSERT_SQL = """
+INSERT INTO time_entries (entry_date, application, task_description, total_seconds, time_units, source_hash, matter_code, rule_version)
+SELECT * FROM unnest(%s::date[], %s::text[], %s::text[], %s::int[], %s::real[], %s::text[], %s::text[], %s::text[])
+ON CONFLICT (source_hash) DO UPDATE SET
+    total_seconds = excluded.total_seconds,
+    time_units = excluded.time_units,
+    task_description = excluded.task_description,
+    matter_code = excluded.matter_code,
+    rule_version = excluded.rule_version,
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+ENTRY_SOURCES_INSERT_SQL = """
+INSERT INTO entry_sources (source_hash, log_date, activity, document, time_spent_seconds)
+SELECT * FROM unnest(%s::text[], %s::date[], %s::text[], %s::text[], %s::int[])
+ON CONFLICT (source_hash, log_date, activity, document) DO UPDATE SET
+    time_spent_seconds = excluded.time_spent_seconds
+"""
+
+PROCESSED_ENTRY_UPSERT_SQL = """
+INSERT INTO processed_time_entries (
+    original_entry_id, entry_date, application, task_description, time_units,
+    matter_code, status, notes, source_hash
+) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON CONFLICT (source_hash, entry_date) DO UPDATE SET
+    original_entry_id = excluded.original_entry_id,
+    application       = excluded.application,
+    task_description  = excluded.task_description,
+    time_units        = excluded.time_units,
+    matter_code       = excluded.matter_code,
+    status            = excluded.status,
+    notes             = excluded.notes,
+    updated_at        = CURRENT_TIMESTAMP
+RETURNING *
+"""
+
+def conninfo_from_env():
+    """Builds a libpq connection string from DATABASE_URL or the DB_* variables."""
+    if os.getenv("DATABASE_URL"):
+        return os.getenv("DATABASE_URL")
+    return psycopg.conninfo.make_conninfo(
+        host=os.getenv("DB_HOST", "localhost"),
+        port=os.getenv("DB_PORT", "5432"),
+        dbname=os.getenv("DB_NAME", "rescuetime"),
+        user=os.getenv("DB_USER", "rescuetime_user"),
+        password=os.getenv("DB_PASSWORD") or None,
+    )
+
+def _to_pg_sql(sql):
+    # Report SQL is shared with SQLite and uses ? placeholders; none of it contains a literal ? or %
+    return sql.replace("?", "%s")
+
+def _to_text(value):
+    # Callers expect the plain values SQLite returns: dates as ISO strings and timestamps
+    # in CURRENT_TIMESTAMP's 'YYYY-MM-DD HH:MM:SS' form
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+def _row_to_dict(row):
+    return {key: _to_text(value) for key, value in row.items()}
+
+def _missing_ids(cursor, table, id_column, ids):
+    cursor.execute(f"SELECT {id_column} FROM {table} WHERE {id_column} = ANY(%s) FOR UPDATE", (list(ids),))
+    found = {row[id_column] for row in cursor.fetchall()}
+    return [entry_id for entry_id in ids if entry_id not in found]
+
+class PostgresBackend(StorageBackend):
+    """Shared PostgreSQL database behind a connection pool."""
+    name = "postgres"
+    errors = (psycopg.Error,)
+
+    def __init__(self, conninfo=None, min_size=PG_POOL_MIN_SIZE, max_size=PG_POOL_MAX_SIZE):
+        self.pool = ConnectionPool(
+            conninfo or conninfo_from_env(),
+            min_size=min_size,
+            max_size=max_size,
+            kwargs={"row_factory": dict_row},
+            name="rescuetime",
+            open=True,
+        )
+
+    def close(self):
+        self.pool.close()
+
+    def initialize(self):
+        with self.pool.connection() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        logger.info("PostgreSQL database initialized successfully.")
+
+    # --- Raw activity ---
+
+    def upsert_activity_data(self, rows):
+        """
+        COPYs the rows into a temporary staging table and merges them in one statement.
+        When a batch repeats a (date, activity, document) key the last row wins, as with
+        SQLite's row-by-row upsert. A NULL document is stored as '' (it is part of the key).
+        """
+        with stage("upsert", items=len(rows)), self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    CREATE TEMP TABLE activity_staging (
+                        seq BIGSERIAL,
+                        log_date DATE, time_spent_seconds INTEGER, activity TEXT,
+                        category TEXT, productivity INTEGER, document TEXT
+                    ) ON COMMIT DROP
+                """)
+                with cursor.copy(
+                    "COPY activity_staging (log_date, time_spent_seconds, activity, category, productivity, document) FROM STDIN"
+                ) as copy:
+                    for log_date, seconds, activity, category, productivity, document in rows:
+                        copy.write_row((log_date, seconds, activity, category, productivity, document or ""))
+                cursor.execute(ACTIVITY_MERGE_SQL)
+        logger.info("Successfully upserted %d activity records.", len(rows), extra={"records": len(rows)})
+        return len(rows)
+
+    def mark_date_for_reprocessing(self, date_str):
+        with self.pool.connection() as conn:
+            conn.execute("UPDATE activity_log SET processed = 0 WHERE log_date = %s", (date_str,))
+        logger.info("Marked all entries for %s for reprocessing.", date_str)
+
+    def get_unprocessed_data(self, start_date=None, end_date=None):
+        conditions, params = ["processed = 0"], []
+        if start_date:
+            conditions.append("log_date >= %s")
+            params.append(start_date)
+        if end_date:
+            conditions.append("log_date <= %s")
+            params.append(end_date)
+        return self._select(
+            f"SELECT * FROM activity_log WHERE {' AND '.join(conditions)} ORDER BY log_date, activity, document",
+            params,
+        )
+
+    def get_activity_for_date(self, date_str):
+        return self._select("SELECT * FROM activity_log WHERE log_date = %s", (date_str,))
+
+    def mark_records_as_processed(self, record_ids):
+        """Marks every key in one UPDATE joined against unnest()ed key arrays."""
+        if not record_ids:
+            return 0
+        dates, activities, documents = (list(column) for column in zip(*record_ids))
+        with stage("mark_processed", items=len(record_ids)), self.pool.connection() as conn:
+            affected = conn.execute("""
+                UPDATE activity_log AS a
+                SET processed = 1, updated_at = CURRENT_TIMESTAMP
+                FROM unnest(%s::date[], %s::text[], %s::text[]) AS k(log_date, activity, document)
+                WHERE a.log_date = k.log_date AND a.activity = k.activity AND a.document = k.document
+            """, (dates, activities, [document or "" for document in documents])).rowcount
+        logger.info("Marked %d records as processed.", affected, extra={"records": affected})
+        return affected
+
+    # --- Time entries ---
+
+    def upsert_time_entries(self, entries, sources=None):
+        with self.pool.connection() as conn:
+            with stage("upsert_entries", items=len(entries)), conn.cursor() as cursor:
+                for start in range(0, len(entries), PG_UPSERT_BATCH_ROWS):
+                    batch = entries[start:start + PG_UPSERT_BATCH_ROWS]
+                    cursor.execute(TIME_ENTRY_UPSERT_SQL, [list(column) for column in zip(*batch)])
+                self._refresh_matter_index(cursor, {entry[6] for entry in entries if entry[6]})
+            if sources is not None:
+                with stage("upsert_sources", items=len(sources)), conn.cursor() as cursor:
+                    cursor.execute("DELETE FROM entry_sources WHERE source_hash = ANY(%s)", ([entry[5] for entry in entries],))
+                    for start in range(0, len(sources), PG_UPSERT_BATCH_ROWS):
+                        batch = sources[start:start + PG_UPSERT_BATCH_ROWS]
+                        cursor.execute(ENTRY_SOURCES_INSERT_SQL, [list(column) for column in zip(*batch)])
+            with stage("commit"):
+                conn.commit()
+        return len(entries)
+
+    def delete_pending_time_entries(self, source_hashes):
+        hashes = list(set(source_hashes))
+        if not hashes:
+            return 0
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM time_entries WHERE status = 'pending' AND source_hash = ANY(%s) RETURNING matter_code",
+                (hashes,),
+            )
+            deleted = cursor.fetchall()
+            cursor.execute("""
+                DELETE FROM entry_sources s
+                WHERE s.source_hash = ANY(%s)
+                  AND NOT EXISTS (SELECT 1 FROM time_entries t WHERE t.source_hash = s.source_hash)
+            """, (hashes,))
+            self._refresh_matter_index(cursor, {row["matter_code"] for row in deleted if row["matter_code"]})
+        return len(deleted)
+
+    @staticmethod
+    def _refresh_matter_index(cursor, matter_codes):
+        if not matter_codes:
+            return
+        codes = list(matter_codes)
+        cursor.execute("DELETE FROM matter_index WHERE matter_code = ANY(%s)", (codes,))
+        cursor.execute("""
+            INSERT INTO matter_index (matter_code, first_date, last_date, total_seconds, entry_count)
+            SELECT matter_code, MIN(entry_date), MAX(entry_date), SUM(total_seconds), COUNT(*)
+            FROM time_entries
+            WHERE matter_code = ANY(%s)
+            GROUP BY matter_code
+        """, (codes,))
+
+    def _select(self, sql, params=()):
+        with self.pool.connection() as conn:
+            return [_row_to_dict(row) for row in conn.execute(sql, params).fetchall()]
+
+    def get_entry_sources(self, entry_id):
+        entries = self._select("""
+            SELECT entry_id, entry_date, application, task_description, total_seconds, source_hash, rule_version
+            FROM time_entries WHERE entry_id = %s
+        """, (entry_id,))
+        if not entries:
+            return None
+        entry = entries[0]
+        # Compaction is SQLite-only, so every source here is a raw row
+        entry["sources"] = self._select("""
+            SELECT log_date, activity, document, time_spent_seconds, NULL::integer AS compacted_documents
+            FROM entry_sources
+            WHERE source_hash = %s
+            ORDER BY time_spent_seconds DESC, document
+        """, (entry["source_hash"],))
+        entry["sources_total_seconds"] = sum(source["time_spent_seconds"] for source in entry["sources"])
+        return entry
+
+    def get_time_entries_by_date(self, date):
+        return self._select("SELECT * FROM time_entries WHERE entry_date = %s ORDER BY created_at DESC", (str(date),))
+
+    def get_pending_time_entries(self):
+        return self._select("SELECT * FROM time_entries WHERE status = 'pending' ORDER BY entry_date DESC")
+
+    def get_processed_time_entries(self, date=None):
+        if date:
+            return self._select(
+                "SELECT * FROM processed_time_entries WHERE entry_date = %s ORDER BY created_at DESC", (str(date),)
+            )
+        return self._select("SELECT * FROM processed_time_entries ORDER BY entry_date DESC, created_at DESC")
+
+    def confirm_time_entries(self, entries):
+        if not entries:
+            return []
+        params = [
+            (
+                entry["original_entry_id"], entry["entry_date"], entry["application"], entry["task_description"],
+                entry["time_units"], entry.get("matter_code"), entry.get("status", "submitted"),
+                entry.get("notes"), entry["source_hash"],
+            )
+            for entry in entries
+        ]
+        original_ids = list(dict.fromkeys(p[0] for p in params))
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            missing = _missing_ids(cursor, "time_entries", "entry_id", original_ids)
+            if missing:
+                raise ValueError(f"No time entry found with ID(s) {', '.join(map(str, missing))}")
+            cursor.executemany(PROCESSED_ENTRY_UPSERT_SQL, params, returning=True)
+            confirmed = []
+            while True:
+                confirmed.append(_row_to_dict(cursor.fetchone()))
+                if not cursor.nextset():
+                    break
+            cursor.execute(
+                "UPDATE time_entries SET status = 'submitted', updated_at = CURRENT_TIMESTAMP WHERE entry_id = ANY(%s)",
+                (original_ids,),
+            )
+        return confirmed
+
+    def set_time_entries_status(self, entry_ids, status):
+        entry_ids = list(dict.fromkeys(entry_ids))
+        if not entry_ids:
+            return 0
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            missing = _missing_ids(cursor, "time_entries", "entry_id", entry_ids)
+            if missing:
+                raise ValueError(f"No time entry found with ID(s) {', '.join(map(str, missing))}")
+            cursor.execute(
+                "UPDATE time_entries SET status = %s, updated_at = CURRENT_TIMESTAMP WHERE entry_id = ANY(%s)",
+                (status, entry_ids),
+            )
+        return len(entry_ids)
+
+    def update_time_entry_status(self, entry_id, status):
+        self.set_time_entries_status([entry_id], status)
+        return True
+
+    def revert_processed_time_entries(self, processed_entry_ids):
+        processed_entry_ids = list(dict.fromkeys(processed_entry_ids))
+        if not processed_entry_ids:
+            return []
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM processed_time_entries WHERE id = ANY(%s) RETURNING id, original_entry_id",
+                (processed_entry_ids,),
+            )
+            originals = {row["id"]: row["original_entry_id"] for row in cursor.fetchall()}
+            missing = [entry_id for entry_id in processed_entry_ids if entry_id not in originals]
+            if missing:
+                # Leaving the block with an exception rolls the delete back
+                raise ValueError(f"No processed time entry found with ID(s) {', '.join(map(str, missing))}")
+            original_ids = [original_id for original_id in dict.fromkeys(originals.values()) if original_id]
+            cursor.execute(
+                "UPDATE time_entries SET status = 'pending', updated_at = CURRENT_TIMESTAMP WHERE entry_id = ANY(%s)",
+                (original_ids,),
+            )
+        return original_ids
+
+    # --- Canonicalization rule snapshots ---
+
+    def get_distinct_documents(self):
+        with self.pool.connection() as conn:
+            rows = conn.execute("SELECT DISTINCT activity, document FROM activity_log WHERE document <> ''").fetchall()
+        return [(row["activity"], row["document"]) for row in rows]
+
+    def get_canonical_names(self):
+        with self.pool.connection() as conn:
+            rows = conn.execute("SELECT activity, document, canonical_name FROM canonical_names").fetchall()
+        return {(row["activity"], row["document"]): row["canonical_name"] for row in rows}
+
+    def record_canonical_names(self, rows):
+        if not rows:
+            return 0
+        with self.pool.connection() as conn:
+            conn.execute("""
+                INSERT INTO canonical_names (activity, document, canonical_name, rule_version)
+                SELECT * FROM unnest(%s::text[], %s::text[], %s::text[], %s::text[])
+                ON CONFLICT (activity, document) DO UPDATE SET
+                    canonical_name = excluded.canonical_name,
+                    rule_version = excluded.rule_version,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE canonical_names.canonical_name IS DISTINCT FROM excluded.canonical_name
+                   OR canonical_names.rule_version <> excluded.rule_version
+            """, [list(column) for column in zip(*rows)])
+        return len(rows)
+
+    def get_activity_dates_for_pairs(self, pairs):
+        if not pairs:
+            return set()
+        activities, documents = (list(column) for column in zip(*pairs))
+        with self.pool.connection() as conn:
+            rows = conn.execute("""
+                SELECT DISTINCT a.log_date, a.activity
+                FROM unnest(%s::text[], %s::text[]) AS c(activity, document)
+                JOIN activity_log a ON a.activity = c.activity AND a.document = c.document
+            """, (activities, documents)).fetchall()
+        return {(_to_text(row["log_date"]), row["activity"]) for row in rows}
+
+    # --- Matters and reports ---
+
+    def get_matter_index(self, matter_codes=None):
+        columns = "matter_code, first_date, last_date, total_seconds, entry_count, updated_at"
+        if matter_codes is None:
+            return self._select(f"SELECT {columns} FROM matter_index ORDER BY last_date DESC, matter_code")
+        codes = [code for code in set(matter_codes) if code]
+        if not codes:
+            return []
+        return self._select(f"SELECT {columns} FROM matter_index WHERE matter_code = ANY(%s)", (codes,))
+
+    def get_matter_summary(self, matter_code, start_date=None, end_date=None):
+        index = self.get_matter_index([matter_code])
+        if not index:
+            return None
+        summary = index[0]
+        entries = self._select("""
+            SELECT entry_id, entry_date, total_seconds
+            FROM time_entries
+            WHERE matter_code = %s AND entry_date BETWEEN %s AND %s
+            ORDER BY entry_date
+        """, (matter_code, start_date or summary["first_date"], end_date or summary["last_date"]))
+        summary["entries"] = entries
+        summary["range_total_seconds"] = sum(entry["total_seconds"] for entry in entries)
+        return summary
+
+    def iter_rows(self, sql, params=(), chunk_rows=500):
+        """Streams through a server-side cursor, fetching chunk_rows rows per round trip."""
+        with self.pool.connection() as conn:
+            with conn.cursor(name="rescuetime_stream", row_factory=psycopg.rows.tuple_row) as cursor:
+                cursor.itersize = chunk_rows
+                cursor.execute(_to_pg_sql(sql), params)
+                for row in cursor:
+                    yield tuple(_to_text(value) for value in row)
@@ -0,0 +1,144 @@
+"""
+Multi-tenant support: one server running fetch/process cycles for many users.
+
+Each user is registered in the `tenants` table of the main database (DB_FILE) with their
+own RescueTime API key, and gets their own SQLite shard at TENANTS_DIR/<user_id>.db.
+`tenant_context(user_id)` routes every database connection (and fetcher's API key) in the
+current context to that user, so the existing pipeline runs unchanged per user:
+
+    with tenants.tenant_context("jsmith"):
+        jobs.run_fetch_job(days=1)
+
+`run_for_tenants()` fans a job out across users on a thread pool (each user writes to
+their own file, so there is no lock contention between them), and `rollup()` queries
+time entries across all shards at once via ATTACH.
+
+Without a tenant context everything behaves as a single-user install. Sharding is only
+available with the SQLite storage backend.
+"""
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import database
+import reporter
+from instrumentation import get_logger
+from storage import STORAGE_BACKEND
+
+logger = get_logger(__name__)
+
+# Users whose jobs run concurrently in run_for_tenants()
+TENANT_WORKERS = int(os.getenv("TENANT_WORKERS", "8"))
+
+_USER_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+_current_tenant = ContextVar("current_tenant", default=None)
+_initialized_shards = set()
+_init_lock = threading.Lock()
+
+def tenants_dir():
+    """Shards live next to the main database unless TENANTS_DIR says otherwise."""
+    return os.getenv("TENANTS_DIR") or os.path.join(os.path.dirname(os.path.abspath(database.DB_FILE)), "tenants")
+
+def shard_path(user_id):
+    return os.path.join(tenants_dir(), f"{user_id}.db")
+
+def validate_user_id(user_id):
+    """User ids become file names, so only letters, digits, '.', '_' and '-' are allowed."""
+    if not user_id or not _USER_ID_PATTERN.match(user_id) or user_id.startswith("."):
+        raise ValueError(f"Invalid user id '{user_id}': use letters, digits, '.', '_' or '-' (max 64).")
+    return user_id
+
+def current_tenant():
+    """The user the current context runs as (a tenants row as a dict), or None."""
+    return _current_tenant.get()
+
+def _ensure_shard(user_id):
+    # Create (or migrate) each shard's schema once per process
+    path = shard_path(user_id)
+    with _init_lock:
+        if path in _initialized_shards:
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        token = database._db_file_override.set(path)
+        try:
+            database.initialize_database()
+        finally:
+            database._db_file_override.reset(token)
+        _initialized_shards.add(path)
+    return path
+
+@contextmanager
+def tenant_context(user_id):
+    """
+    Runs the enclosed block as user_id: database connections go to their shard and
+    RescueTime requests use their API key. Raises LookupError for an unknown user.
+    """
+    if STORAGE_BACKEND != "sqlite":
+        raise RuntimeError("Per-user shards require STORAGE_BACKEND=sqlite.")
+    tenant = database.get_tenant(user_id)
+    if tenant is None:
+        raise LookupError(f"Unknown user '{user_id}'. Register it with: python main.py add-user {user_id}")
+    path = _ensure_shard(user_id)
+    tenant_token = _current_tenant.set(tenant)
+    db_token = database._db_file_override.set(path)
+    try:
+        yield tenant
+    finally:
+        database._db_file_override.reset(db_token)
+        _current_tenant.reset(tenant_token)
+
+def add_tenant(user_id, display_name=None, rescuetime_api_key=None):
+    """Registers (or updates) a user and creates their shard. Returns the tenant row."""
+    validate_user_id(user_id)
+    database.upsert_tenant(user_id, display_name, rescuetime_api_key)
+    _ensure_shard(user_id)
+    return database.get_tenant(user_id)
+
+def tenant_ids():
+    return [tenant["user_id"] for tenant in database.list_tenants()]
+
+def run_for_tenants(fn, *args, user_ids=None, max_workers=None, **kwargs):
+    """
+    Calls fn(*args, **kwargs) once per user (every registered user by default), each inside
+    that user's tenant_context, on a pool of up to max_workers (TENANT_WORKERS) threads.
+    One user's failure does not stop the others. Returns {user_id: result or exception}.
+    """
+    user_ids = list(user_ids) if user_ids is not None else tenant_ids()
+    if not user_ids:
+        logger.info("No users registered; nothing to run.")
+        return {}
+
+    def run_one(user_id):
+        with tenant_context(user_id):
+            return fn(*args, **kwargs)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers or TENANT_WORKERS, thread_name_prefix="tenant") as pool:
+        futures = {user_id: pool.submit(run_one, user_id) for user_id in user_ids}
+        for user_id, future in futures.items():
+            try:
+                results[user_id] = future.result()
+            except Exception as e:
+                logger.error("Job %s failed for user %s: %s", getattr(fn, "__name__", fn), user_id, e,
+                             extra={"user_id": user_id})
+                results[user_id] = e
+    failed = sum(isinstance(result, Exception) for result in results.values())
+    logger.info("Ran %s for %d user(s), %d failed.", getattr(fn, "__name__", fn), len(results), failed)
+    return results
+
+def rollup(start_date, end_date=None, group_by=None, user_ids=None):
+    """
+    Time entry totals per user (and per group_by column: matter_code, application, status)
+    across every user's shard for an inclusive date range.
+    """
+    end_date = end_date or start_date
+    if end_date < start_date:
+        raise ValueError(f"end_date {end_date} is before start_date {start_date}")
+    group_by = reporter.parse_group_by(group_by)
+    user_ids = list(user_ids) if user_ids is not None else tenant_ids()
+    shards = {user_id: shard_path(user_id) for user_id in user_ids
+              if os.path.exists(database.live_db_file(shard_path(user_id)))}
+    return database.rollup_time_entries(shards, start_date, end_date, group_by)
@@ -0,0 +1,213 @@
+"""
+Single-writer service for the SQLite databases.
+
+In the API process, writes come from request handlers on the threadpool, from background
+jobs and from the ALP outbox worker at the same time. Each used to open its own connection,
+wait for SQLite's write lock (up to the 10 s busy timeout) and commit (fsync) on its own.
+With the writer running, database.py hands every mutation to one dedicated thread that
+owns the write connections:
+
+    future = writer.submit(db_file, fn, *args)    # fn(cursor, *args) -> result
+    result = future.result()                      # or writer.execute(db_file, fn, *args)
+
+The thread drains the queue into groups of up to WRITER_BATCH_MAX_MUTATIONS, waiting at most
+WRITER_BATCH_WINDOW_MS after the first mutation for more to arrive, and applies each group
+in one transaction per database file with a single commit. Every mutation runs inside its
+own SAVEPOINT, so one that raises (e.g. ValueError for an unknown id) is rolled back alone
+and its future gets the exception, while the rest of the group still commits. Futures are
+resolved only after the commit, so a caller never sees a write that could still be lost.
+
+When the writer is not running (CLI commands, scripts) submit() runs the mutation inline
+in its own transaction, exactly as before.
+"""
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+
+import database
+from instrumentation import counter, get_logger, histogram, stage
+
+logger = get_logger(__name__)
+
+WRITER_BATCH_MAX_MUTATIONS = int(os.getenv("WRITER_BATCH_MAX_MUTATIONS", "256"))
+WRITER_BATCH_WINDOW_MS = float(os.getenv("WRITER_BATCH_WINDOW_MS", "2"))
+
+WRITER_MUTATIONS = counter("rescuetime_writer_mutations_total", "Mutations applied by the writer thread by result.", ("result",))
+WRITER_GROUP_SIZE = histogram(
+    "rescuetime_writer_group_size", "Mutations per group commit.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+
+_STOP = object()
+
+class _Mutation:
+    __slots__ = ("db_file", "fn", "args", "kwargs", "future")
+
+    def __init__(self, db_file, fn, args, kwargs):
+        self.db_file = db_file
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+def _connect(db_file):
+    conn = database.get_db_connection(db_file=db_file)
+    # Transactions are managed explicitly (BEGIN IMMEDIATE ... COMMIT)
+    conn.isolation_level = None
+    return conn
+
+def run_inline(db_file, fn, *args, **kwargs):
+    """Runs fn(cursor, *args, **kwargs) in a transaction of its own on a fresh connection."""
+    conn = _connect(db_file)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(cursor, *args, **kwargs)
+            with stage("commit"):
+                cursor.execute("COMMIT")
+        except BaseException:
+            conn.rollback()
+            raise
+        return result
+    finally:
+        conn.close()
+
+class WriterThread(threading.Thread):
+    """Owns one write connection per database file and group-commits queued mutations."""
+
+    def __init__(self, batch_max=WRITER_BATCH_MAX_MUTATIONS, window_ms=WRITER_BATCH_WINDOW_MS):
+        super().__init__(name="db-writer", daemon=True)
+        self.batch_max = batch_max
+        self.window = window_ms / 1000
+        self.queue = queue.SimpleQueue()
+        self._connections = {}
+
+    def stop(self, timeout=30):
+        """Applies everything already queued, then stops."""
+        self.queue.put(_STOP)
+        self.join(timeout)
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            first = self.queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.batch_max:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            by_file = defaultdict(list)
+            for mutation in batch:
+                by_file[mutation.db_file].append(mutation)
+            for db_file, mutations in by_file.items():
+                self._apply(db_file, mutations)
+        for conn in self._connections.values():
+            conn.close()
+        self._connections.clear()
+
+    def _connection(self, db_file):
+        conn = self._connections.get(db_file)
+        if conn is None:
+            conn = self._connections[db_file] = _connect(db_file)
+        return conn
+
+    def _apply(self, db_file, mutations):
+        mutations = [m for m in mutations if m.future.set_running_or_notify_cancel()]
+        if not mutations:
+            return
+        applied = []
+        try:
+            conn = self._connection(db_file)
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                for mutation in mutations:
+                    cursor.execute("SAVEPOINT mutation")
+                    try:
+                        result = mutation.fn(cursor, *mutation.args, **mutation.kwargs)
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO mutation")
+                        cursor.execute("RELEASE mutation")
+                        WRITER_MUTATIONS.inc(result="failed")
+                        mutation.future.set_exception(e)
+                        continue
+                    cursor.execute("RELEASE mutation")
+                    applied.append((mutation, result))
+                with stage("group_commit", items=len(applied)):
+                    cursor.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+        except Exception as e:
+            # The transaction itself failed (disk full, I/O error, ...): nothing was written
+            logger.error("Writer: group commit of %d mutation(s) to %s failed: %s", len(mutations), db_file, e)
+            self._connections.pop(db_file, None)
+            for mutation in mutations:
+                if not mutation.future.done():
+                    WRITER_MUTATIONS.inc(result="failed")
+                    mutation.future.set_exception(e)
+            return
+        WRITER_GROUP_SIZE.observe(len(mutations))
+        WRITER_MUTATIONS.inc(len(applied), result="committed")
+        for mutation, result in applied:
+            mutation.future.set_result(result)
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def running():
+    return _writer is not None and _writer.is_alive()
+
+def submit(db_file, fn, *args, **kwargs):
+    """
+    Queues fn(cursor, *args, **kwargs) as one mutation of db_file and returns a Future for its
+    result, resolved once it is committed. Without a running writer it runs inline first.
+    """
+    writer = _writer
+    if writer is None or not writer.is_alive():
+        future = Future()
+        try:
+            future.set_result(run_inline(db_file, fn, *args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    if threading.current_thread() is writer:
+        raise RuntimeError("A mutation cannot queue another mutation (it would wait for itself).")
+    mutation = _Mutation(db_file, fn, args, kwargs)
+    writer.queue.put(mutation)
+    return mutation.future
+
+def execute(db_file, fn, *args, **kwargs):
+    """submit() and wait for the result (re-raising the mutation's exception)."""
+    return submit(db_file, fn, *args, **kwargs).result()
+
+def start():
+    """Starts the writer thread (once per process)."""
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = WriterThread()
+            _writer.start()
+        return _writer
+
+def stop():
+    """Applies the queued mutations and stops the writer; later writes run inline again."""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.stop()
+            _writer = None